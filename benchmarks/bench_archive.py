@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import tarfile
+import zipfile
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from corpus import load_or_make_corpus
+
+# Inputs compared: the folder is what the scripts needed before, extracted from the tar first
+INPUTS = ('folder', 'zip', 'tar', 'tar.gz')
+
+# crop_faces_new.py lists its inputs before processing them, which a compressed tar cannot offer
+SCRIPT_INPUTS = {
+    'crop_and_center': INPUTS,
+    'crop_faces_new': ('folder', 'zip', 'tar'),
+}
+
+def peak_rss():
+    # VmHWM starts afresh at exec, unlike ru_maxrss, which keeps the launching process's peak
+    with open('/proc/self/status') as f:
+        return int(next(line for line in f if line.startswith('VmHWM:')).split()[1]) / 1024
+
+def serve(argv):
+    # Child process: one script over one input, stdout silenced, then its wall time and peak RSS as JSON
+    script, fake_faces, inference_ms = argv[0], int(argv[1]), float(argv[2])
+    if script == 'crop_faces_new':
+        import crop_faces_new as module
+        from fake_detector import FakeFaceDetector
+        from imagekit import detection
+        detection.create_face_detector = lambda *_: FakeFaceDetector(fake_faces, inference_ms)
+    else:
+        import crop_and_center as module
+    sys.argv = [f"{script}.py"] + argv[3:]
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    start = time.perf_counter()
+    module.main()
+    elapsed = time.perf_counter() - start
+    sys.stdout = stdout
+    print(json.dumps({'seconds': elapsed, 'rss_mib': peak_rss()}))
+
+def build_archives(sources, count, work, compressed):
+    """
+    Write `count` samples, each a corpus JPEG and a caption, as a tar, a zip
+    (stored, as JPEGs do not compress) and optionally a gzipped tar.
+
+    Returns:
+        dict: Input name -> path
+    """
+    paths = {'tar': os.path.join(work, 'images.tar'), 'zip': os.path.join(work, 'images.zip')}
+    with tarfile.open(paths['tar'], 'w') as tar, zipfile.ZipFile(paths['zip'], 'w', zipfile.ZIP_STORED) as archive:
+        for i in range(count):
+            source = sources[i % len(sources)]
+            name = f"{i:06d}"
+            tar.add(source, f"{name}.jpg")
+            archive.write(source, f"{name}.jpg")
+            caption = f"sample {i}".encode()
+            info = tarfile.TarInfo(f"{name}.txt")
+            info.size = len(caption)
+            tar.addfile(info, fileobj=io.BytesIO(caption))
+            archive.writestr(f"{name}.txt", caption)
+    if compressed:
+        paths['tar.gz'] = os.path.join(work, 'images.tar.gz')
+        import gzip
+        with open(paths['tar'], 'rb') as f, gzip.open(paths['tar.gz'], 'wb', compresslevel=1) as out:
+            shutil.copyfileobj(f, out, 1 << 20)
+    return paths
+
+def run(script, input_path, output, args):
+    command = [sys.executable, os.path.abspath(__file__), '--serve', script, str(args.fake_faces), str(args.inference_ms),
+               '--input_dir', input_path, '--shards', output, '--shard_size', str(args.shard_size)]
+    if script == 'crop_faces_new':
+        command += ['--no_cache', '--proxy_size', str(args.proxy_size)]
+    result = subprocess.run(command, stdout=subprocess.PIPE, check=True, text=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        serve(sys.argv[2:])
+        return
+    parser = argparse.ArgumentParser(description='Throughput and peak RSS of crop_and_center.py and crop_faces_new.py reading a multi-GB archive in place (zip, tar, gzipped tar) against extracting it to a folder first, writing tar shards.')
+    parser.add_argument('--gb', type=float, default=2.0,
+                        help='Size of the archive in GB (default: 2)')
+    parser.add_argument('--dir', type=str, default=None,
+                        help='Where the archives and outputs are written, needing about 4x --gb free (default: a temporary directory)')
+    parser.add_argument('--scripts', type=str, nargs='+', default=list(SCRIPT_INPUTS), choices=list(SCRIPT_INPUTS),
+                        help='Scripts to run (default: crop_and_center crop_faces_new)')
+    parser.add_argument('--no_compressed', action='store_true',
+                        help='Skip the gzipped tar, which takes a while to write')
+    parser.add_argument('--shard_size', type=int, default=1000,
+                        help='Samples per output shard (default: 1000)')
+    parser.add_argument('--proxy_size', type=int, default=1024,
+                        help='crop_faces_new.py --proxy_size (default: 1024)')
+    parser.add_argument('--fake_faces', type=int, default=1,
+                        help='Faces reported by the fake detector of crop_faces_new.py (default: 1)')
+    parser.add_argument('--inference_ms', type=float, default=5,
+                        help='Simulated detector inference time (default: 5)')
+    args = parser.parse_args()
+
+    corpus_dir = os.path.join(tempfile.gettempdir(), 'imagekit-bench-corpus')
+    entries = load_or_make_corpus(corpus_dir, 1.0, 1)
+    sources = [os.path.join(corpus_dir, entry['name']) for entry in entries
+               if entry['kind'].startswith('jpeg') and min(entry['size']) >= 1500]
+    mean_bytes = sum(os.path.getsize(source) for source in sources) / len(sources)
+    count = int(args.gb * 1e9 / mean_bytes)
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as work:
+        start = time.perf_counter()
+        paths = build_archives(sources, count, work, not args.no_compressed)
+        archive_mb = os.path.getsize(paths['tar']) / 1e6
+        print(f"{count} JPEGs of {mean_bytes / 1e6:.1f} MB with captions: {archive_mb:.0f} MB tar, "
+              f"built in {time.perf_counter() - start:.0f} s")
+
+        # What the scripts needed before: the archive extracted to disk
+        folder = os.path.join(work, 'folder')
+        start = time.perf_counter()
+        with tarfile.open(paths['tar']) as tar:
+            tar.extractall(folder, filter='data')
+        extract_seconds = time.perf_counter() - start
+        paths['folder'] = folder
+        print(f"Extracting the tar: {extract_seconds:.1f} s, {archive_mb:.0f} MB more on disk")
+
+        print(f"\n{'script':<17}{'input':<8}{'seconds':>9}{'images/s':>10}{'MB/s':>7}{'peak RSS MiB':>14}")
+        for script in args.scripts:
+            for name in SCRIPT_INPUTS[script]:
+                if name not in paths:
+                    continue
+                # Fresh shards every run: crop_faces_new.py's manifest would skip every input
+                output = os.path.join(work, 'shards')
+                result = run(script, paths[name], output, args)
+                print(f"{script:<17}{name:<8}{result['seconds']:>9.1f}{count / result['seconds']:>10.1f}"
+                      f"{archive_mb / result['seconds']:>7.0f}{result['rss_mib']:>14.0f}")
+                shutil.rmtree(output, ignore_errors=True)
+        print(f"\nThe folder rows exclude the {extract_seconds:.1f} s extraction")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from PIL import Image
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from generate_descriptions import encode_image_to_base64
+
+def make_sources(folder):
+    """
+    Write a 4000x3000 photo-like source as JPEG and, when supported, HEIC.
+    """
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:3000, 0:4000]
+    base = ((x // 4 + y // 3) % 256).astype(np.uint8)
+    pixels = np.stack([base, base[::-1], base[:, ::-1]], axis=-1) + rng.integers(0, 12, (3000, 4000, 3), dtype=np.uint8)
+    image = Image.fromarray(pixels)
+    paths = [os.path.join(folder, 'source.jpg')]
+    image.save(paths[0], quality=92)
+    try:
+        image.save(os.path.join(folder, 'source.heic'), quality=90)
+        paths.append(os.path.join(folder, 'source.heic'))
+    except (KeyError, OSError, ValueError):
+        print("HEIC encoding unavailable, benchmarking JPEG only")
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark payload bytes and encode time of encode_image_to_base64.')
+    parser.add_argument('--max_sides', type=int, nargs='+', default=[0, 2048, 1024, 512],
+                        help='Maximum sides to compare; 0 is the original size (default: 0 2048 1024 512)')
+    parser.add_argument('--qualities', type=int, nargs='+', default=[95, 85, 70],
+                        help='JPEG qualities to compare (default: 95 85 70)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per setting (default: 3)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'source':>8} {'max_side':>8} {'quality':>7} {'payload KiB':>12} {'encode ms':>10}")
+        for path in make_sources(tmp):
+            for max_side in args.max_sides:
+                for quality in args.qualities:
+                    start = time.perf_counter()
+                    for _ in range(args.repeat):
+                        payload = encode_image_to_base64(path, max_side, quality)
+                    elapsed = (time.perf_counter() - start) / args.repeat * 1000
+                    label = os.path.splitext(path)[1][1:]
+                    print(f"{label:>8} {max_side or 'full':>8} {quality:>7} {len(payload) / 1024:>12.0f} {elapsed:>10.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from PIL import Image
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from generate_descriptions import CaptionClient, caption_images
+from stub_openai import StubChatCompletions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the captioning client against a local stub server.')
+    parser.add_argument('--images', type=int, default=64,
+                        help='Number of synthetic images (default: 64)')
+    parser.add_argument('--latency', type=float, default=0.2,
+                        help='Stub server latency per request in seconds (default: 0.2)')
+    parser.add_argument('--rate_limit_ratio', type=float, default=0.1,
+                        help='Fraction of requests answered with 429 (default: 0.1)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8, 16],
+                        help='Concurrency settings to compare (default: 1 4 8 16)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        image_paths = []
+        for i in range(args.images):
+            path = os.path.join(tmp, f"{i + 1:03d}.jpg")
+            Image.fromarray(rng.integers(0, 256, (512, 512, 3), dtype=np.uint8)).save(path, quality=95)
+            image_paths.append(path)
+
+        print(f"{'concurrency':>11} {'seconds':>8} {'images/s':>9} {'requests':>9} {'429s':>5} {'connections':>12} {'errors':>7}")
+        for concurrency in args.concurrency:
+            with StubChatCompletions(args.latency, args.rate_limit_ratio) as stub:
+                client = CaptionClient('stub-key', stub.url, concurrency=concurrency, backoff=0.05)
+                start = time.perf_counter()
+                results = list(caption_images(image_paths, client, concurrency))
+                elapsed = time.perf_counter() - start
+                client.close()
+            errors = sum(description is None for _, description in results)
+            print(f"{concurrency:>11} {elapsed:>8.2f} {len(results) / elapsed:>9.1f} {stub.requests:>9} "
+                  f"{stub.rate_limited:>5} {stub.connections:>12} {errors:>7}")
+
+if __name__ == '__main__':
+    main()
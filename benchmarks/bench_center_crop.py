@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from PIL import Image
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crop_and_center import center_crop_image, load_center_crop
+from detect_faces import detect_faces
+from imagekit.io import decode_image
+from imagekit.quality import psnr, ssim
+from fake_detector import FakeFaceDetector
+
+def make_corpus(folder, count, width, height):
+    """
+    Write photo-like JPEGs: smooth gradients plus fine stripes and mild noise, so
+    that downscaling has real detail to preserve or alias.
+    """
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    paths = []
+    for i in range(count):
+        period = 9 + 4 * i
+        stripes = 40 * np.sin(2 * np.pi * (x * np.cos(i) + y * np.sin(i)) / period)
+        base = 128 + 60 * np.sin(x / (700 + 90 * i)) * np.cos(y / (500 + 70 * i)) + stripes
+        pixels = np.stack([base, base * 0.8 + 30, 255 - base], axis=-1) + rng.normal(0, 6, (height, width, 3))
+        path = os.path.join(folder, f"{i:03d}.jpg")
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+def time_mode(function, paths, repeat):
+    outputs = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        outputs = [function(path) for path in paths]
+    return (time.perf_counter() - start) / (repeat * len(paths)), outputs
+
+def compare(references, outputs):
+    """
+    PSNR (dB) and SSIM of every output against the matching reference image.
+    """
+    pairs = [(reference, output) for reference_list, output_list in zip(references, outputs)
+             for reference, output in zip(reference_list, output_list)]
+    psnrs = [psnr(np.asarray(reference), np.asarray(output)) for reference, output in pairs]
+    ssims = [ssim(reference, output) for reference, output in pairs]
+    return min(psnrs), float(np.mean(psnrs)), min(ssims), float(np.mean(ssims))
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput and quality (PSNR/SSIM against the exact LANCZOS output) of the fast resize mode.')
+    parser.add_argument('--images', type=int, default=4,
+                        help='Number of synthetic images (default: 4)')
+    parser.add_argument('--width', type=int, default=6000,
+                        help='Width of the synthetic images (default: 6000)')
+    parser.add_argument('--height', type=int, default=4000,
+                        help='Height of the synthetic images (default: 4000)')
+    parser.add_argument('--size', type=int, default=512,
+                        help='Output side (default: 512)')
+    parser.add_argument('--repeat', type=int, default=2,
+                        help='Runs per mode (default: 2)')
+    args = parser.parse_args()
+
+    size = args.size
+    detector = FakeFaceDetector(4, 0)
+    modes = [
+        # (name, function returning a list of output images, reference mode name)
+        ('center exact', lambda path: [load_center_crop(path, size, 'exact')], 'center exact'),
+        ('center fast, full decode', lambda path: [center_crop_image(decode_image(path), size, 'fast')], 'center exact'),
+        ('center fast', lambda path: [load_center_crop(path, size, 'fast')], 'center exact'),
+        ('faces exact', lambda path: detect_faces(path, detector, size, 1024, 'exact'), 'faces exact'),
+        ('faces fast', lambda path: detect_faces(path, detector, size, 1024, 'fast'), 'faces exact'),
+    ]
+
+    with tempfile.TemporaryDirectory() as folder:
+        print(f"Generating {args.images} {args.width}x{args.height} JPEGs...")
+        paths = make_corpus(folder, args.images, args.width, args.height)
+
+        results = {}
+        print(f"{'mode':<26}{'ms/image':>10}{'images/s':>10}{'PSNR min':>10}{'PSNR mean':>11}{'SSIM min':>10}{'SSIM mean':>11}")
+        for name, function, reference in modes:
+            seconds, outputs = time_mode(function, paths, args.repeat)
+            results[name] = outputs
+            if name == reference:
+                quality = ''
+            else:
+                quality = '{:>10.2f}{:>11.2f}{:>10.4f}{:>11.4f}'.format(*compare(results[reference], outputs))
+            print(f"{name:<26}{seconds * 1000:>10.1f}{1 / seconds:>10.2f}{quality}")
+
+if __name__ == '__main__':
+    main()
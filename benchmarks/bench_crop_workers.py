@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from PIL import Image
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_detector import FakeFaceDetector
+from imagekit import detection
+from imagekit.strategies import CropOptions, create_crop_strategy
+
+def make_corpus(folder, count, resolution):
+    """
+    Write a deterministic set of noisy JPEGs to benchmark against.
+    """
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"src_{i:04d}.jpg")
+        pixels = rng.integers(0, 256, (resolution, resolution * 3 // 4, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark crop_faces_new throughput for different worker counts.')
+    parser.add_argument('--input_dir', type=str, default=None,
+                        help='Folder of real images; a synthetic corpus is generated if omitted')
+    parser.add_argument('--images', type=int, default=32,
+                        help='Number of synthetic images (default: 32)')
+    parser.add_argument('--resolution', type=int, default=3000,
+                        help='Longest side of synthetic images (default: 3000)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='Worker counts to benchmark (default: 1 2 4 8)')
+    parser.add_argument('--fake_faces', type=int, default=None,
+                        help='Replace MediaPipe with a fake detector reporting this many faces')
+    parser.add_argument('--size', type=int, default=512,
+                        help='Output crop size (default: 512)')
+    args = parser.parse_args()
+
+    if args.fake_faces is not None:
+        # Workers are forked, so they inherit the patched factory
+        detection.create_face_detector = lambda *_: FakeFaceDetector(args.fake_faces, 30.0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.input_dir:
+            input_paths = sorted(os.path.join(args.input_dir, f) for f in os.listdir(args.input_dir))
+        else:
+            input_paths = make_corpus(tmp, args.images, args.resolution)
+
+        baseline = None
+        reference = None
+        print(f"{'workers':>7} {'seconds':>8} {'images/s':>9} {'speedup':>8}")
+        for workers in args.workers:
+            start = time.perf_counter()
+            results = list(create_crop_strategy(CropOptions(args.size), workers).run(input_paths))
+            elapsed = time.perf_counter() - start
+            face_counts = [len(faces) for faces, _ in results]
+            if reference is None:
+                reference = face_counts
+            assert face_counts == reference, "worker count changed the per-image face order"
+            baseline = baseline or elapsed
+            print(f"{workers:>7} {elapsed:>8.2f} {len(input_paths) / elapsed:>9.1f} {baseline / elapsed:>7.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from PIL import Image, ImageEnhance
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dedup_images import hash_images
+from imagekit.phash import find_duplicates, popcount
+
+def make_corpus(folder, count, size=512):
+    """
+    Write `count` distinct 512x512 images plus, for each, a re-encoded PNG copy,
+    a brighter low-quality JPEG and a slightly shifted crop ("burst shot").
+
+    Returns:
+        dict: path -> id of the original it derives from
+    """
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:size + 16, 0:size + 16]
+    origin = {}
+    for i in range(count):
+        fx, fy, phase = rng.uniform(2, 12), rng.uniform(2, 12), rng.uniform(0, 6)
+        base = 128 + 60 * np.sin(x / size * fx + phase) * np.cos(y / size * fy) + 50 * np.sin((x + 2 * y) / size * (fx + fy))
+        blobs = np.zeros_like(base)
+        for _ in range(4):
+            cx, cy, r = rng.uniform(0, size, 2).tolist() + [rng.uniform(30, 120)]
+            blobs += rng.uniform(-80, 80) * np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * r * r))
+        pixels = np.clip(np.stack([base + blobs, base * 0.7 + 40, 255 - base - blobs / 2], axis=-1), 0, 255).astype(np.uint8)
+        full = Image.fromarray(pixels)
+        img = full.crop((0, 0, size, size))
+        variants = {
+            f"{i:05d}.jpg": (img, {'quality': 95}),
+            f"{i:05d}_copy.png": (img, {}),
+            f"{i:05d}_bright.jpg": (ImageEnhance.Brightness(img).enhance(1.15), {'quality': 60}),
+            f"{i:05d}_burst.jpg": (full.crop((6, 4, size + 6, size + 4)), {'quality': 90}),
+        }
+        for name, (variant, options) in variants.items():
+            path = os.path.join(folder, name)
+            variant.save(path, **options)
+            origin[path] = i
+    return origin
+
+def brute_force_duplicates(hashes, threshold):
+    """
+    Quadratic reference: compare every hash with every earlier kept hash.
+    """
+    kept = np.zeros(0, dtype=np.uint64)
+    duplicates = 0
+    for value in hashes:
+        if len(kept) and (popcount(kept ^ value) <= threshold).any():
+            duplicates += 1
+        else:
+            kept = np.append(kept, value)
+    return duplicates
+
+def main():
+    parser = argparse.ArgumentParser(description='Perceptual-hash dedup: hashing throughput, duplicate recall/precision and index scaling.')
+    parser.add_argument('--originals', type=int, default=100,
+                        help='Distinct images in the synthetic corpus, each with 3 near-duplicates (default: 100)')
+    parser.add_argument('--thresholds', type=int, nargs='+', default=[4, 6, 10],
+                        help='Hamming thresholds to evaluate (default: 4 6 10)')
+    parser.add_argument('--index_sizes', type=int, nargs='+', default=[10000, 100000],
+                        help='Numbers of random hashes for the lookup timing (default: 10000 100000)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        origin = make_corpus(folder, args.originals)
+        paths = sorted(origin)
+        print(f"{'method':<8}{'images/s':>10}{'threshold':>11}{'recall':>9}{'precision':>11}")
+        for method in ('dhash', 'phash'):
+            start = time.perf_counter()
+            hashed_paths, hashes = hash_images(paths, method, os.cpu_count())
+            rate = len(hashed_paths) / (time.perf_counter() - start)
+            for threshold in args.thresholds:
+                matches = find_duplicates(hashes, threshold)
+                # Each original has 3 true duplicates; a drop is correct if it matched the same original
+                dropped = [(hashed_paths[i], hashed_paths[m[0]]) for i, m in enumerate(matches) if m is not None]
+                correct = sum(origin[a] == origin[b] for a, b in dropped)
+                recall = correct / (3 * args.originals)
+                precision = correct / len(dropped) if dropped else 1.0
+                print(f"{method:<8}{rate:>10.0f}{threshold:>11}{recall:>9.3f}{precision:>11.3f}")
+
+    print()
+    print(f"{'hashes':>8}{'threshold':>11}{'index s':>9}{'brute force s':>15}")
+    rng = np.random.default_rng(1)
+    for count in args.index_sizes:
+        # Half random hashes, half copies with up to 4 flipped bits
+        base = rng.integers(0, 1 << 62, count // 2, dtype=np.uint64) << np.uint64(2)
+        flips = np.zeros(count // 2, dtype=np.uint64)
+        for _ in range(4):
+            flips |= np.uint64(1) << rng.integers(0, 64, count // 2).astype(np.uint64)
+        hashes = rng.permutation(np.concatenate([base, base ^ flips]))
+        for threshold in args.thresholds:
+            start = time.perf_counter()
+            found = sum(m is not None for m in find_duplicates(hashes, threshold))
+            indexed = time.perf_counter() - start
+            if count <= 20000:
+                start = time.perf_counter()
+                if brute_force_duplicates(hashes, threshold) != found:
+                    raise AssertionError("Index and brute force disagree")
+                brute = f"{time.perf_counter() - start:>15.2f}"
+            else:
+                brute = f"{'(skipped)':>15}"
+            print(f"{count:>8}{threshold:>11}{indexed:>9.2f}{brute}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from PIL import Image
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from detect_faces import detect_faces
+from fake_detector import FakeFaceDetector
+
+def legacy_pass(input_path, num_faces, inference_ms, size):
+    """
+    Reproduce the cost of the previous main(): one counting pass, then one
+    detector construction, decode and detection per face.
+    """
+    detect_faces(input_path, FakeFaceDetector(num_faces, inference_ms), size)
+    for _ in range(num_faces):
+        detect_faces(input_path, FakeFaceDetector(num_faces, inference_ms), size)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark detect_faces cost per image as the face count grows.')
+    parser.add_argument('--faces', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                        help='Face counts to benchmark (default: 1 2 4 8 16)')
+    parser.add_argument('--resolution', type=int, default=4000,
+                        help='Side of the synthetic source image in pixels (default: 4000)')
+    parser.add_argument('--inference_ms', type=float, default=30.0,
+                        help='Simulated detector latency per call (default: 30)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per face count (default: 3)')
+    parser.add_argument('--size', type=int, default=512,
+                        help='Output crop size (default: 512)')
+    parser.add_argument('--legacy', action='store_true',
+                        help='Also time the previous N+1 decode/detect behaviour')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, 'source.jpg')
+        pixels = rng.integers(0, 256, (args.resolution, args.resolution, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(input_path, quality=95)
+
+        print(f"{'faces':>5} {'single-pass ms':>15} {'detector calls':>15}" + (f" {'legacy ms':>10}" if args.legacy else ''))
+        for num_faces in args.faces:
+            detector = FakeFaceDetector(num_faces, args.inference_ms)
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                crops = detect_faces(input_path, detector, args.size)
+            elapsed = (time.perf_counter() - start) / args.repeat * 1000
+            assert len(crops) == num_faces
+            line = f"{num_faces:>5} {elapsed:>15.1f} {detector.calls // args.repeat:>15}"
+
+            if args.legacy:
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    legacy_pass(input_path, num_faces, args.inference_ms, args.size)
+                line += f" {(time.perf_counter() - start) / args.repeat * 1000:>10.1f}"
+            print(line)
+
+if __name__ == '__main__':
+    main()
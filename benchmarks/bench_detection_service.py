@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from PIL import Image
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from imagekit import detection
+from fake_detector import FakeFaceDetector
+
+def use_fake_detector(args):
+    if args.fake_faces is not None:
+        detection.create_mediapipe_detector = lambda *_: FakeFaceDetector(args.fake_faces, args.inference_ms, args.setup_ms)
+
+def run_child(args):
+    """
+    One short CLI-like run: get a detector, detect faces in one image, exit.
+    """
+    from imagekit.io import decode_image
+    use_fake_detector(args)
+    face_detection = detection.create_face_detector()
+    results = face_detection.process(np.array(decode_image(args.input)))
+    face_detection.close()
+    print(json.dumps({'service': isinstance(face_detection, detection.ServiceFaceDetector),
+                      'faces': len(results.detections or [])}))
+
+def run_service(args):
+    import detection_service
+    use_fake_detector(args)
+    detection_service.create_detector = detection.create_mediapipe_detector
+    sys.argv = [sys.argv[0], '--socket', args.socket]
+    detection_service.main()
+
+def child_latencies(args, socket_path, count):
+    """
+    Wall time of `count` fresh processes each detecting faces in one image.
+    """
+    env = dict(os.environ, **{detection.SOCKET_ENV: socket_path})
+    command = [sys.executable, os.path.abspath(__file__), '--child', '--input', args.input,
+               '--setup_ms', str(args.setup_ms), '--inference_ms', str(args.inference_ms)]
+    if args.fake_faces is not None:
+        command += ['--fake_faces', str(args.fake_faces)]
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+        latencies.append(time.perf_counter() - start)
+    return latencies, json.loads(output.splitlines()[-1])
+
+def call_latencies(face_detection, image, count):
+    face_detection.process(image)
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        face_detection.process(image)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def summary(latencies):
+    return f"{np.median(latencies) * 1000:>9.1f}{np.percentile(latencies, 95) * 1000:>9.1f}"
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-request face detection latency with a cold in-process detector and with the warm detection service.')
+    parser.add_argument('--requests', type=int, default=10,
+                        help='Requests per setting (default: 10)')
+    parser.add_argument('--resolution', type=int, default=1024,
+                        help='Width of the synthetic test image (default: 1024)')
+    parser.add_argument('--fake_faces', type=int, default=None,
+                        help='Replace MediaPipe with a fake detector reporting this many faces')
+    parser.add_argument('--setup_ms', type=float, default=500,
+                        help='Simulated model setup time of the fake detector (default: 500)')
+    parser.add_argument('--inference_ms', type=float, default=10,
+                        help='Simulated inference time of the fake detector (default: 10)')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--input', type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--socket', type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+    if args.serve:
+        run_service(args)
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        args.input = os.path.join(folder, 'image.jpg')
+        height = args.resolution * 3 // 4
+        pixels = np.random.default_rng(0).integers(0, 256, (height, args.resolution, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(args.input, quality=90)
+        socket_path = os.path.join(folder, 'detector.sock')
+
+        print(f"{'setting':<40}{'p50 ms':>9}{'p95 ms':>9}")
+        cold, _ = child_latencies(args, socket_path, args.requests)
+        print(f"{'new process, in-process detector':<40}{summary(cold)}")
+
+        command = [sys.executable, os.path.abspath(__file__), '--serve', '--socket', socket_path,
+                   '--setup_ms', str(args.setup_ms), '--inference_ms', str(args.inference_ms)]
+        if args.fake_faces is not None:
+            command += ['--fake_faces', str(args.fake_faces)]
+        service = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+        try:
+            # The service prints once its detector is loaded
+            service.stdout.readline()
+            warm, result = child_latencies(args, socket_path, args.requests)
+            if not result['service']:
+                raise RuntimeError("The child did not use the detection service")
+            print(f"{'new process, warm service':<40}{summary(warm)}")
+
+            # Per call inside one process: the IPC cost on top of inference
+            use_fake_detector(args)
+            image = np.asarray(Image.open(args.input).convert('RGB'))
+            local = detection.create_mediapipe_detector()
+            print(f"{'same process, in-process detector call':<40}{summary(call_latencies(local, image, args.requests))}")
+            local.close()
+            client = detection.connect_detection_service(socket_path=socket_path)
+            print(f"{'same process, service call':<40}{summary(call_latencies(client, image, args.requests))}")
+            client.close()
+        finally:
+            service.terminate()
+            service.wait()
+
+if __name__ == '__main__':
+    main()
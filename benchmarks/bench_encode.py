@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from io import BytesIO
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from corpus import load_or_make_corpus
+from crop_and_center import load_center_crop
+from imagekit.encode import OutputEncoder
+from imagekit.quality import ssim
+
+# (name, OutputEncoder options); the first is what the scripts wrote before the encoder was configurable
+CONFIGS = (
+    ('jpeg q95', {}),
+    ('jpeg q95 optimize', {'optimize': True}),
+    ('jpeg q95 opt+progressive', {'optimize': True, 'progressive': True}),
+    ('jpeg q95 4:4:4', {'subsampling': '4:4:4'}),
+    ('jpeg q85 optimize', {'quality': 85, 'optimize': True}),
+    ('jpeg ssim 0.98', {'target_ssim': 0.98}),
+    ('jpeg <= 30 KB', {'target_kb': 30}),
+    ('webp q80', {'format': 'webp', 'quality': 80}),
+    ('webp ssim 0.98', {'format': 'webp', 'target_ssim': 0.98}),
+    ('webp lossless', {'format': 'webp_lossless'}),
+    ('png', {'format': 'png'}),
+    ('png optimize', {'format': 'png', 'optimize': True}),
+)
+
+def measure(images, options):
+    """
+    Encode every image once, returning the mean bytes, encode ms and SSIM per image.
+    """
+    encoder = OutputEncoder(**options)
+    sizes = []
+    seconds = []
+    similarity = []
+    for img in images:
+        start = time.perf_counter()
+        data = encoder.encode(img)
+        seconds.append(time.perf_counter() - start)
+        sizes.append(len(data))
+        similarity.append(ssim(img, Image.open(BytesIO(data))))
+    n = len(images)
+    return sum(sizes) / n, sum(seconds) * 1000 / n, sum(similarity) / n
+
+def throughput(images, options, threads, output_dir):
+    """
+    Images per second written through OutputEncoder.submit with a thread pool.
+    """
+    encoder = OutputEncoder(threads=threads, **options)
+    start = time.perf_counter()
+    futures = [encoder.submit(img, os.path.join(output_dir, f"{i:03d}{encoder.extension}")) for i, img in enumerate(images)]
+    for future in futures:
+        future.result()
+    encoder.close()
+    return len(images) / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description='Bytes per image, encode time and SSIM of each output format and encoder setting, on 512x512 crops of the synthetic corpus.')
+    parser.add_argument('--variants', type=int, default=2,
+                        help='Images of each kind in the synthetic corpus, 13 kinds (default: 2)')
+    parser.add_argument('--scale', type=float, default=0.5,
+                        help='Scale of the corpus resolutions (default: 0.5)')
+    parser.add_argument('--size', type=int, default=512,
+                        help='Side of the crops (default: 512)')
+    parser.add_argument('--threads', type=int, nargs='+', default=[0, 1, 2, 4],
+                        help='Encoder threads to compare (default: 0 1 2 4)')
+    parser.add_argument('--thread_config', type=str, default='jpeg q95 optimize', choices=[name for name, _ in CONFIGS],
+                        help='Setting used to compare thread counts (default: jpeg q95 optimize)')
+    args = parser.parse_args()
+
+    corpus_dir = os.path.join(tempfile.gettempdir(), 'imagekit-bench-corpus')
+    entries = load_or_make_corpus(corpus_dir, args.scale, args.variants)
+    images = [load_center_crop(os.path.join(corpus_dir, entry['name']), args.size) for entry in entries]
+    print(f"{len(images)} crops of {args.size}x{args.size}")
+
+    baseline = None
+    print(f"{'setting':<26}{'KB/img':>8}{'vs q95':>8}{'encode ms':>11}{'SSIM':>8}")
+    for name, options in CONFIGS:
+        size, ms, similarity = measure(images, options)
+        baseline = baseline or size
+        print(f"{name:<26}{size / 1000:>8.1f}{size / baseline:>8.0%}{ms:>11.1f}{similarity:>8.4f}")
+
+    options = dict(CONFIGS)[args.thread_config]
+    print(f"\n{args.thread_config}, written through the encoder's thread pool ({os.cpu_count()} CPU(s))")
+    print(f"{'threads':>7}{'images/s':>10}")
+    with tempfile.TemporaryDirectory() as output_dir:
+        for threads in args.threads:
+            print(f"{threads:>7}{throughput(images, options, threads, output_dir):>10.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from corpus import load_or_make_corpus
+from fake_detector import FakeFaceDetector
+from imagekit import detection
+from imagekit.profiling import peak_rss_mib
+from imagekit.strategies import CropOptions, create_crop_strategy
+
+# create_crop_strategy arguments of each mode, given the decoder count; with zero-sized slots every frame is pickled
+MODES = {
+    'in-process': lambda decoders: {'decoders': 0},
+    'pickled': lambda decoders: {'decoders': decoders, 'frame_megapixels': 0},
+    'shared': lambda decoders: {'decoders': decoders},
+}
+
+def peak_rss():
+    # VmHWM starts afresh at exec, unlike ru_maxrss, which keeps the launching process's peak
+    with open('/proc/self/status') as f:
+        return int(next(line for line in f if line.startswith('VmHWM:')).split()[1]) / 1024
+
+def read_bytes():
+    # Bytes read through read()-like calls, files and pipes but not shared memory
+    with open('/proc/self/io') as f:
+        return int(next(line for line in f if line.startswith('rchar:')).split()[1])
+
+def run_mode(args, paths):
+    """
+    Run one mode in this process and return its measurements.
+    """
+    detection.create_face_detector = lambda *_: FakeFaceDetector(args.fake_faces, args.inference_ms)
+    # The pixels every decoder hands over, for scale
+    frame_bytes = sum(width * height * 3 for width, height in (entry['size'] for entry in args.entries))
+    # Warm-up, so lazy imports are not counted as reads
+    options = CropOptions(args.size)
+    for _ in create_crop_strategy(options, queue_size=args.queue_size, **MODES[args.mode](args.decoders)).run(paths[:1]):
+        pass
+    before = read_bytes()
+    start = time.perf_counter()
+    faces = 0
+    for crops, _ in create_crop_strategy(options, queue_size=args.queue_size,
+                                         **MODES[args.mode](args.decoders)).run(paths):
+        faces += len(crops)
+        # Sampled before the pool is joined: the reads of reaped children are added to the parent's
+        after = read_bytes()
+    elapsed = time.perf_counter() - start
+    return {
+        'seconds': elapsed,
+        'faces': faces,
+        'frame_mb': frame_bytes / len(paths) / 1e6,
+        'read_mb': (after - before) / len(paths) / 1e6,
+        'rss_mib': peak_rss(),
+        'children_rss_mib': peak_rss_mib(children=True),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Frame handoff from decoder processes to the detector: in-process decoding, a pickled Pool and the shared memory frame ring.')
+    parser.add_argument('--decoders', type=int, default=2,
+                        help='Decoder processes (default: 2)')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Scale of the corpus resolutions, up to 4000x3000 at 1.0 (default: 1.0)')
+    parser.add_argument('--variants', type=int, default=2,
+                        help='Images of each kind in the synthetic corpus, 13 kinds (default: 2)')
+    parser.add_argument('--inference_ms', type=float, default=10,
+                        help='Simulated detector inference time (default: 10)')
+    parser.add_argument('--fake_faces', type=int, default=2,
+                        help='Faces reported by the fake detector (default: 2)')
+    parser.add_argument('--queue_size', type=int, default=4,
+                        help='Frame slots (default: 4)')
+    parser.add_argument('--size', type=int, default=512,
+                        help='Output crop size (default: 512)')
+    parser.add_argument('--mode', type=str, default=None, choices=list(MODES),
+                        help='Run a single mode in this process and print its results as JSON (default: every mode, each in a fresh process)')
+    args = parser.parse_args()
+
+    corpus_dir = os.path.join(tempfile.gettempdir(), 'imagekit-bench-corpus-frames')
+    args.entries = load_or_make_corpus(corpus_dir, args.scale, args.variants)
+    paths = [os.path.join(corpus_dir, entry['name']) for entry in args.entries]
+    if args.mode:
+        print(json.dumps(run_mode(args, paths)))
+        return
+
+    print(f"{len(paths)} images, {args.decoders} decoder(s), inference {args.inference_ms:g} ms")
+    print(f"{'mode':<12}{'seconds':>8}{'images/s':>10}{'frame MB/img':>14}{'read MB/img':>13}{'RSS MiB':>9}{'decoder RSS MiB':>17}")
+    reference = None
+    for mode in MODES:
+        # A fresh process per mode, so peak RSS is that mode's alone
+        command = [sys.executable, os.path.abspath(__file__), '--mode', mode] + sys.argv[1:]
+        result = json.loads(subprocess.run(command, capture_output=True, text=True, check=True).stdout.splitlines()[-1])
+        reference = reference or result['faces']
+        assert result['faces'] == reference, "the handoff changed the number of crops"
+        decoder_rss = f"{result['children_rss_mib']:.0f}" if mode != 'in-process' else '-'
+        print(f"{mode:<12}{result['seconds']:>8.2f}{len(paths) / result['seconds']:>10.1f}{result['frame_mb']:>14.1f}"
+              f"{result['read_mb']:>13.1f}{result['rss_mib']:>9.0f}{decoder_rss:>17}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from imagekit.geometry import square_crop_boxes
+from scalar_geometry import random_boxes, scalar_boxes
+
+def main():
+    parser = argparse.ArgumentParser(description='Time imagekit.geometry.square_crop_boxes against the scalar crop code it replaced. Equivalence is tested in tests/test_geometry.py.')
+    parser.add_argument('--boxes', type=int, nargs='+', default=[1, 10, 100, 1000],
+                        help='Detections per image to time (default: 1 10 100 1000)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed (default: 0)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'boxes':>6} {'policy':>7} {'scalar ms':>10} {'vectorized ms':>14}")
+    for count in args.boxes:
+        rel_boxes = random_boxes(rng, count)
+        for policy in ('center', 'anchor'):
+            start = time.perf_counter()
+            scalar_boxes(rel_boxes, 4000, 3000, policy)
+            scalar_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            square_crop_boxes(rel_boxes, 4000, 3000, policy)
+            vectorized_ms = (time.perf_counter() - start) * 1000
+            print(f"{count:>6} {policy:>7} {scalar_ms:>10.2f} {vectorized_ms:>14.2f}")
+
+if __name__ == '__main__':
+    main()
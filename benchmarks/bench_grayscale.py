@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import to_grayscale
+
+def legacy_convert_to_grayscale(input_path, output_path):
+    """
+    The previous implementation: full RGB decode, convert, overwrite in place.
+    """
+    with Image.open(input_path) as img:
+        img.convert('L').save(output_path, quality=95)
+
+def make_corpus(folder, count, resolution):
+    """
+    Write an even mix of JPEG, PNG and HEIC photo-like images.
+    """
+    rng = np.random.default_rng(0)
+    height = resolution * 3 // 4
+    y, x = np.mgrid[0:height, 0:resolution]
+    formats = ['jpg', 'png', 'heic']
+    for i in range(count):
+        base = ((x // (i % 5 + 1) + y) % 256).astype(np.uint8)
+        pixels = np.stack([base, base[::-1], base[:, ::-1]], axis=-1) + rng.integers(0, 12, (height, resolution, 3), dtype=np.uint8)
+        ext = formats[i % len(formats)]
+        try:
+            Image.fromarray(pixels).save(os.path.join(folder, f"{i:04d}.{ext}"), quality=90)
+        except (KeyError, OSError, ValueError):
+            # HEIC encoding may be unavailable; fall back to JPEG
+            Image.fromarray(pixels).save(os.path.join(folder, f"{i:04d}.jpg"), quality=90)
+
+def run(function, folder, workers):
+    paths = sorted(os.path.join(folder, f) for f in os.listdir(folder))
+    start = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(function, paths, paths, chunksize=4))
+    else:
+        for path in paths:
+            function(path, path)
+    return time.perf_counter() - start, len(paths)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark grayscale conversion against the previous implementation.')
+    parser.add_argument('--images', type=int, default=30,
+                        help='Number of images in the mixed corpus (default: 30)')
+    parser.add_argument('--resolution', type=int, default=3000,
+                        help='Width of the images (default: 3000)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count()],
+                        help='Worker counts for the new implementation (default: 1 and the CPU count)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.join(tmp, 'corpus')
+        os.makedirs(corpus)
+        make_corpus(corpus, args.images, args.resolution)
+
+        cases = [('legacy', legacy_convert_to_grayscale, 1)]
+        cases += [('luma-draft', to_grayscale.convert_to_grayscale, workers) for workers in sorted(set(args.workers))]
+        print(f"{'implementation':>15} {'workers':>7} {'seconds':>8} {'images/s':>9}")
+        for name, function, workers in cases:
+            folder = os.path.join(tmp, 'run')
+            shutil.rmtree(folder, ignore_errors=True)
+            shutil.copytree(corpus, folder)
+            # Silence per-file progress lines
+            with open(os.devnull, 'w') as devnull:
+                stdout, sys.stdout = sys.stdout, devnull
+                try:
+                    elapsed, count = run(function, folder, workers)
+                finally:
+                    sys.stdout = stdout
+            print(f"{name:>15} {workers:>7} {elapsed:>8.2f} {count / elapsed:>9.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from PIL import Image
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from imagekit.packed import PackedDataset
+
+def make_crops(count, size):
+    """
+    Photo-like RGB crops: smooth gradients, stripes and mild noise, so the JPEGs
+    are of realistic size.
+    """
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32)
+    for i in range(count):
+        stripes = 30 * np.sin(2 * np.pi * (x * np.cos(i) + y * np.sin(i)) / (7 + i % 11))
+        base = 128 + 70 * np.sin(x / (60 + i % 40)) * np.cos(y / (45 + i % 30)) + stripes
+        pixels = np.stack([base, base * 0.8 + 30, 255 - base], axis=-1) + rng.normal(0, 5, (size, size, 3))
+        yield np.clip(pixels, 0, 255).astype(np.uint8)
+
+def write_layouts(folder, count, size):
+    """
+    Write the same crops and captions as a JPEG folder (NNN.jpg + NNN.txt, as
+    crop_faces_new.py and generate_descriptions.py do) and as a packed dataset.
+
+    Returns:
+        tuple: (jpeg_folder, packed_folder)
+    """
+    jpeg_folder = os.path.join(folder, 'jpeg')
+    packed_folder = os.path.join(folder, 'packed')
+    os.makedirs(jpeg_folder)
+    dataset = PackedDataset(packed_folder, size, writable=True)
+    for i, pixels in enumerate(make_crops(count, size)):
+        caption = f"tok, a photo of a person number {i}"
+        Image.fromarray(pixels).save(os.path.join(jpeg_folder, f"{i + 1:03d}.jpg"), quality=95)
+        with open(os.path.join(jpeg_folder, f"{i + 1:03d}.txt"), 'w') as f:
+            f.write(caption)
+        index = dataset.append(pixels, source=f"{i + 1:03d}.jpg", face=0)
+        dataset.set_caption(index, caption)
+    dataset.close()
+    return jpeg_folder, packed_folder
+
+def drop_page_cache(folder):
+    # Ask the kernel to forget the cached pages of every file, so the next read goes to disk
+    for name in os.listdir(folder):
+        fd = os.open(os.path.join(folder, name), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+def read_jpeg_batches(folder, batches, size):
+    for batch in batches:
+        images = np.empty((len(batch), size, size, 3), dtype=np.uint8)
+        captions = []
+        for row, i in enumerate(batch):
+            stem = os.path.join(folder, f"{i + 1:03d}")
+            with Image.open(stem + '.jpg') as img:
+                images[row] = np.asarray(img.convert('RGB'))
+            with open(stem + '.txt') as f:
+                captions.append(f.read())
+        yield images, captions
+
+def read_packed_batches(folder, batches, size):
+    dataset = PackedDataset(folder)
+    # One mapping for the whole pass; fancy indexing gathers a batch in a single copy
+    images = dataset.images()
+    for batch in batches:
+        # Sorted so that a random batch still reads the file front to back
+        batch = np.sort(batch)
+        yield images[batch], [dataset.captions[i] for i in batch.tolist()]
+
+def time_pass(reader, folder, batches, size, cold):
+    if cold:
+        drop_page_cache(folder)
+    start = time.perf_counter()
+    count = 0
+    for images, captions in reader(folder, batches, size):
+        count += len(images)
+    return count / (time.perf_counter() - start)
+
+def folder_bytes(folder):
+    return sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+
+def main():
+    parser = argparse.ArgumentParser(description='Read throughput of a packed memory-mapped dataset against the NNN.jpg + NNN.txt folder layout.')
+    parser.add_argument('--samples', type=int, default=2000,
+                        help='Number of crops (default: 2000)')
+    parser.add_argument('--size', type=int, default=512,
+                        help='Side of the crops (default: 512)')
+    parser.add_argument('--batch_size', type=int, default=64,
+                        help='Samples per training batch (default: 64)')
+    parser.add_argument('--dir', type=str, default=None,
+                        help='Directory to write the datasets in, e.g. on a network filesystem (default: a temporary directory)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as folder:
+        start = time.perf_counter()
+        jpeg_folder, packed_folder = write_layouts(folder, args.samples, args.size)
+        print(f"Wrote {args.samples} samples in {time.perf_counter() - start:.1f} s")
+        print(f"{'layout':<8}{'files':>8}{'MB':>9}")
+        for name, path in (('jpeg', jpeg_folder), ('packed', packed_folder)):
+            print(f"{name:<8}{len(os.listdir(path)):>8}{folder_bytes(path) / 1e6:>9.1f}")
+
+        order = np.arange(args.samples)
+        sequential = [order[i:i + args.batch_size] for i in range(0, args.samples, args.batch_size)]
+        shuffled = np.random.default_rng(1).permutation(order)
+        shuffled_batches = [shuffled[i:i + args.batch_size] for i in range(0, args.samples, args.batch_size)]
+
+        print()
+        print(f"{'access':<12}{'cache':<7}{'jpeg img/s':>12}{'packed img/s':>14}{'speedup':>9}")
+        for access, batches in (('sequential', sequential), ('random', shuffled_batches)):
+            for cold in (True, False):
+                jpeg = time_pass(read_jpeg_batches, jpeg_folder, batches, args.size, cold)
+                packed = time_pass(read_packed_batches, packed_folder, batches, args.size, cold)
+                print(f"{access:<12}{'cold' if cold else 'warm':<7}{jpeg:>12.0f}{packed:>14.0f}{packed / jpeg:>8.1f}x")
+
+if __name__ == '__main__':
+    main()
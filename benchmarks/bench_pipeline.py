@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import PIL.Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from corpus import load_or_make_corpus
+from fake_detector import FakeFaceDetector
+from imagekit import detection
+from imagekit.strategies import CropOptions, create_crop_strategy
+
+def slow_disk(read_ms, read_mbps):
+    """
+    Make every image open wait like a slow disk would: a fixed latency plus the
+    file size over a bandwidth. Sleeping releases the GIL, as blocking reads do.
+    """
+    original_open = PIL.Image.open
+
+    def delayed_open(fp, *args, **kwargs):
+        delay = read_ms / 1000
+        if read_mbps and isinstance(fp, str):
+            delay += os.path.getsize(fp) / (read_mbps * 1e6)
+        time.sleep(delay)
+        return original_open(fp, *args, **kwargs)
+
+    PIL.Image.open = delayed_open
+
+def run(paths, size, read_threads, write_threads, queue_size):
+    start = time.perf_counter()
+    strategy = create_crop_strategy(CropOptions(size), read_threads=read_threads, write_threads=write_threads,
+                                    queue_size=queue_size)
+    results = list(strategy.run(paths))
+    return time.perf_counter() - start, results
+
+def main():
+    parser = argparse.ArgumentParser(description='crop_faces_new throughput serially and with pipelined reader/writer threads on a simulated slow disk.')
+    parser.add_argument('--variants', type=int, default=4,
+                        help='Images of each kind in the synthetic corpus, 13 kinds (default: 4)')
+    parser.add_argument('--scale', type=float, default=0.5,
+                        help='Scale of the corpus resolutions (default: 0.5)')
+    parser.add_argument('--read_ms', type=float, default=20,
+                        help='Simulated latency of every image read (default: 20)')
+    parser.add_argument('--read_mbps', type=float, default=100,
+                        help='Simulated read bandwidth in MB/s; 0 for none (default: 100)')
+    parser.add_argument('--inference_ms', type=float, default=15,
+                        help='Simulated detector inference time (default: 15)')
+    parser.add_argument('--fake_faces', type=int, default=2,
+                        help='Faces reported by the fake detector (default: 2)')
+    parser.add_argument('--threads', type=str, nargs='+', default=['0:0', '1:1', '2:2', '4:2', '4:4'],
+                        help='reader:writer thread counts to compare; 0:0 is the serial loop (default: 0:0 1:1 2:2 4:2 4:4)')
+    parser.add_argument('--queue_size', type=int, default=8,
+                        help='Images held between two pipeline stages (default: 8)')
+    parser.add_argument('--size', type=int, default=512,
+                        help='Output crop size (default: 512)')
+    args = parser.parse_args()
+
+    detection.create_face_detector = lambda *_: FakeFaceDetector(args.fake_faces, args.inference_ms)
+    corpus_dir = os.path.join(tempfile.gettempdir(), 'imagekit-bench-corpus')
+    entries = load_or_make_corpus(corpus_dir, args.scale, args.variants)
+    paths = [os.path.join(corpus_dir, entry['name']) for entry in entries]
+    slow_disk(args.read_ms, args.read_mbps)
+    print(f"{len(paths)} images, reads {args.read_ms:g} ms + {args.read_mbps:g} MB/s, inference {args.inference_ms:g} ms")
+
+    # Warm-up, so the first configuration does not pay for imports and the page cache
+    run(paths[:2], args.size, 0, 0, args.queue_size)
+    baseline = None
+    reference = None
+    print(f"{'readers':>7} {'writers':>7} {'seconds':>8} {'images/s':>9} {'speedup':>8}")
+    for threads in args.threads:
+        read_threads, write_threads = (int(n) for n in threads.split(':'))
+        elapsed, results = run(paths, args.size, read_threads, write_threads, args.queue_size)
+        outputs = [[crop for _, _, crop in faces] for faces, _ in results]
+        if reference is None:
+            reference = outputs
+        assert outputs == reference, "pipelining changed the output order or bytes"
+        baseline = baseline or elapsed
+        print(f"{read_threads:>7} {write_threads:>7} {elapsed:>8.2f} {len(paths) / elapsed:>9.1f} "
+              f"{baseline / elapsed:>7.2f}x")
+
+if __name__ == '__main__':
+    main()
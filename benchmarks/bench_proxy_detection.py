@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import subprocess
+import tempfile
+from PIL import Image
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_detector import FakeFaceDetector
+from imagekit import detection
+from imagekit.crops import process_image
+
+def run_child(input_path, proxy_size, fake_faces, repeat):
+    """
+    Time process_image in this process and report wall time and peak RSS as JSON.
+    """
+    if fake_faces is not None:
+        face_detection = FakeFaceDetector(fake_faces, 0)
+    else:
+        face_detection = detection.create_face_detector()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        faces, _ = process_image(input_path, face_detection, 512, proxy_size)
+    elapsed = (time.perf_counter() - start) / repeat
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'seconds': elapsed, 'peak_rss_mb': peak_kb / 1024, 'faces': len(faces)}))
+
+def make_source(input_path):
+    """
+    Write a synthetic 48 MP JPEG whose gradients compress like a photo.
+    """
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:6000, 0:8000]
+    base = ((x + y) % 256).astype(np.uint8)
+    pixels = np.stack([base, base[::-1], base[:, ::-1]], axis=-1)
+    pixels = pixels + rng.integers(0, 16, pixels.shape, dtype=np.uint8)
+    Image.fromarray(pixels).save(input_path, quality=90)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare full-resolution and proxy detection: wall time and peak RSS.')
+    parser.add_argument('--input', type=str, default=None,
+                        help='Image to benchmark; a synthetic 48 MP JPEG is generated if omitted')
+    parser.add_argument('--proxy_sizes', type=int, nargs='+', default=[512, 1024, 2048],
+                        help='Proxy maximum sides to compare (default: 512 1024 2048)')
+    parser.add_argument('--fake_faces', type=int, default=None,
+                        help='Replace MediaPipe with a fake detector reporting this many faces')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per setting (default: 3)')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--make_source', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--proxy_size', type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.make_source:
+        make_source(args.input)
+        return
+    if args.child:
+        run_child(args.input, args.proxy_size, args.fake_faces, args.repeat)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = args.input
+        if input_path is None:
+            input_path = os.path.join(tmp, 'source_48mp.jpg')
+            # Generated in a subprocess so its memory does not count towards the measurements
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--make_source', '--input', input_path],
+                           check=True)
+
+        print(f"{'proxy':>8} {'seconds':>8} {'peak RSS MB':>12} {'faces':>6}")
+        for proxy_size in [None] + args.proxy_sizes:
+            command = [sys.executable, os.path.abspath(__file__), '--child', '--input', input_path,
+                       '--repeat', str(args.repeat)]
+            if proxy_size:
+                command += ['--proxy_size', str(proxy_size)]
+            if args.fake_faces is not None:
+                command += ['--fake_faces', str(args.fake_faces)]
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            label = str(proxy_size) if proxy_size else 'full'
+            print(f"{label:>8} {result['seconds']:>8.2f} {result['peak_rss_mb']:>12.0f} {result['faces']:>6}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rename_images
+
+def legacy_rename_images(folder_path):
+    """
+    The previous implementation: every file moved into .temp and back out again.
+    """
+    image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.heic', '.heif')
+    image_files = sorted(f for f in os.listdir(folder_path) if f.lower().endswith(image_extensions))
+    temp_dir = os.path.join(folder_path, '.temp')
+    os.makedirs(temp_dir, exist_ok=True)
+    for filename in image_files:
+        shutil.move(os.path.join(folder_path, filename), os.path.join(temp_dir, filename))
+    for i, filename in enumerate(image_files, start=1):
+        shutil.move(os.path.join(temp_dir, filename), os.path.join(folder_path, f"{i:03d}.jpg"))
+    os.rmdir(temp_dir)
+
+def make_folder(folder, count, seed):
+    """
+    Fill a folder with empty image files and captions. Half of the images
+    already carry numbered names in shuffled order, so the plan contains long
+    chains and cycles.
+    """
+    rng = np.random.default_rng(seed)
+    numbered = rng.permutation(np.arange(1, count // 2 + 1))
+    for i in range(count):
+        name = f"{numbered[i]:03d}" if i < len(numbered) else f"IMG_{i:06d}"
+        open(os.path.join(folder, f"{name}.jpg"), 'w').close()
+        if i % 2 == 0:
+            open(os.path.join(folder, f"{name}.txt"), 'w').close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark rename_images against the previous temp-directory implementation.')
+    parser.add_argument('--files', type=int, default=100000,
+                        help='Number of image files in the folder (default: 100000)')
+    parser.add_argument('--skip_legacy', action='store_true',
+                        help='Only time the new implementation')
+    args = parser.parse_args()
+
+    cases = [('journaled', rename_images.rename_images)]
+    if not args.skip_legacy:
+        cases.append(('legacy', legacy_rename_images))
+
+    print(f"{'implementation':>15} {'files':>8} {'renames':>8} {'seconds':>8}")
+    for name, function in cases:
+        with tempfile.TemporaryDirectory() as folder:
+            make_folder(folder, args.files, 0)
+            renames = len(rename_images.order_renames(rename_images.plan_renames(folder), set(os.listdir(folder)))) \
+                if name == 'journaled' else 2 * args.files
+            with open(os.devnull, 'w') as devnull:
+                stdout, sys.stdout = sys.stdout, devnull
+                try:
+                    start = time.perf_counter()
+                    function(folder)
+                    elapsed = time.perf_counter() - start
+                finally:
+                    sys.stdout = stdout
+            print(f"{name:>15} {len(os.listdir(folder)):>8} {renames:>8} {elapsed:>8.2f}")
+
+if __name__ == '__main__':
+    main()
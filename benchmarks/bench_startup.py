@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPTS = ('crop_and_center.py', 'crop_faces_new.py', 'detect_faces.py', 'generate_descriptions.py',
+           'rename_images.py', 'to_grayscale.py', 'pipeline.py')
+
+def best_time(command, runs):
+    """
+    Best wall time of a command over several runs, in seconds.
+    """
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True, cwd=ROOT)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the startup time of every CLI script.')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Runs per script; the best one is reported (default: 5)')
+    args = parser.parse_args()
+
+    interpreter = best_time([sys.executable, '-c', 'pass'], args.runs)
+    print(f"Interpreter alone: {interpreter * 1000:.0f} ms")
+    print(f"{'script':<26}{'--help (ms)':>12}")
+    for script in SCRIPTS:
+        print(f"{script:<26}{best_time([sys.executable, script, '--help'], args.runs) * 1000:>12.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+from PIL import Image, ImageDraw
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_detector import FixedInputDetector
+from imagekit.geometry import box_iou, boxes_from_detections
+from imagekit.tiling import TiledFaceDetector
+
+# Faces narrower than this count as small background faces in the recall breakdown
+SMALL_FACE = 100
+
+def make_scene(rng, width, height, faces, min_face, max_face):
+    """
+    A grey, textured scene with skin-coloured faces of log-uniform sizes that do not overlap.
+
+    Returns:
+        tuple: (RGB uint8 array, (N, 4) ground truth boxes in pixels)
+    """
+    y = np.linspace(0, 6, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 9, width, dtype=np.float32)[None, :]
+    grey = 110 + 40 * np.sin(x + rng.uniform(0, 6)) * np.cos(y)
+    pixels = np.repeat(grey[..., None], 3, axis=2) + rng.normal(0, 8, (height, width, 3)).astype(np.float32)
+    img = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    draw = ImageDraw.Draw(img)
+
+    boxes = []
+    while len(boxes) < faces:
+        face_w = float(np.exp(rng.uniform(np.log(min_face), np.log(max_face))))
+        face_h = face_w * 1.3
+        left, top = rng.uniform(0, width - face_w), rng.uniform(0, height - face_h)
+        box = (left, top, left + face_w, top + face_h)
+        if boxes and box_iou([box], boxes).max() > 0:
+            continue
+        boxes.append(box)
+        skin = tuple(int(v) for v in rng.uniform([200, 140, 100], [240, 180, 130]))
+        draw.ellipse(box, fill=skin)
+        for side in (0.3, 0.7):
+            cx, cy = left + side * face_w, top + 0.4 * face_h
+            draw.ellipse((cx - face_w * 0.06, cy - face_h * 0.03, cx + face_w * 0.06, cy + face_h * 0.03), fill=(40, 30, 20))
+    return np.asarray(img), np.array(boxes)
+
+def match(truth, detected, min_iou):
+    """
+    Return, per ground truth box, whether a detection overlaps it by min_iou, and
+    the number of detections matching no face.
+    """
+    if not len(detected):
+        return np.zeros(len(truth), dtype=bool), 0
+    iou = box_iou(truth, detected)
+    return iou.max(axis=1) >= min_iou, int((iou.max(axis=0) < min_iou).sum())
+
+def run(detector, scenes, min_iou):
+    found = []
+    sizes = []
+    false_positives = 0
+    elapsed = 0.0
+    for pixels, truth in scenes:
+        start = time.perf_counter()
+        detections = detector.process(pixels).detections
+        elapsed += time.perf_counter() - start
+        height, width = pixels.shape[:2]
+        rel = boxes_from_detections(detections)
+        detected = np.stack([rel[:, 0] * width, rel[:, 1] * height,
+                             (rel[:, 0] + rel[:, 2]) * width, (rel[:, 1] + rel[:, 3]) * height], axis=1)
+        hits, misses = match(truth, detected, min_iou)
+        found.append(hits)
+        sizes.append(truth[:, 2] - truth[:, 0])
+        false_positives += misses
+    return elapsed, np.concatenate(found), np.concatenate(sizes), false_positives
+
+def main():
+    parser = argparse.ArgumentParser(description='Recall and time per megapixel of tiled multi-scale detection against a single full-frame pass.')
+    parser.add_argument('--images', type=int, default=3,
+                        help='Number of synthetic scenes (default: 3)')
+    parser.add_argument('--width', type=int, default=7680,
+                        help='Scene width (default: 7680)')
+    parser.add_argument('--height', type=int, default=4320,
+                        help='Scene height (default: 4320)')
+    parser.add_argument('--faces', type=int, default=40,
+                        help='Faces per scene (default: 40)')
+    parser.add_argument('--min_face', type=int, default=24,
+                        help='Narrowest face in pixels (default: 24)')
+    parser.add_argument('--max_face', type=int, default=800,
+                        help='Widest face in pixels (default: 800)')
+    parser.add_argument('--inference_ms', type=float, default=15,
+                        help='Simulated inference time per detector call (default: 15)')
+    parser.add_argument('--tile_size', type=int, nargs='+', default=[1024, 2048],
+                        help='Tile sizes to compare (default: 1024 2048)')
+    parser.add_argument('--overlap', type=int, default=128,
+                        help='Tile overlap in pixels (default: 128)')
+    parser.add_argument('--max_scales', type=int, nargs='+', default=[1, 2],
+                        help='Pyramid levels to compare (default: 1 2)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 4],
+                        help='Tile worker processes to compare (default: 0 4)')
+    parser.add_argument('--min_iou', type=float, default=0.4,
+                        help='Overlap for a detection to count as finding a face (default: 0.4)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    scenes = [make_scene(rng, args.width, args.height, args.faces, args.min_face, args.max_face) for _ in range(args.images)]
+    megapixels = args.images * args.width * args.height / 1e6
+    print(f"{args.images} scenes of {args.width}x{args.height}, {args.faces} faces of {args.min_face}-{args.max_face} px each, "
+          f"inference {args.inference_ms:g} ms per call")
+    print(f"{'detector':<26}{'ms/MP':>8}{'recall':>8}{f'<{SMALL_FACE}px':>8}{f'>={SMALL_FACE}px':>8}{'false +':>9}")
+
+    configs = [('single pass', None)]
+    for tile_size in args.tile_size:
+        for max_scales in args.max_scales:
+            for workers in args.workers:
+                configs.append((f"tiles {tile_size}, {max_scales} scale(s), {workers}w", (tile_size, max_scales, workers)))
+    for name, config in configs:
+        detector = FixedInputDetector(inference_ms=args.inference_ms)
+        if config is not None:
+            tile_size, max_scales, workers = config
+            detector = TiledFaceDetector(detector, tile_size, args.overlap, max_scales, workers,
+                                         create_detector=FixedInputDetector, detector_args=(192, 12, args.inference_ms))
+        elapsed, found, sizes, false_positives = run(detector, scenes, args.min_iou)
+        detector.close()
+        small = sizes < SMALL_FACE
+        print(f"{name:<26}{elapsed * 1000 / megapixels:>8.1f}{found.mean():>8.1%}{found[small].mean():>8.1%}"
+              f"{found[~small].mean():>8.1%}{false_positives:>9}")
+
+if __name__ == '__main__':
+    main()
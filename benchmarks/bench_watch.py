@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import shutil
+import signal
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from corpus import load_or_make_corpus
+from imagekit.profiling import percentile
+
+def serve(argv):
+    # Child process: crop_faces_new with a fake detector whose setup stands in for loading MediaPipe
+    import crop_faces_new
+    from fake_detector import FakeFaceDetector
+    from imagekit import detection
+    faces, inference_ms, setup_ms = int(argv[0]), float(argv[1]), float(argv[2])
+    detection.create_face_detector = lambda *_: FakeFaceDetector(faces, inference_ms, setup_ms)
+    sys.argv = ['crop_faces_new.py'] + argv[3:]
+    crop_faces_new.main()
+
+def output_count(folder):
+    try:
+        return sum(1 for name in os.listdir(folder) if not name.startswith('.'))
+    except FileNotFoundError:
+        return 0
+
+def run(mode, args, sources, work):
+    """
+    Drop the sources into an input folder one at a time and return the seconds
+    from each drop until its crops are written.
+    """
+    input_dir = os.path.join(work, 'input')
+    output_dir = os.path.join(work, 'output')
+    shutil.rmtree(work, ignore_errors=True)
+    os.makedirs(input_dir)
+    command = [sys.executable, os.path.abspath(__file__), '--serve', str(args.fake_faces), str(args.inference_ms),
+               str(args.setup_ms), '--input_dir', input_dir, '--output_dir', output_dir, '--no_cache']
+    watcher = None
+    if mode != 'cron':
+        watcher = subprocess.Popen(command + ['--watch', '--settle', str(args.settle)] + (['--polling'] if mode == 'polling' else []),
+                                   stdout=subprocess.DEVNULL)
+        # Up and watching once the empty backlog is done
+        time.sleep(1.0 + args.setup_ms / 1000)
+
+    latencies = []
+    next_cron = time.monotonic()
+    try:
+        for i, source in enumerate(sources):
+            dropped = time.monotonic()
+            # Copied under a hidden name, then renamed, as a careful uploader would
+            temp_path = os.path.join(input_dir, f".{i:04d}.tmp")
+            shutil.copyfile(source, temp_path)
+            os.rename(temp_path, os.path.join(input_dir, f"{i:04d}{os.path.splitext(source)[1]}"))
+            expected = (i + 1) * args.fake_faces
+            while output_count(output_dir) < expected:
+                if mode == 'cron' and time.monotonic() >= next_cron:
+                    # A fresh process over the whole folder, as cron would start one
+                    subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+                    next_cron += args.cron_interval
+                    continue
+                time.sleep(0.005)
+            latencies.append(time.monotonic() - dropped)
+            time.sleep(args.interval)
+    finally:
+        if watcher is not None:
+            watcher.send_signal(signal.SIGINT)
+            watcher.wait()
+    return latencies
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        serve(sys.argv[2:])
+        return
+    parser = argparse.ArgumentParser(description='Latency from an image arriving in the input folder to its crops being written: crop_faces_new.py --watch (inotify and polling) against cron-style reruns.')
+    parser.add_argument('--images', type=int, default=8,
+                        help='Images dropped into the folder, one at a time (default: 8)')
+    parser.add_argument('--interval', type=float, default=0.5,
+                        help='Seconds between an image being written out and the next drop (default: 0.5)')
+    parser.add_argument('--cron_interval', type=float, default=5.0,
+                        help='Seconds between two cron-style runs; real schedules are minutes (default: 5)')
+    parser.add_argument('--setup_ms', type=float, default=500,
+                        help='Simulated detector initialization, paid by every cron-style run (default: 500)')
+    parser.add_argument('--inference_ms', type=float, default=15,
+                        help='Simulated detector inference time (default: 15)')
+    parser.add_argument('--fake_faces', type=int, default=2,
+                        help='Faces reported by the fake detector (default: 2)')
+    parser.add_argument('--settle', type=float, default=0.5,
+                        help='--settle of the watch modes (default: 0.5)')
+    parser.add_argument('--modes', type=str, nargs='+', default=['inotify', 'polling', 'cron'], choices=('inotify', 'polling', 'cron'),
+                        help='Modes to compare (default: inotify polling cron)')
+    args = parser.parse_args()
+
+    corpus_dir = os.path.join(tempfile.gettempdir(), 'imagekit-bench-corpus')
+    entries = load_or_make_corpus(corpus_dir, 0.25, 1)
+    sources = [os.path.join(corpus_dir, entry['name']) for entry in entries if entry['name'].endswith('.jpg')]
+    sources = (sources * args.images)[:args.images]
+    print(f"{args.images} images, detector setup {args.setup_ms:g} ms, settle {args.settle:g} s, "
+          f"cron every {args.cron_interval:g} s")
+    print(f"{'mode':<10}{'p50 s':>8}{'p95 s':>8}{'max s':>8}")
+    with tempfile.TemporaryDirectory() as work:
+        for mode in args.modes:
+            latencies = sorted(run(mode, args, sources, os.path.join(work, mode)))
+            print(f"{mode:<10}{percentile(latencies, 50):>8.2f}{percentile(latencies, 95):>8.2f}{latencies[-1]:>8.2f}")
+
+if __name__ == '__main__':
+    main()
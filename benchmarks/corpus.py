@@ -0,0 +1,164 @@
+import os
+import json
+import hashlib
+from PIL import Image, ImageDraw
+import numpy as np
+
+# Bump when the generated content changes, so results on different corpora are not compared
+CORPUS_VERSION = 1
+
+# Stored pixels for each EXIF orientation, given the upright image; applying the tag restores it
+_ORIENTATION_STORE = {1: None, 3: Image.Transpose.ROTATE_180, 6: Image.Transpose.ROTATE_90, 8: Image.Transpose.ROTATE_270}
+
+# (kind, upright width, height, faces, orientation) before scaling; every kind is written once per variant
+SPEC = (
+    ('jpeg', 640, 480, 1, 1),
+    ('jpeg', 1920, 1080, 2, 1),
+    ('jpeg', 4000, 3000, 3, 1),
+    ('jpeg', 3000, 4000, 1, 6),
+    ('jpeg', 4000, 3000, 2, 3),
+    ('jpeg', 3000, 4000, 1, 8),
+    ('jpeg_gray', 1600, 1200, 1, 1),
+    ('png', 1280, 960, 1, 1),
+    ('png_alpha', 1024, 1024, 1, 1),
+    ('png_palette', 800, 600, 1, 1),
+    # HEIF encoding is slow, so the HEIC files stay small
+    ('heic', 1008, 1344, 2, 1),
+    ('gif', 640, 480, 1, 1),
+    ('gif_animated', 480, 360, 1, 1),
+)
+
+def face_like_image(rng, width, height, faces):
+    """
+    Draw an RGB scene with `faces` cartoon faces: skin-toned ovals with hair,
+    eyes, brows, nose and mouth over a textured background, sized and placed so
+    they do not overlap.
+
+    Returns:
+        tuple: (PIL.Image.Image, list of (left, top, right, bottom) face boxes)
+    """
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    phase = rng.uniform(0, 6, 3)
+    background = np.stack([110 + 50 * np.sin(x / (width / 3) + phase[0]) * np.cos(y / (height / 2)),
+                           120 + 40 * np.cos(x / (width / 5) + phase[1]),
+                           130 + 45 * np.sin((x + y) / (width / 4) + phase[2])], axis=-1)
+    background += rng.normal(0, 6, background.shape)
+    img = Image.fromarray(np.clip(background, 0, 255).astype(np.uint8))
+    draw = ImageDraw.Draw(img)
+
+    boxes = []
+    cell = width / max(faces, 1)
+    for i in range(faces):
+        face_w = min(cell, height) * rng.uniform(0.35, 0.55)
+        face_h = face_w * 1.3
+        cx = cell * (i + 0.5) + rng.uniform(-0.1, 0.1) * cell
+        cy = height * rng.uniform(0.4, 0.6)
+        left, top, right, bottom = cx - face_w / 2, cy - face_h / 2, cx + face_w / 2, cy + face_h / 2
+        skin = tuple(int(v) for v in rng.uniform([170, 120, 90], [240, 190, 160]))
+        draw.ellipse((left - face_w * 0.05, top - face_h * 0.08, right + face_w * 0.05, cy), fill=(50, 35, 25))
+        draw.ellipse((left, top, right, bottom), fill=skin)
+        for side in (-1, 1):
+            ex = cx + side * face_w * 0.2
+            ey = cy - face_h * 0.08
+            draw.ellipse((ex - face_w * 0.09, ey - face_h * 0.04, ex + face_w * 0.09, ey + face_h * 0.04), fill=(245, 245, 245))
+            draw.ellipse((ex - face_w * 0.04, ey - face_h * 0.035, ex + face_w * 0.04, ey + face_h * 0.035), fill=(40, 30, 20))
+            draw.line((ex - face_w * 0.1, ey - face_h * 0.09, ex + face_w * 0.1, ey - face_h * 0.1), fill=(60, 40, 30), width=max(1, int(face_w * 0.03)))
+        draw.polygon([(cx, cy - face_h * 0.02), (cx - face_w * 0.06, cy + face_h * 0.12), (cx + face_w * 0.06, cy + face_h * 0.12)],
+                     fill=tuple(int(v * 0.85) for v in skin))
+        draw.arc((cx - face_w * 0.2, cy + face_h * 0.1, cx + face_w * 0.2, cy + face_h * 0.3), 20, 160,
+                 fill=(150, 50, 50), width=max(1, int(face_w * 0.03)))
+        boxes.append((round(left), round(top), round(right), round(bottom)))
+    return img, boxes
+
+def _save(img, path, kind, orientation):
+    if kind.startswith('jpeg'):
+        exif = Image.Exif()
+        if orientation != 1:
+            exif[0x0112] = orientation
+        if kind == 'jpeg_gray':
+            img = img.convert('L')
+        img.save(path, format='JPEG', quality=90, exif=exif)
+    elif kind == 'png':
+        img.save(path, format='PNG')
+    elif kind == 'png_alpha':
+        # Opaque in the middle, fading out towards the corners
+        y, x = np.mgrid[0:img.height, 0:img.width]
+        distance = np.hypot(x / img.width - 0.5, y / img.height - 0.5)
+        alpha = np.clip(255 * (1.4 - 2 * distance), 0, 255).astype(np.uint8)
+        rgba = img.convert('RGBA')
+        rgba.putalpha(Image.fromarray(alpha))
+        rgba.save(path, format='PNG')
+    elif kind == 'png_palette':
+        img.quantize(64).save(path, format='PNG', transparency=0)
+    elif kind == 'heic':
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+        img.save(path, format='HEIF', quality=80)
+    elif kind == 'gif':
+        img.quantize(128).save(path, format='GIF')
+    elif kind == 'gif_animated':
+        frames = [img.quantize(128), img.transpose(Image.Transpose.FLIP_LEFT_RIGHT).quantize(128)]
+        frames[0].save(path, format='GIF', save_all=True, append_images=frames[1:], duration=100, loop=0)
+
+def make_corpus(folder, scale=1.0, variants=2, seed=0):
+    """
+    Write the deterministic mixed corpus: JPEG (EXIF orientations 1, 3, 6, 8 and
+    grayscale), PNG (RGB, alpha, palette with transparency), HEIC and GIF (still
+    and animated), each with face-like content, `variants` times over.
+    A corpus.json next to the images describes every file.
+
+    Args:
+        folder (str): Directory to write to, created if needed
+        scale (float): Factor applied to every resolution in SPEC (default: 1.0)
+        variants (int): Number of images per kind, each drawn differently (default: 2)
+        seed (int): Random seed (default: 0)
+
+    Returns:
+        list: One dict per file with name, kind, size (upright), orientation and face boxes (upright)
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    entries = []
+    for variant in range(variants):
+        for kind, width, height, faces, orientation in SPEC:
+            width, height = max(16, round(width * scale)), max(16, round(height * scale))
+            upright, boxes = face_like_image(rng, width, height, faces)
+            stored = upright if _ORIENTATION_STORE[orientation] is None else upright.transpose(_ORIENTATION_STORE[orientation])
+            extension = {'jpeg': 'jpg', 'png': 'png', 'heic': 'heic', 'gif': 'gif'}[kind.split('_')[0]]
+            name = f"{variant:02d}_{kind}_{width}x{height}_o{orientation}.{extension}"
+            _save(stored, os.path.join(folder, name), kind, orientation)
+            entries.append({'name': name, 'kind': kind, 'size': [width, height],
+                            'orientation': orientation, 'faces': boxes})
+    with open(os.path.join(folder, 'corpus.json'), 'w') as f:
+        json.dump({'version': CORPUS_VERSION, 'scale': scale, 'variants': variants, 'seed': seed,
+                   'files': entries}, f, indent=1)
+    return entries
+
+def corpus_digest(folder, entries):
+    """
+    SHA-256 over the bytes of every corpus file, in order. The generator is
+    deterministic, but encoders may change their output across library versions.
+    """
+    digest = hashlib.sha256()
+    for entry in entries:
+        with open(os.path.join(folder, entry['name']), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def load_or_make_corpus(folder, scale=1.0, variants=2, seed=0):
+    """
+    Reuse the corpus in folder if it was generated with the same parameters,
+    otherwise (re)generate it.
+
+    Returns:
+        list: Corpus entries, see make_corpus
+    """
+    try:
+        with open(os.path.join(folder, 'corpus.json')) as f:
+            meta = json.load(f)
+        if (meta['version'], meta['scale'], meta['variants'], meta['seed']) == (CORPUS_VERSION, scale, variants, seed) \
+                and all(os.path.exists(os.path.join(folder, entry['name'])) for entry in meta['files']):
+            return meta['files']
+    except (OSError, ValueError, KeyError):
+        pass
+    return make_corpus(folder, scale, variants, seed)
@@ -0,0 +1,80 @@
+import time
+from types import SimpleNamespace
+import numpy as np
+
+class FakeFaceDetector:
+    """
+    Stand-in for MediaPipe FaceDetection that reports a fixed number of faces
+    laid out on a grid and sleeps to simulate model setup and inference cost.
+    """
+    def __init__(self, num_faces, inference_ms, setup_ms=0):
+        self.num_faces = num_faces
+        self.inference_ms = inference_ms
+        self.calls = 0
+        time.sleep(setup_ms / 1000)
+
+    def process(self, image):
+        self.calls += 1
+        time.sleep(self.inference_ms / 1000)
+        if not self.num_faces:
+            # MediaPipe reports None rather than an empty list
+            return SimpleNamespace(detections=None)
+        cols = int(np.ceil(np.sqrt(self.num_faces)))
+        cell = 1.0 / cols
+        detections = []
+        for i in range(self.num_faces):
+            bbox = SimpleNamespace(xmin=(i % cols) * cell + cell / 4, ymin=(i // cols) * cell + cell / 4,
+                                   width=cell / 2, height=cell / 2)
+            detections.append(SimpleNamespace(score=[0.9], location_data=SimpleNamespace(relative_bounding_box=bbox)))
+        return SimpleNamespace(detections=detections)
+
+    def close(self):
+        pass
+
+class FixedInputDetector:
+    """
+    Stand-in for MediaPipe that, like it, only sees its input shrunk to a fixed
+    model size: it finds skin-coloured blobs in the shrunk image, so faces that
+    end up smaller than min_pixels there are missed, whatever their size in the
+    original. Sleeps inference_ms per call, as the model's cost does not depend
+    on the input size.
+    """
+    def __init__(self, model_size=192, min_pixels=12, inference_ms=0):
+        self.model_size = model_size
+        self.min_pixels = min_pixels
+        self.inference_ms = inference_ms
+        self.calls = 0
+
+    def process(self, image):
+        from PIL import Image
+        self.calls += 1
+        time.sleep(self.inference_ms / 1000)
+        small = np.asarray(Image.fromarray(np.asarray(image)).resize((self.model_size, self.model_size), Image.Resampling.BOX)).astype(np.int16)
+        mask = (small[..., 0] > 120) & (small[..., 0] - small[..., 2] > 40)
+        detections = []
+        labels = _label(mask)
+        for label in np.unique(labels[mask]):
+            ys, xs = np.nonzero(labels == label)
+            if len(xs) < self.min_pixels:
+                continue
+            bbox = SimpleNamespace(xmin=xs.min() / self.model_size, ymin=ys.min() / self.model_size,
+                                   width=(xs.max() + 1 - xs.min()) / self.model_size,
+                                   height=(ys.max() + 1 - ys.min()) / self.model_size)
+            fill = len(xs) / ((xs.max() + 1 - xs.min()) * (ys.max() + 1 - ys.min()))
+            detections.append(SimpleNamespace(score=[float(fill)], location_data=SimpleNamespace(relative_bounding_box=bbox)))
+        return SimpleNamespace(detections=detections or None)
+
+    def close(self):
+        pass
+
+def _label(mask):
+    # 4-connected components: every pixel takes the smallest label among its neighbours until stable
+    labels = np.where(mask, np.arange(mask.size).reshape(mask.shape) + 1, 0)
+    big = mask.size + 1
+    while True:
+        padded = np.pad(np.where(mask, labels, big), 1, constant_values=big)
+        neighbours = np.minimum.reduce([padded[1:-1, 1:-1], padded[:-2, 1:-1], padded[2:, 1:-1], padded[1:-1, :-2], padded[1:-1, 2:]])
+        updated = np.where(mask, neighbours, 0)
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
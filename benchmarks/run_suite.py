@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import contextlib
+from types import SimpleNamespace
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from corpus import load_or_make_corpus, corpus_digest
+from fake_detector import FakeFaceDetector
+from stub_openai import StubChatCompletions
+from imagekit import detection
+from imagekit.io import save_image
+from imagekit.strategies import CropOptions, create_crop_strategy
+from crop_and_center import load_center_crop
+from to_grayscale import convert_to_grayscale
+from rename_images import rename_images
+from detect_faces import detect_faces
+from generate_descriptions import CaptionClient, caption_images
+
+RESULTS_VERSION = 1
+DEFAULT_RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+PACKAGES = ('Pillow', 'numpy', 'pillow-heif', 'mediapipe', 'requests')
+
+def fresh_dir(work, name):
+    path = os.path.join(work, name)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    return path
+
+def bench_crop_and_center(context, work):
+    output = fresh_dir(work, 'crop_and_center')
+    start = time.perf_counter()
+    for i, path in enumerate(context.paths, start=1):
+        save_image(load_center_crop(path, context.size), os.path.join(output, f"{i:03d}.jpg"), quality=95)
+    return time.perf_counter() - start, len(context.paths)
+
+def bench_convert_to_grayscale(context, work):
+    output = fresh_dir(work, 'grayscale')
+    start = time.perf_counter()
+    for path in context.paths:
+        convert_to_grayscale(path, os.path.join(output, os.path.basename(path)))
+    return time.perf_counter() - start, len(context.paths)
+
+def bench_rename_images(context, work):
+    # A shuffled folder of hard links to the corpus, every other image with a caption
+    folder = fresh_dir(work, 'rename')
+    rng = np.random.default_rng(0)
+    for i in range(context.rename_files):
+        source = context.paths[i % len(context.paths)]
+        name = f"img_{rng.integers(1 << 40):010x}"
+        os.link(source, os.path.join(folder, name + os.path.splitext(source)[1]))
+        if i % 2 == 0:
+            with open(os.path.join(folder, name + '.txt'), 'w') as f:
+                f.write('tok, a photo of a person')
+    start = time.perf_counter()
+    rename_images(folder)
+    return time.perf_counter() - start, context.rename_files
+
+def bench_crop_faces_loop(context, work):
+    # The crop_faces_new.py main loop: detect, crop and encode, then number and write every face
+    output = fresh_dir(work, 'crop_faces')
+    start = time.perf_counter()
+    counter = 1
+    for faces, messages in create_crop_strategy(CropOptions(context.size), context.workers).run(context.paths):
+        for _, _, jpeg_bytes in faces:
+            with open(os.path.join(output, f"{counter:03d}.jpg"), 'wb') as f:
+                f.write(jpeg_bytes)
+            counter += 1
+    return time.perf_counter() - start, len(context.paths)
+
+def bench_detect_faces(context, work):
+    output = fresh_dir(work, 'detect_faces')
+    face_detection = detection.create_face_detector()
+    start = time.perf_counter()
+    counter = 1
+    for path in context.paths:
+        for face_image in detect_faces(path, face_detection, context.size):
+            save_image(face_image, os.path.join(output, f"{counter:03d}.jpg"), quality=95)
+            counter += 1
+    elapsed = time.perf_counter() - start
+    face_detection.close()
+    return elapsed, len(context.paths)
+
+def bench_caption_client(context, work):
+    with StubChatCompletions(context.latency) as stub:
+        client = CaptionClient('stub-key', stub.url, concurrency=context.concurrency)
+        start = time.perf_counter()
+        results = list(caption_images(context.paths, client, context.concurrency))
+        elapsed = time.perf_counter() - start
+        client.close()
+    if any(description is None for _, description in results):
+        raise RuntimeError("The caption stub returned errors")
+    return elapsed, len(context.paths)
+
+BENCHMARKS = {
+    'crop_and_center': bench_crop_and_center,
+    'convert_to_grayscale': bench_convert_to_grayscale,
+    'rename_images': bench_rename_images,
+    'crop_faces_loop': bench_crop_faces_loop,
+    'detect_faces': bench_detect_faces,
+    'caption_client': bench_caption_client,
+}
+
+def git_state():
+    """
+    Return (commit, dirty) of the repository, or (None, None) outside a git checkout.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout
+        return commit, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+def package_versions():
+    from importlib.metadata import version, PackageNotFoundError
+    versions = {}
+    for name in PACKAGES:
+        try:
+            versions[name] = version(name)
+        except PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+def use_detector(name, fake_faces, inference_ms):
+    """
+    Pick the detector: 'mediapipe', 'fake', or 'auto' (MediaPipe if its face
+    detection is available). The detection service is never used, so results do
+    not depend on whether one is running.
+
+    Returns:
+        str: The detector in use
+    """
+    os.environ[detection.SOCKET_ENV] = os.path.join(ROOT, 'benchmarks', '.no-detection-service.sock')
+    if name == 'auto':
+        try:
+            import mediapipe
+            name = 'mediapipe' if hasattr(mediapipe, 'solutions') else 'fake'
+        except ImportError:
+            name = 'fake'
+    if name == 'fake':
+        detection.create_mediapipe_detector = lambda *_: FakeFaceDetector(fake_faces, inference_ms)
+    return name
+
+def run_benchmarks(names, context, work, repeat):
+    """
+    Run each benchmark once to warm up, then `repeat` timed times, silencing their output.
+
+    Returns:
+        dict: Per benchmark, items, run times, median, min and ms per item (of the median)
+    """
+    results = {}
+    for name in names:
+        runs = []
+        items = 0
+        for attempt in range(repeat + 1):
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                elapsed, items = BENCHMARKS[name](context, work)
+            if attempt:
+                runs.append(elapsed)
+        median = statistics.median(runs)
+        results[name] = {'items': items, 'runs': runs, 'median': median, 'min': min(runs),
+                         'ms_per_item': median / items * 1000}
+        print(f"{name:<22}{items:>7}{median:>10.3f}{min(runs):>10.3f}{median / items * 1000:>12.2f}")
+    return results
+
+def command_run(args):
+    import tempfile
+    commit, dirty = git_state()
+    corpus_dir = args.corpus_dir or os.path.join(tempfile.gettempdir(), 'imagekit-bench-corpus')
+    entries = load_or_make_corpus(corpus_dir, args.scale, args.variants, args.seed)
+    paths = [os.path.join(corpus_dir, entry['name']) for entry in entries]
+    detector = use_detector(args.detector, args.fake_faces, args.fake_inference_ms)
+    context = SimpleNamespace(paths=paths, size=args.size, workers=args.workers, rename_files=args.rename_files,
+                              latency=args.latency, concurrency=args.concurrency)
+    print(f"Corpus: {len(paths)} files in {corpus_dir}; detector: {detector}; commit: {commit or 'unknown'}{' (dirty)' if dirty else ''}")
+    print(f"{'benchmark':<22}{'items':>7}{'median s':>10}{'min s':>10}{'ms/item':>12}")
+    with tempfile.TemporaryDirectory() as work:
+        benchmarks = run_benchmarks(args.only or list(BENCHMARKS), context, work, args.repeat)
+
+    results = {
+        'version': RESULTS_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'dirty': dirty,
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpu_count': os.cpu_count(), 'packages': package_versions()},
+        'config': {'scale': args.scale, 'variants': args.variants, 'seed': args.seed, 'repeat': args.repeat,
+                   'size': args.size, 'workers': args.workers, 'detector': detector, 'fake_faces': args.fake_faces,
+                   'fake_inference_ms': args.fake_inference_ms, 'rename_files': args.rename_files,
+                   'latency': args.latency, 'concurrency': args.concurrency},
+        'corpus': {'files': len(paths), 'digest': corpus_digest(corpus_dir, entries)},
+        'benchmarks': benchmarks,
+    }
+    output = args.output
+    if output is None:
+        name = (commit[:12] if commit else time.strftime('%Y%m%d-%H%M%S')) + ('-dirty' if dirty else '')
+        output = os.path.join(DEFAULT_RESULTS_DIR, f"{name}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=1)
+    print(f"Results written to {output}")
+
+def compare_results(base, new, threshold, statistic='median'):
+    """
+    Compare two result files benchmark by benchmark.
+
+    Returns:
+        tuple: (rows, warnings) where rows are (name, base ms/item, new ms/item, change, status)
+        with status 'regression', 'improvement' or 'ok', and warnings list setting differences
+    """
+    warnings = []
+    if base['config'] != new['config']:
+        changed = sorted(key for key in set(base['config']) | set(new['config'])
+                         if base['config'].get(key) != new['config'].get(key))
+        warnings.append(f"Configurations differ in: {', '.join(changed)}")
+    if base['corpus']['digest'] != new['corpus']['digest']:
+        warnings.append("Corpora differ (different parameters, or encoders producing different bytes)")
+    if base['environment']['packages'] != new['environment']['packages']:
+        changed = sorted(name for name in new['environment']['packages']
+                         if base['environment']['packages'].get(name) != new['environment']['packages'][name])
+        warnings.append(f"Package versions differ: {', '.join(changed)}")
+    rows = []
+    for name in base['benchmarks']:
+        if name not in new['benchmarks']:
+            continue
+        base_ms = base['benchmarks'][name][statistic] / base['benchmarks'][name]['items'] * 1000
+        new_ms = new['benchmarks'][name][statistic] / new['benchmarks'][name]['items'] * 1000
+        change = new_ms / base_ms - 1
+        status = 'regression' if change > threshold else 'improvement' if change < -threshold else 'ok'
+        rows.append((name, base_ms, new_ms, change, status))
+    return rows, warnings
+
+def command_compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    rows, warnings = compare_results(base, new, args.threshold, args.statistic)
+    print(f"Base: {base['commit'] or 'unknown'}{' (dirty)' if base['dirty'] else ''}  "
+          f"New: {new['commit'] or 'unknown'}{' (dirty)' if new['dirty'] else ''}")
+    for warning in warnings:
+        print(f"Warning: {warning}")
+    print(f"{'benchmark':<22}{'base ms/item':>14}{'new ms/item':>13}{'change':>9}  status")
+    for name, base_ms, new_ms, change, status in rows:
+        print(f"{name:<22}{base_ms:>14.2f}{new_ms:>13.2f}{change:>+9.1%}  {status.upper() if status == 'regression' else status}")
+    regressions = [row for row in rows if row[4] == 'regression']
+    print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Reproducible benchmark suite over a deterministic synthetic corpus, with result comparison.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run = subparsers.add_parser('run', help='Time every benchmark and write the results as JSON')
+    run.add_argument('--only', type=str, nargs='+', choices=list(BENCHMARKS), default=None,
+                     help='Benchmarks to run (default: all)')
+    run.add_argument('--repeat', type=int, default=3,
+                     help='Timed runs per benchmark after one warm-up run (default: 3)')
+    run.add_argument('--scale', type=float, default=1.0,
+                     help='Scale of the corpus resolutions, up to 4000x3000 at 1.0 (default: 1.0)')
+    run.add_argument('--variants', type=int, default=2,
+                     help='Images of each kind in the corpus (default: 2)')
+    run.add_argument('--seed', type=int, default=0, help='Corpus random seed (default: 0)')
+    run.add_argument('--corpus_dir', type=str, default=None,
+                     help='Where the corpus is generated and reused from (default: imagekit-bench-corpus in the temp directory)')
+    run.add_argument('--size', type=int, default=512, help='Output crop size (default: 512)')
+    run.add_argument('--workers', type=int, default=1, help='Workers for the crop_faces loop (default: 1)')
+    run.add_argument('--detector', type=str, default='auto', choices=('auto', 'mediapipe', 'fake'),
+                     help='Face detector; auto uses MediaPipe when available (default: auto)')
+    run.add_argument('--fake_faces', type=int, default=2,
+                     help='Faces reported by the fake detector (default: 2)')
+    run.add_argument('--fake_inference_ms', type=float, default=0,
+                     help='Simulated inference time of the fake detector (default: 0)')
+    run.add_argument('--rename_files', type=int, default=2000,
+                     help='Images in the rename benchmark folder (default: 2000)')
+    run.add_argument('--latency', type=float, default=0.05,
+                     help='Latency of the caption stub server in seconds (default: 0.05)')
+    run.add_argument('--concurrency', type=int, default=8,
+                     help='Caption requests in flight (default: 8)')
+    run.add_argument('--output', type=str, default=None,
+                     help='Results file (default: benchmarks/results/<commit>.json)')
+
+    compare = subparsers.add_parser('compare', help='Compare two results files and flag regressions')
+    compare.add_argument('base', type=str, help='Results of the baseline, e.g. the previous commit')
+    compare.add_argument('new', type=str, help='Results to check')
+    compare.add_argument('--threshold', type=float, default=0.1,
+                         help='Relative slowdown reported as a regression (default: 0.1, i.e. 10%%)')
+    compare.add_argument('--statistic', type=str, default='median', choices=('median', 'min'),
+                         help='Statistic compared (default: median)')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        command_run(args)
+    else:
+        sys.exit(command_compare(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+from types import SimpleNamespace
+import numpy as np
+
+# Scalar reference implementations, as they were in crop_faces_new.py and detect_faces.py
+# before both moved to imagekit.geometry.
+
+def scalar_center_crop_box(bbox, w_img, h_img):
+    """
+    Compute the square crop around a face so that the face is ~2/3 of the crop.
+    
+    Args:
+        bbox: MediaPipe relative bounding box
+        w_img (int): Image width in pixels
+        h_img (int): Image height in pixels
+    
+    Returns:
+        tuple: (crop_x_start, crop_y_start, square_side), or a message string
+        explaining why the face was skipped
+    """
+    # Convert relative bbox to absolute pixel coordinates
+    abs_x = int(bbox.xmin * w_img)
+    abs_y = int(bbox.ymin * h_img)
+    abs_w = int(bbox.width * w_img)
+    abs_h = int(bbox.height * h_img)
+
+    if abs_w <= 0 or abs_h <= 0:
+        return "zero-dimension face detection"
+
+    face_cx = abs_x + abs_w / 2
+    face_cy = abs_y + abs_h / 2
+    face_max_dim = max(abs_w, abs_h)
+
+    # Desired side length of the square crop region where face_max_dim is 2/3 of it.
+    ideal_crop_box_side = face_max_dim * 3.0
+
+    # Calculate initial tentative crop box coordinates (can be outside image bounds)
+    cl = face_cx - ideal_crop_box_side / 2
+    ct = face_cy - ideal_crop_box_side / 2
+    cr = face_cx + ideal_crop_box_side / 2
+    cb = face_cy + ideal_crop_box_side / 2
+
+    # Clip these coordinates to image boundaries
+    final_crop_x1 = max(0, int(round(cl)))
+    final_crop_y1 = max(0, int(round(ct)))
+    final_crop_x2 = min(w_img, int(round(cr)))
+    final_crop_y2 = min(h_img, int(round(cb)))
+    
+    # Calculate width and height of this clipped box
+    clipped_w = final_crop_x2 - final_crop_x1
+    clipped_h = final_crop_y2 - final_crop_y1
+
+    if clipped_w <= 0 or clipped_h <= 0:
+        return "Crop region has zero or negative size after clipping."
+    
+    # Determine the side of the square crop (smallest of clipped dimensions)
+    square_side = min(clipped_w, clipped_h)
+
+    # Center this square within the clipped_w x clipped_h region
+    clipped_center_x = final_crop_x1 + clipped_w / 2
+    clipped_center_y = final_crop_y1 + clipped_h / 2
+
+    crop_x_start = int(round(clipped_center_x - square_side / 2))
+    crop_y_start = int(round(clipped_center_y - square_side / 2))
+    
+    # Ensure start coordinates are non-negative after rounding and centering
+    crop_x_start = max(0, crop_x_start)
+    crop_y_start = max(0, crop_y_start)
+
+    crop_x_end = crop_x_start + square_side
+    crop_y_end = crop_y_start + square_side
+    
+    # Final adjustments to ensure the square crop fits entirely within image bounds
+    if crop_x_end > w_img:
+        crop_x_start = w_img - square_side
+    if crop_y_end > h_img:
+        crop_y_start = h_img - square_side
+    
+    # After potential shifts, re-ensure start is not negative
+    crop_x_start = max(0, crop_x_start)
+    crop_y_start = max(0, crop_y_start)
+    
+    # Validate final crop dimensions
+    if square_side <= 0 or crop_x_start >= w_img or crop_y_start >= h_img or \
+       crop_x_start + square_side > w_img or crop_y_start + square_side > h_img:
+        return f"Invalid final crop dimensions (side: {square_side}, x:{crop_x_start}, y:{crop_y_start})"
+
+    return crop_x_start, crop_y_start, square_side
+
+def scalar_anchor_crop_box(bbox, w, h):
+    """
+    Compute a square crop box with 20% padding around a relative bounding box.
+    
+    Args:
+        bbox: MediaPipe relative bounding box
+        w (int): Image width in pixels
+        h (int): Image height in pixels
+    
+    Returns:
+        tuple: (left, top, right, bottom) in pixels
+    """
+    # Convert relative coordinates to absolute
+    x = int(bbox.xmin * w)
+    y = int(bbox.ymin * h)
+    width = int(bbox.width * w)
+    height = int(bbox.height * h)
+    
+    # Add padding around the face
+    padding = int(max(width, height) * 0.2)  # 20% padding
+    
+    # Calculate the square crop dimensions
+    crop_size = max(width, height) + (padding * 2)
+    
+    # Calculate the center of the face
+    center_x = x + width // 2
+    center_y = y + height // 2
+    
+    # Calculate the crop coordinates with padding
+    crop_left = max(0, center_x - crop_size // 2)
+    crop_top = max(0, center_y - crop_size // 2)
+    crop_right = min(w, crop_left + crop_size)
+    crop_bottom = min(h, crop_top + crop_size)
+    
+    # Ensure the crop is square
+    crop_size = min(crop_right - crop_left, crop_bottom - crop_top)
+    return crop_left, crop_top, crop_left + crop_size, crop_top + crop_size
+
+def random_boxes(rng, count):
+    """
+    Draw relative boxes that cover the awkward cases: faces hanging over every
+    edge, slightly negative coordinates, tiny and zero-sized faces, and exact
+    .5 roundings on small integer grids.
+    """
+    xmin = rng.uniform(-0.2, 1.0, count)
+    ymin = rng.uniform(-0.2, 1.0, count)
+    width = rng.uniform(0, 0.6, count)
+    height = rng.uniform(0, 0.6, count)
+    # A quarter of the boxes on a coarse grid so half-pixel rounding ties actually occur
+    grid = rng.random(count) < 0.25
+    xmin[grid] = np.round(xmin[grid] * 16) / 16
+    ymin[grid] = np.round(ymin[grid] * 16) / 16
+    width[grid] = np.round(width[grid] * 16) / 16
+    height[grid] = np.round(height[grid] * 16) / 16
+    width[rng.random(count) < 0.02] = 0
+    return np.stack([xmin, ymin, width, height], axis=1)
+
+def scalar_boxes(rel_boxes, w, h, policy):
+    boxes = []
+    for xmin, ymin, width, height in rel_boxes:
+        bbox = SimpleNamespace(xmin=xmin, ymin=ymin, width=width, height=height)
+        if policy == 'center':
+            crop = scalar_center_crop_box(bbox, w, h)
+            if isinstance(crop, str):
+                boxes.append(None)
+            else:
+                x, y, side = crop
+                boxes.append((x, y, x + side, y + side))
+        else:
+            left, top, right, bottom = scalar_anchor_crop_box(bbox, w, h)
+            boxes.append((left, top, right, bottom) if right > left else None)
+    return boxes
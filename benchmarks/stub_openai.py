@@ -0,0 +1,92 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubChatCompletions:
+    """
+    Local HTTP server mimicking the chat/completions response shape, with
+    artificial latency, an optional share of 429 responses carrying Retry-After
+    and an optional share of server errors. Use as a context manager; the
+    endpoint is available as .url.
+    
+    Args:
+        latency (float): Seconds to wait before answering each request (default: 0.2)
+        rate_limit_ratio (float): Fraction of requests answered with 429 (default: 0.0)
+        retry_after (float): Retry-After value sent with 429 responses (default: 0.1)
+        server_error_ratio (float): Fraction of requests answered with server_error_status (default: 0.0)
+        server_error_status (int): Status of the server errors, e.g. 500 or 503 (default: 503)
+    """
+    def __init__(self, latency=0.2, rate_limit_ratio=0.0, retry_after=0.1, server_error_ratio=0.0, server_error_status=503):
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.server_error_ratio = server_error_ratio
+        self.server_error_status = server_error_status
+        self.requests = 0
+        self.rate_limited = 0
+        self.server_errors = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                json.loads(body)
+                with stub._lock:
+                    stub.requests += 1
+                    # Spread rate-limited answers evenly so runs are reproducible
+                    limited = int(stub.requests * stub.rate_limit_ratio) > int((stub.requests - 1) * stub.rate_limit_ratio)
+                    failed = not limited and \
+                        int(stub.requests * stub.server_error_ratio) > int((stub.requests - 1) * stub.server_error_ratio)
+                    stub.rate_limited += limited
+                    stub.server_errors += failed
+                time.sleep(stub.latency)
+                if limited:
+                    payload = json.dumps({"error": {"message": "Rate limit reached", "type": "requests"}}).encode()
+                    self.send_response(429)
+                    self.send_header('Retry-After', str(stub.retry_after))
+                elif failed:
+                    payload = json.dumps({"error": {"message": "The server is overloaded", "type": "server_error"}}).encode()
+                    self.send_response(stub.server_error_status)
+                else:
+                    payload = json.dumps({
+                        "id": "chatcmpl-stub",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": "gpt-4o-mini",
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": "a photo of a person smiling, looking at camera"},
+                            "finish_reason": "stop"
+                        }],
+                        "usage": {"prompt_tokens": 100, "completion_tokens": 10, "total_tokens": 110}
+                    }).encode()
+                    self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/chat/completions"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -2,44 +2,74 @@
 
 import os
 import argparse
-from PIL import Image
+from collections import deque
+from imagekit.io import iter_images, decode_image, image_size
+from imagekit.encode import OutputEncoder, add_encoder_arguments, encoding_from_args
+from imagekit.archive import ShardWriter, add_shard_arguments, sample_metadata, source_caption
+from imagekit.resize import RESIZE_MODES, reduce_factor, resize_square
+from imagekit.profiling import stage, item as profile_item, add_profile_arguments, start_profile
 
-def crop_and_center(input_path, output_path, size=512):
+def center_crop_image(img, size=512, resize='fast'):
     """
-    Process a single image by cropping it to a square from the center and resizing it.
+    Crop an in-memory image to a square from the center and resize it.
+    
+    Args:
+        img (PIL.Image.Image): Image to crop
+        size (int): Target size for the square image (default: 512)
+        resize (str): 'fast' (integer reduce, then LANCZOS) or 'exact' (LANCZOS only) (default: 'fast')
+    
+    Returns:
+        PIL.Image.Image: The square RGB image
+    """
+    # Convert to RGB if necessary
+    if img.mode != 'RGB':
+        with stage('color'):
+            img = img.convert('RGB')
+    
+    # Get the dimensions
+    width, height = img.size
+    
+    # Calculate the square crop dimensions
+    crop_size = min(width, height)
+    left = (width - crop_size) // 2
+    top = (height - crop_size) // 2
+    right = left + crop_size
+    bottom = top + crop_size
+    
+    # Resize the square from the center of the image
+    return resize_square(img, (left, top, right, bottom), size, resize)
+
+def load_center_crop(input_path, size=512, resize='fast'):
+    """
+    Decode an image and return its center square resized to size x size.
+    In fast mode JPEGs are decoded at the smallest 1/2, 1/4 or 1/8 scale (HEIF:
+    the smallest embedded thumbnail) that still leaves the crop large enough.
     
     Args:
         input_path (str): Path to the input image
-        output_path (str): Path where the processed image will be saved
         size (int): Target size for the square image (default: 512)
+        resize (str): 'fast' or 'exact', see center_crop_image (default: 'fast')
+    
+    Returns:
+        PIL.Image.Image: The square RGB image
     """
+    max_reduce = reduce_factor(min(image_size(input_path)), size) if resize == 'fast' else 1
+    # Upright and in RGB
+    img = decode_image(input_path, max_reduce=max_reduce)
+    return center_crop_image(img, size, resize)
+
+def _report(input_path, output_path, future, shards=None, extension='jpg'):
     try:
-        # Open the image
-        with Image.open(input_path) as img:
-            # Convert to RGB if necessary
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Get the dimensions
-            width, height = img.size
-            
-            # Calculate the square crop dimensions
-            crop_size = min(width, height)
-            left = (width - crop_size) // 2
-            top = (height - crop_size) // 2
-            right = left + crop_size
-            bottom = top + crop_size
-            
-            # Crop the image to a square from the center
-            img_cropped = img.crop((left, top, right, bottom))
-            
-            # Resize the image
-            img_resized = img_cropped.resize((size, size), Image.Resampling.LANCZOS)
-            
-            # Save the processed image
-            img_resized.save(output_path, quality=95)
-            print(f"Processed: {os.path.basename(input_path)} -> {os.path.basename(output_path)}")
-            
+        data = future.result()
+        if shards is not None:
+            # Written here, in input order, while encoding runs on the encoder's threads
+            files = {extension: data, 'json': sample_metadata(input_path)}
+            caption = source_caption(input_path)
+            if caption is not None:
+                files['txt'] = caption
+            with profile_item(input_path), stage('write'):
+                output_path = shards.write(files)
+        print(f"Processed: {os.path.basename(input_path)} -> {os.path.basename(output_path)}")
     except Exception as e:
         print(f"Error processing {input_path}: {str(e)}")
 
@@ -48,30 +78,68 @@ def main():
     parser = argparse.ArgumentParser(description='Process images by cropping to square and resizing.')
     parser.add_argument('--size', type=int, default=512,
                       help='Target size for the square image (default: 512)')
+    parser.add_argument('--resize', type=str, default='fast', choices=RESIZE_MODES,
+                      help='fast: reduced-scale decode and integer reduce before LANCZOS; exact: LANCZOS over the full crop (default: fast)')
+    parser.add_argument('--recursive', action='store_true',
+                      help='Also process images in subfolders of the input folder')
+    parser.add_argument('--input_dir', type=str, default='input',
+                      help='Folder of input images, or a zip or tar archive; archives in the folder are read too, without extracting them (default: input)')
+    add_encoder_arguments(parser)
+    add_shard_arguments(parser)
+    add_profile_arguments(parser)
     args = parser.parse_args()
+    start_profile(args, 'crop_and_center')
+    try:
+        encoder = OutputEncoder(**encoding_from_args(args))
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
     
-    # Create output directory if it doesn't exist
-    os.makedirs('output', exist_ok=True)
-    
-    # Get list of image files in input directory
-    input_dir = 'input'
+    input_dir = args.input_dir
     output_dir = 'output'
+    shards = None
+    if args.shards:
+        try:
+            shards = ShardWriter(args.shards, args.shard_size)
+        except (ValueError, OSError) as e:
+            print(f"Error: Cannot write shards to '{args.shards}': {e}")
+            return
+    else:
+        # Create output directory if it doesn't exist
+        os.makedirs(output_dir, exist_ok=True)
     
-    # Supported image formats
-    image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
-    
-    # Get all image files and sort them
-    image_files = [f for f in os.listdir(input_dir) 
-                  if f.lower().endswith(image_extensions)]
-    image_files.sort()
-    
-    # Process each image in the input directory
-    for index, filename in enumerate(image_files, start=1):
-        input_path = os.path.join(input_dir, filename)
-        # Create new filename with sequential number
-        new_filename = f"{index:03d}.jpg"  # This will create 001.jpg, 002.jpg, etc.
-        output_path = os.path.join(output_dir, new_filename)
-        crop_and_center(input_path, output_path, args.size)
+    # Process each image in the input directory, recognised by content and in sorted order;
+    # archive members are read in archive order, compressed tars front to back.
+    # Encoding runs on the encoder's threads while the next image is decoded
+    in_flight = deque()
+    try:
+        for index, input_path in enumerate(iter_images(input_dir, args.recursive, archives=True, stream=True), start=1):
+            # Create new filename with sequential number
+            new_filename = f"{index:03d}{encoder.extension}"  # This will create 001.jpg, 002.jpg, etc.
+            output_path = os.path.join(output_dir, new_filename)
+            try:
+                with profile_item(input_path):
+                    img_resized = load_center_crop(input_path, args.size, args.resize)
+            except Exception as e:
+                print(f"Error processing {input_path}: {str(e)}")
+                continue
+            if shards is not None:
+                future = encoder.submit_encode(img_resized, input_path)
+            else:
+                future = encoder.submit(img_resized, output_path, input_path)
+            in_flight.append((input_path, output_path, future))
+            # Report in order; block only when every thread has an image waiting
+            while in_flight and (len(in_flight) > encoder.threads or in_flight[0][2].done()):
+                _report(*in_flight.popleft(), shards, encoder.extension[1:])
+        while in_flight:
+            _report(*in_flight.popleft(), shards, encoder.extension[1:])
+    except (OSError, ValueError) as e:
+        print(f"Error reading {input_dir}: {e}")
+    finally:
+        encoder.close()
+        if shards is not None:
+            shards.close()
+            print(f"Wrote {shards.samples_written} sample(s) into {shards.shards_written} shard(s) in {args.shards}")
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -2,37 +2,209 @@
 
 import os
 import argparse
-from PIL import Image, UnidentifiedImageError
-import mediapipe as mp
-import numpy as np
-from pillow_heif import register_heif_opener
 import re
+import time
+from imagekit.io import iter_images
+from imagekit.encode import OUTPUT_EXTENSIONS, OutputEncoder, add_encoder_arguments, encoding_from_args, encoding_variant
+from imagekit.manifest import Manifest
+from imagekit.packed import PackedDataset
+from imagekit.archive import ShardWriter, add_shard_arguments, sample_metadata, source_caption
+from imagekit.frames import SHM_DIR, shared_memory_free
+from imagekit.watch import add_watch_arguments, create_watcher, print_latency_summary
+from imagekit.tiling import tiling_variant
+from imagekit.profiling import stage, item as profile_item, add_profile_arguments, start_profile
+from imagekit.cache import default_detection_cache_path
+from imagekit.resize import RESIZE_MODES
+from imagekit.strategies import CropOptions, SharedFrameCrops, create_crop_strategy
 
-# Register HEIF opener with Pillow
-register_heif_opener()
+def _write_crops(input_path, faces, messages, output_dir, dataset, face_counter, extension, shards=None):
+    """
+    Print the messages of an image and write its crops, numbered from
+    face_counter, to output_dir, the packed dataset or the tar shards.
+    
+    Returns:
+        tuple: (outputs to record in the manifest, next face_counter)
+    """
+    filename = os.path.basename(input_path)
+    for message in messages:
+        print(message)
+    outputs = []
+    # Every crop of an image is stored with the image's caption, if it has one
+    caption = source_caption(input_path) if shards is not None and faces else None
+    for i, square_side, crop in faces:
+        if shards is not None:
+            files = {extension[1:]: crop, 'json': sample_metadata(input_path, face=i)}
+            if caption is not None:
+                files['txt'] = caption
+            with profile_item(input_path), stage('write'):
+                key = shards.write(files)
+            outputs.append(key)
+            print(f"Sharded: sample {key} (Original: {filename}, Face #{i+1}, Crop: {square_side}x{square_side}px)")
+            continue
+        if dataset is not None:
+            with profile_item(input_path), stage('write'):
+                index = dataset.append(crop, source=input_path, face=i)
+            outputs.append(str(index))
+            print(f"Packed: sample {index} (Original: {filename}, Face #{i+1}, Crop: {square_side}x{square_side}px)")
+            continue
+        output_filename = f"{face_counter:03d}{extension}"
+        current_output_path = os.path.join(output_dir, output_filename)
+        with profile_item(input_path), stage('write'):
+            with open(current_output_path, 'wb') as f:
+                f.write(crop)
+        outputs.append(output_filename)
+        
+        print(f"Saved: {current_output_path} (Original: {filename}, Face #{i+1}, Crop: {square_side}x{square_side}px)")
+        face_counter += 1
+    return outputs, face_counter
+
+def _watch(watcher, args, manifest, params, dataset, output_dir, face_counter, extension, options, shards=None):
+    # --watch: crop images as they arrive, with one warm detector, until interrupted;
+    # reader and writer threads apply to each batch, worker and decoder processes do not
+    arrivals = {}
+
+    def batches():
+        for batch in watcher.batches():
+            fresh = []
+            for input_path, arrival in batch:
+                # e.g. a file rewritten with the same content
+                if manifest.is_current(input_path, params):
+                    continue
+                removed = manifest.discard(input_path)
+                if removed:
+                    print(f"Removed {len(removed)} stale output(s) of {os.path.basename(input_path)}")
+                arrivals[input_path] = arrival
+                fresh.append(input_path)
+            if fresh:
+                yield fresh
+                # Asked for the next batch only once this one is written
+                if dataset is not None:
+                    dataset.flush()
+                if shards is not None:
+                    shards.flush()
+                manifest.save()
+
+    print(f"Watching {watcher.folder} for new images ({watcher.method}), press Ctrl+C to stop")
+    latencies = []
+    try:
+        strategy = create_crop_strategy(options, read_threads=args.read_threads, write_threads=args.write_threads,
+                                        queue_size=args.queue_size)
+        for input_path, (faces, messages) in strategy.run_batches(batches()):
+            outputs, face_counter = _write_crops(input_path, faces, messages, output_dir, dataset, face_counter, extension,
+                                                 shards)
+            manifest.record(input_path, params, outputs)
+            latency = time.monotonic() - arrivals.pop(input_path)
+            latencies.append(latency)
+            print(f"Latency: {os.path.basename(input_path)} written {latency:.2f} s after it arrived")
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    print_latency_summary(latencies)
+    return face_counter
 
 def main():
     parser = argparse.ArgumentParser(description='Detects faces, crops them (face is ~2/3 of image), and saves as 512x512 JPGs.')
     parser.add_argument('--input_dir', type=str, default='input',
-                        help='Directory containing input images. Default: "input"')
+                        help='Directory containing input images, or a zip or uncompressed tar archive; archives in the directory are read too, without extracting them. Default: "input"')
     parser.add_argument('--output_dir', type=str, default='output',
                         help='Directory to save processed images. Default: "output"')
     parser.add_argument('--size', type=int, default=512,
                         help='Target size for the output square image (default: 512)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes, each with its own detector (default: 1)')
+    parser.add_argument('--read_threads', type=int, default=0,
+                        help='Threads reading and decoding images ahead of the detector; with --write_threads, pipelines a single worker (default: 0, no pipelining)')
+    parser.add_argument('--write_threads', type=int, default=0,
+                        help='Threads cropping, resizing and encoding faces while the detector runs (default: 0, no pipelining)')
+    parser.add_argument('--queue_size', type=int, default=8,
+                        help='Images held between two pipeline stages, bounding memory (default: 8)')
+    parser.add_argument('--decoders', type=int, default=0,
+                        help='Decoder processes writing frames into shared memory for the detector in this process, with no pickling or copies (default: 0, decode in-process)')
+    parser.add_argument('--frame_megapixels', type=float, default=24,
+                        help='Largest frame a shared memory slot holds without --proxy_size; larger ones are pickled (default: 24)')
+    parser.add_argument('--proxy_size', type=int, default=None,
+                        help='Detect faces on a reduced-size decode with this maximum side, e.g. 1024 (default: full resolution)')
+    parser.add_argument('--tile_size', type=int, default=None,
+                        help='Also detect on overlapping tiles of this side at several scales, for small faces in very large images, e.g. 1024 (default: single pass)')
+    parser.add_argument('--tile_overlap', type=int, default=128,
+                        help='Pixels shared by neighbouring tiles; faces smaller than this are never cut (default: 128)')
+    parser.add_argument('--tile_scales', type=int, default=2,
+                        help='Most scales tiled, halving the image each time (default: 2)')
+    parser.add_argument('--tile_workers', type=int, default=0,
+                        help='Processes detecting tiles in batches, with --workers 1 (default: 0, in-process)')
+    parser.add_argument('--model_selection', type=int, default=1, choices=(0, 1),
+                        help='MediaPipe model: 0 short-range, 1 full-range (default: 1)')
+    parser.add_argument('--min_detection_confidence', type=float, default=0.5,
+                        help='Minimum face detection confidence (default: 0.5)')
+    parser.add_argument('--resize', type=str, default='fast', choices=RESIZE_MODES,
+                        help='fast: integer reduce (and reduced-scale decode with --proxy_size) before LANCZOS; exact: LANCZOS over the full crop (default: fast)')
+    parser.add_argument('--force', action='store_true',
+                        help='Reprocess every input, ignoring the manifest in the output directory')
+    parser.add_argument('--cache_path', type=str, default=default_detection_cache_path(),
+                        help='Detection cache shared across runs and scripts (default: ~/.cache/imagekit/detections.sqlite)')
+    parser.add_argument('--cache_entries', type=int, default=100000,
+                        help='Maximum number of cached detections, least recently used are evicted (default: 100000)')
+    parser.add_argument('--no_cache', action='store_true',
+                        help='Run the detector on every image without reading or writing the detection cache')
+    parser.add_argument('--recursive', action='store_true',
+                        help='Also process images in subdirectories of the input directory')
+    parser.add_argument('--packed', type=str, default=None,
+                        help='Append crops to a packed dataset in this directory (one memory-mapped array plus an index) instead of writing JPEGs to --output_dir')
+    add_shard_arguments(parser)
+    add_encoder_arguments(parser)
+    add_watch_arguments(parser)
+    add_profile_arguments(parser)
     args = parser.parse_args()
+    start_profile(args, 'crop_faces_new')
+
+    tiling = None
+    if args.tile_size:
+        if not 0 <= args.tile_overlap < args.tile_size:
+            print(f"Error: --tile_overlap must be between 0 and --tile_size ({args.tile_size})")
+            return
+        tiling = {'tile_size': args.tile_size, 'overlap': args.tile_overlap, 'max_scales': args.tile_scales,
+                  'workers': args.tile_workers}
+    encoding = encoding_from_args(args)
+    try:
+        # Checked here, before any work; each process running the crops builds its own
+        extension = OutputEncoder(**dict(encoding, threads=0)).extension
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+
+    # Packed samples are stored as pixels, so they are not encoded
+    options = CropOptions(args.size, args.proxy_size, args.resize, bool(args.packed), args.model_selection,
+                          args.min_detection_confidence, None if args.no_cache else args.cache_path, args.cache_entries,
+                          tiling, encoding)
+    strategy = create_crop_strategy(options, args.workers, args.read_threads, args.write_threads, args.queue_size,
+                                    args.decoders, args.frame_megapixels)
+    if isinstance(strategy, SharedFrameCrops):
+        # Checked before any work: a ring larger than /dev/shm only fails when a decoder writes past its end, with SIGBUS
+        free = shared_memory_free()
+        if free is not None and strategy.ring_bytes > free:
+            print(f"Error: --decoders needs {strategy.ring_bytes / 1e6:.0f} MB of shared memory for {strategy.queue_size} "
+                  f"frame slots, but {SHM_DIR} has {free / 1e6:.0f} MB free; lower --queue_size or --frame_megapixels, "
+                  f"or set --proxy_size (e.g. 1024)")
+            return
+
+    if args.packed and args.shards:
+        print("Error: --packed and --shards are two different outputs, give only one")
+        return
 
     input_dir_abs = os.path.abspath(args.input_dir)
-    output_dir_abs = os.path.abspath(args.output_dir)
+    output_dir_abs = os.path.abspath(args.packed or args.shards or args.output_dir)
 
-    os.makedirs(output_dir_abs, exist_ok=True)
+    if args.watch and os.path.isfile(input_dir_abs):
+        print("Error: --watch needs an input directory, not an archive")
+        return
 
-    # Supported image formats
-    image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.heic', '.heif',
-                        '.JPG', '.JPEG', '.PNG', '.BMP', '.GIF', '.HEIC', '.HEIF')
+    if not args.packed:
+        os.makedirs(output_dir_abs, exist_ok=True)
 
     try:
-        image_files = [f for f in os.listdir(input_dir_abs) if f.lower().endswith(image_extensions)]
-        image_files.sort()
+        # Watching starts before the listing, so images arriving meanwhile are not missed
+        watcher = create_watcher(args, input_dir_abs)
+        # Images are recognised by content, not extension
+        input_paths = list(iter_images(input_dir_abs, args.recursive, archives=True))
     except FileNotFoundError:
         print(f"Error: Input directory '{input_dir_abs}' not found.")
         return
@@ -40,12 +212,64 @@ def main():
         print(f"Error listing files in input directory '{input_dir_abs}': {e}")
         return
 
-    if not image_files:
+    if not input_paths and watcher is None:
         print(f"No image files found in '{input_dir_abs}'.")
         return
 
+    dataset = None
+    if args.packed:
+        try:
+            dataset = PackedDataset(output_dir_abs, args.size, writable=True)
+        except (ValueError, OSError) as e:
+            print(f"Error: Cannot open packed dataset '{output_dir_abs}': {e}")
+            return
+    shards = None
+    if args.shards:
+        try:
+            shards = ShardWriter(output_dir_abs, args.shard_size)
+        except (ValueError, OSError) as e:
+            print(f"Error: Cannot write shards to '{output_dir_abs}': {e}")
+            return
+
+    # Skip inputs the manifest says are unchanged; drop outputs of changed or deleted sources.
+    # Packed outputs are sample indices and sharded ones sample keys, removed by a tombstone
+    # instead of deleting a file
+    remove_output = None
+    if dataset is not None:
+        remove_output = lambda output: dataset.remove(int(output))
+    elif shards is not None:
+        remove_output = shards.remove
+    manifest = Manifest(output_dir_abs, remove_output)
+    params = {
+        'crop': 'face_two_thirds',
+        'size': args.size,
+        'proxy_size': args.proxy_size,
+        'model_selection': args.model_selection,
+        'min_detection_confidence': args.min_detection_confidence,
+        'resize': args.resize,
+    }
+    if tiling:
+        # Only recorded with tiling, so existing manifests stay current
+        params['tiling'] = tiling_variant(tiling)
+    if encoding_variant(encoding) and dataset is None:
+        # Packed samples are stored as pixels, whatever the encoder
+        params['encoding'] = encoding_variant(encoding)
+    removed = manifest.discard_missing(input_dir_abs, input_paths)
+    if removed:
+        print(f"Removed {len(removed)} output(s) of deleted sources")
+    pending = []
+    for input_path in input_paths:
+        if not args.force and manifest.is_current(input_path, params):
+            continue
+        removed = manifest.discard(input_path)
+        if removed:
+            print(f"Removed {len(removed)} stale output(s) of {os.path.basename(input_path)}")
+        pending.append(input_path)
+    print(f"{len(input_paths) - len(pending)} unchanged input(s) skipped, {len(pending)} to process")
+
     # Find the highest existing output file number to continue sequence
-    output_files = [f for f in os.listdir(output_dir_abs) if re.match(r'\\d{3,}\\.jpg$', f)]
+    output_files = [] if dataset is not None or shards is not None else [f for f in os.listdir(output_dir_abs)
+                                                if f.endswith(OUTPUT_EXTENSIONS) and re.match(r'\d{3,}\.\w+$', f)]
     face_counter = 1
     if output_files:
         try:
@@ -55,143 +279,41 @@ def main():
             print("Warning: Could not parse existing output filenames to determine counter. Starting from 1.")
             # face_counter remains 1
 
-    # Initialize MediaPipe Face Detection
-    mp_face_detection = mp.solutions.face_detection
-    face_detection = mp_face_detection.FaceDetection(
-        model_selection=1,  # Use the full model for better accuracy
-        min_detection_confidence=0.5
-    )
-
     print(f"Processing images from: {input_dir_abs}")
     print(f"Saving cropped faces to: {output_dir_abs}")
     print(f"Output size for faces: {args.size}x{args.size}px")
 
-    for filename in image_files:
-        input_path = os.path.join(input_dir_abs, filename)
-        try:
-            pil_image = Image.open(input_path)
-
-            # Ensure image is in RGB format
-            if pil_image.mode == 'RGBA' or pil_image.mode == 'LA' or \
-               (pil_image.mode == 'P' and 'transparency' in pil_image.info):
-                pil_image = pil_image.convert('RGB')
-            elif pil_image.mode != 'RGB':
-                pil_image = pil_image.convert('RGB')
-
-            image_np = np.array(pil_image)
-            h_img, w_img, _ = image_np.shape
-
-            # Detect faces
-            results = face_detection.process(image_np)
-
-            if not results.detections:
-                print(f"No faces found in {filename}")
-                continue
-
-            print(f"Found {len(results.detections)} face(s) in {filename}")
-            for i, detection in enumerate(results.detections):
-                bbox = detection.location_data.relative_bounding_box
-                
-                # Convert relative bbox to absolute pixel coordinates
-                abs_x = int(bbox.xmin * w_img)
-                abs_y = int(bbox.ymin * h_img)
-                abs_w = int(bbox.width * w_img)
-                abs_h = int(bbox.height * h_img)
-
-                if abs_w <= 0 or abs_h <= 0:
-                    print(f"Skipping zero-dimension face detection in {filename} (face #{i+1})")
-                    continue
+    if strategy.describe():
+        print(strategy.describe())
+    if args.workers > 1 and (args.read_threads or args.write_threads or args.decoders):
+        print("Warning: --read_threads, --write_threads and --decoders only apply with --workers 1, ignoring them")
+
+    results = strategy.run(pending)
+    try:
+        # Results first, so the generator runs to its end and releases its pools, frame slots and
+        # detector before --watch starts a detector of its own
+        for (faces, messages), input_path in zip(results, pending):
+            outputs, face_counter = _write_crops(input_path, faces, messages, output_dir_abs, dataset, face_counter, extension,
+                                                 shards)
+            manifest.record(input_path, params, outputs)
+        if watcher is not None:
+            face_counter = _watch(watcher, args, manifest, params, dataset, output_dir_abs, face_counter, extension,
+                                  options, shards)
+    finally:
+        # Also when interrupted half-way
+        results.close()
+        # Saved even when interrupted, so finished inputs are not redone
+        if dataset is not None:
+            # The samples must be on disk before the manifest refers to them
+            dataset.close()
+        if shards is not None:
+            shards.close()
+            print(f"Wrote {shards.samples_written} sample(s) into {shards.shards_written} shard(s)")
+        manifest.save()
+        if watcher is not None:
+            watcher.close()
 
-                face_cx = abs_x + abs_w / 2
-                face_cy = abs_y + abs_h / 2
-                face_max_dim = max(abs_w, abs_h)
-
-                # Desired side length of the square crop region where face_max_dim is 2/3 of it.
-                ideal_crop_box_side = face_max_dim * 3.0
-
-                # Calculate initial tentative crop box coordinates (can be outside image bounds)
-                cl = face_cx - ideal_crop_box_side / 2
-                ct = face_cy - ideal_crop_box_side / 2
-                cr = face_cx + ideal_crop_box_side / 2
-                cb = face_cy + ideal_crop_box_side / 2
-
-                # Clip these coordinates to image boundaries
-                final_crop_x1 = max(0, int(round(cl)))
-                final_crop_y1 = max(0, int(round(ct)))
-                final_crop_x2 = min(w_img, int(round(cr)))
-                final_crop_y2 = min(h_img, int(round(cb)))
-                
-                # Calculate width and height of this clipped box
-                clipped_w = final_crop_x2 - final_crop_x1
-                clipped_h = final_crop_y2 - final_crop_y1
-
-                if clipped_w <= 0 or clipped_h <= 0:
-                    print(f"Skipping face #{i+1} in {filename}: Crop region has zero or negative size after clipping.")
-                    continue
-                
-                # Determine the side of the square crop (smallest of clipped dimensions)
-                square_side = min(clipped_w, clipped_h)
-
-                # Center this square within the clipped_w x clipped_h region
-                clipped_center_x = final_crop_x1 + clipped_w / 2
-                clipped_center_y = final_crop_y1 + clipped_h / 2
-
-                crop_x_start = int(round(clipped_center_x - square_side / 2))
-                crop_y_start = int(round(clipped_center_y - square_side / 2))
-                
-                # Ensure start coordinates are non-negative after rounding and centering
-                crop_x_start = max(0, crop_x_start)
-                crop_y_start = max(0, crop_y_start)
-
-                crop_x_end = crop_x_start + square_side
-                crop_y_end = crop_y_start + square_side
-                
-                # Final adjustments to ensure the square crop fits entirely within image bounds
-                if crop_x_end > w_img:
-                    crop_x_start = w_img - square_side
-                    crop_x_end = w_img 
-                if crop_y_end > h_img:
-                    crop_y_start = h_img - square_side
-                    crop_y_end = h_img
-                
-                # After potential shifts, re-ensure start is not negative
-                crop_x_start = max(0, crop_x_start)
-                crop_y_start = max(0, crop_y_start)
-                
-                # Validate final crop dimensions
-                if square_side <= 0 or crop_x_start >= w_img or crop_y_start >= h_img or \
-                   crop_x_start + square_side > w_img or crop_y_start + square_side > h_img :
-                     print(f"Skipping face #{i+1} in {filename}: Invalid final crop dimensions (side: {square_side}, x:{crop_x_start}, y:{crop_y_start})")
-                     continue
-                
-                cropped_face_arr = image_np[crop_y_start:crop_y_end, crop_x_start:crop_x_end]
-
-                if cropped_face_arr.size == 0:
-                    print(f"Warning: Crop for face #{i+1} in {filename} resulted in an empty image. Skipping.")
-                    continue
-                
-                cropped_pil_image = Image.fromarray(cropped_face_arr)
-                resized_image = cropped_pil_image.resize((args.size, args.size), Image.Resampling.LANCZOS)
-
-                output_filename = f"{face_counter:03d}.jpg"
-                current_output_path = os.path.join(output_dir_abs, output_filename)
-                resized_image.save(current_output_path, quality=95)
-                
-                print(f"Saved: {current_output_path} (Original: {filename}, Face #{i+1}, Crop: {square_side}x{square_side}px)")
-                face_counter += 1
-        
-        except FileNotFoundError:
-            print(f"Error: Image file not found: {input_path}")
-            continue
-        except UnidentifiedImageError:
-            print(f"Error: Cannot identify image file (possibly corrupt or unsupported format): {input_path}")
-            continue
-        except Exception as e:
-            print(f"Error processing image {filename}: {str(e)}")
-            continue
-            
-    face_detection.close()
     print("Processing complete.")
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from imagekit.io import iter_images
+from imagekit.phash import HASH_METHODS, hash_input, compute_hashes, find_duplicates
+from imagekit.profiling import stage, item as profile_item, add_profile_arguments, start_profile
+
+# Dropped duplicates are moved here, inside the folder; hidden, so other scripts skip it
+DUPLICATES_DIRNAME = '.duplicates'
+
+def _hash_job(job):
+    input_path, method = job
+    try:
+        with profile_item(input_path):
+            return hash_input(input_path, method)
+    except Exception as e:
+        print(f"Error processing {input_path}: {str(e)}")
+        return None
+
+def hash_images(image_paths, method='phash', workers=1):
+    """
+    Compute the perceptual hash of every image. Thumbnails are decoded in parallel
+    and hashed together in one vectorized call.
+
+    Args:
+        image_paths (list): Paths of the images
+        method (str): 'phash' or 'dhash' (default: 'phash')
+        workers (int): Number of worker processes (default: 1)
+
+    Returns:
+        tuple: (paths, hashes) for the images that could be decoded, hashes as a uint64 array
+    """
+    jobs = [(input_path, method) for input_path in image_paths]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            thumbnails = list(executor.map(_hash_job, jobs, chunksize=64))
+    else:
+        thumbnails = [_hash_job(job) for job in jobs]
+    decoded = [(path, thumbnail) for path, thumbnail in zip(image_paths, thumbnails) if thumbnail is not None]
+    if not decoded:
+        return [], np.zeros(0, dtype=np.uint64)
+    paths, thumbnails = zip(*decoded)
+    with stage('hash'):
+        hashes = compute_hashes(np.stack(thumbnails), method)
+    return list(paths), hashes
+
+def drop_duplicate(folder_path, input_path):
+    """
+    Move a duplicate, and its .txt caption if any, into the folder's .duplicates
+    directory, keeping its path relative to the folder.
+    """
+    relative = os.path.relpath(input_path, folder_path)
+    target = os.path.join(folder_path, DUPLICATES_DIRNAME, relative)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(input_path, target)
+    caption = os.path.splitext(input_path)[0] + '.txt'
+    if os.path.exists(caption):
+        os.replace(caption, os.path.splitext(target)[0] + '.txt')
+
+def main():
+    parser = argparse.ArgumentParser(description='Find near-duplicate images by perceptual hash and report or drop them.')
+    parser.add_argument('folder', type=str, help='Path to the folder containing images')
+    parser.add_argument('--threshold', type=int, default=6,
+                        help='Largest Hamming distance between 64-bit hashes that counts as a duplicate (default: 6)')
+    parser.add_argument('--method', type=str, default='phash', choices=HASH_METHODS,
+                        help='phash (DCT, more robust to re-encoding and brightness changes) or dhash (gradient) (default: phash)')
+    parser.add_argument('--drop', action='store_true',
+                        help=f'Move duplicates and their .txt files into {DUPLICATES_DIRNAME}/ instead of only reporting them')
+    parser.add_argument('--recursive', action='store_true',
+                        help='Also check images in subfolders')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Number of worker processes decoding thumbnails (default: number of CPUs)')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    start_profile(args, 'dedup_images')
+
+    if not os.path.isdir(args.folder):
+        print(f"Error: {args.folder} is not a valid directory")
+        return
+
+    # The first image of each group, in sorted order, is the one kept
+    paths, hashes = hash_images(list(iter_images(args.folder, args.recursive)), args.method, args.workers)
+    with stage('match'):
+        matches = find_duplicates(hashes, args.threshold)
+
+    groups = set()
+    for input_path, match in zip(paths, matches):
+        if match is None:
+            continue
+        kept, distance = match
+        groups.add(kept)
+        action = 'Dropped' if args.drop else 'Duplicate'
+        print(f"{action}: {os.path.relpath(input_path, args.folder)} ~ {os.path.relpath(paths[kept], args.folder)} (distance {distance})")
+        if args.drop:
+            drop_duplicate(args.folder, input_path)
+
+    duplicates = sum(match is not None for match in matches)
+    print(f"{len(paths)} image(s) checked, {duplicates} near-duplicate(s) of {len(groups)} image(s)")
+
+if __name__ == '__main__':
+    main()
@@ -2,99 +2,120 @@
 
 import os
 import argparse
-from PIL import Image
-import mediapipe as mp
-import numpy as np
-from pillow_heif import register_heif_opener
 import re
+from imagekit.io import iter_images, decode_image
+from imagekit.encode import OUTPUT_EXTENSIONS, OutputEncoder, add_encoder_arguments, encoding_from_args, encoding_variant
+from imagekit.manifest import Manifest
+from imagekit.cache import open_detection_cache, default_detection_cache_path
+from imagekit.detection import create_face_detector, detect_image_file
+from imagekit.tiling import create_tiled_detector, tiling_variant
+from imagekit.geometry import boxes_from_detections, square_crop_boxes
+from imagekit.resize import RESIZE_MODES, crop_reduce_factor, resize_square
+from imagekit.profiling import stage, item as profile_item, add_profile_arguments, start_profile
 
-# Register HEIF opener with Pillow
-register_heif_opener()
-
-def detect_faces(input_path, output_path, size=512):
+def detect_faces(input_path, face_detection, size=512, proxy_size=None, resize='fast', padding=0.2, cache=None):
     """
-    Process a single image by detecting faces and saving each face as a square image.
+    Detect every face in a single image and return each one as a square crop.
+    The image is decoded once and the detector runs once, however many faces it contains.
     Preserves original image orientation.
     
     Args:
         input_path (str): Path to the input image
-        output_path (str): Path where the processed face image will be saved
-        size (int): Target size for the square image (default: 512)
+        face_detection: Detector from create_face_detector(), shared across images
+        size (int): Target size for the square images (default: 512)
+        proxy_size (int): If set, detect on a proxy decoded with this maximum side and
+            only decode the full image when a face was found (default: None)
+        resize (str): 'fast' or 'exact', see imagekit.resize.resize_square. With a
+            proxy, 'fast' also decodes the full image at a reduced JPEG/HEIF scale
+            that is still large enough for every crop (default: 'fast')
+        padding (float): Padding on each side of the face, relative to its larger side (default: 0.2)
+        cache (DetectionCache): Detection cache; on a hit the detector is not run (default: None)
+    
+    Returns:
+        list: One PIL image per detected face, in detection order
     """
     try:
-        # Initialize MediaPipe Face Detection
-        mp_face_detection = mp.solutions.face_detection
-        face_detection = mp_face_detection.FaceDetection(
-            model_selection=1,  # Use the full model for better accuracy
-            min_detection_confidence=0.5
-        )
-        
-        # Read the image
-        image = np.array(Image.open(input_path))
-        
-        # Convert the image to RGB if it's not
-        if image.shape[2] == 4:  # If image has alpha channel
-            image = image[:, :, :3]
+        # Read the image once and detect faces once, unless the cache already knows them
+        detections, (w, h), image = detect_image_file(face_detection, input_path, proxy_size, cache)
         
-        # Detect faces
-        results = face_detection.process(image)
-        
-        if not results.detections:
+        if not detections:
             print(f"No faces found in {os.path.basename(input_path)}")
-            return
+            return []
         
-        # Process each face found in the image
-        for i, detection in enumerate(results.detections):
-            # Get the bounding box
-            bbox = detection.location_data.relative_bounding_box
-            h, w, _ = image.shape
-            
-            # Convert relative coordinates to absolute
-            x = int(bbox.xmin * w)
-            y = int(bbox.ymin * h)
-            width = int(bbox.width * w)
-            height = int(bbox.height * h)
-            
-            # Add padding around the face
-            padding = int(max(width, height) * 0.2)  # 20% padding
-            
-            # Calculate the square crop dimensions
-            crop_size = max(width, height) + (padding * 2)
-            
-            # Calculate the center of the face
-            center_x = x + width // 2
-            center_y = y + height // 2
-            
-            # Calculate the crop coordinates with padding
-            crop_left = max(0, center_x - crop_size // 2)
-            crop_top = max(0, center_y - crop_size // 2)
-            crop_right = min(w, crop_left + crop_size)
-            crop_bottom = min(h, crop_top + crop_size)
-            
-            # Ensure the crop is square
-            crop_size = min(crop_right - crop_left, crop_bottom - crop_top)
-            crop_right = crop_left + crop_size
-            crop_bottom = crop_top + crop_size
-            
-            # Crop the face
-            face_image = Image.fromarray(image[crop_top:crop_bottom, crop_left:crop_right])
-            
-            # Resize the face image
-            face_image = face_image.resize((size, size), Image.Resampling.LANCZOS)
+        # Square crops with padding around each face, at full resolution
+        with stage('crop'):
+            crop_boxes = square_crop_boxes(boxes_from_detections(detections), w, h, 'anchor', padding=padding)
+        
+        # Crop every face from the same decoded image
+        if image is None:
+            image = decode_image(input_path, max_reduce=crop_reduce_factor(crop_boxes, size) if resize == 'fast' else 1)
+        scale_x = image.width / w
+        scale_y = image.height / h
+        faces = []
+        for i, (crop_left, crop_top, crop_right, crop_bottom) in enumerate(crop_boxes.tolist()):
+            if crop_right <= crop_left:
+                print(f"Skipping empty crop for face {i+1} in {os.path.basename(input_path)}")
+                continue
             
-            # Save the face image
-            face_image.save(output_path, quality=95)
-            print(f"Processed face {i+1} from {os.path.basename(input_path)} -> {os.path.basename(output_path)}")
+            # Resize the face, mapping the box onto a reduced-scale decode if there was one
+            if (scale_x, scale_y) != (1, 1):
+                crop_left, crop_right = crop_left * scale_x, crop_right * scale_x
+                crop_top, crop_bottom = crop_top * scale_y, crop_bottom * scale_y
+            faces.append(resize_square(image, (crop_left, crop_top, crop_right, crop_bottom), size, resize))
+        
+        return faces
             
     except Exception as e:
         print(f"Error processing {input_path}: {str(e)}")
+        return []
 
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description='Process images by detecting and cropping faces.')
     parser.add_argument('--size', type=int, default=512,
                       help='Target size for the square image (default: 512)')
+    parser.add_argument('--proxy_size', type=int, default=None,
+                      help='Detect faces on a reduced-size decode with this maximum side, e.g. 1024 (default: full resolution)')
+    parser.add_argument('--force', action='store_true',
+                      help='Reprocess every input, ignoring the manifest in the output folder')
+    parser.add_argument('--padding', type=float, default=0.2,
+                      help='Padding on each side of a face, relative to its larger side (default: 0.2)')
+    parser.add_argument('--cache_path', type=str, default=default_detection_cache_path(),
+                      help='Detection cache shared across runs and scripts (default: ~/.cache/imagekit/detections.sqlite)')
+    parser.add_argument('--cache_entries', type=int, default=100000,
+                      help='Maximum number of cached detections, least recently used are evicted (default: 100000)')
+    parser.add_argument('--no_cache', action='store_true',
+                      help='Run the detector on every image without reading or writing the detection cache')
+    parser.add_argument('--resize', type=str, default='fast', choices=RESIZE_MODES,
+                      help='fast: integer reduce (and reduced-scale decode with --proxy_size) before LANCZOS; exact: LANCZOS over the full crop (default: fast)')
+    parser.add_argument('--recursive', action='store_true',
+                      help='Also process images in subfolders of the input folder')
+    parser.add_argument('--tile_size', type=int, default=None,
+                      help='Also detect on overlapping tiles of this side at several scales, for small faces in very large images, e.g. 1024 (default: single pass)')
+    parser.add_argument('--tile_overlap', type=int, default=128,
+                      help='Pixels shared by neighbouring tiles; faces smaller than this are never cut (default: 128)')
+    parser.add_argument('--tile_scales', type=int, default=2,
+                      help='Most scales tiled, halving the image each time (default: 2)')
+    parser.add_argument('--tile_workers', type=int, default=0,
+                      help='Processes detecting tiles in batches (default: 0, in-process)')
+    add_encoder_arguments(parser)
+    add_profile_arguments(parser)
     args = parser.parse_args()
+    start_profile(args, 'detect_faces')
+    encoding = encoding_from_args(args)
+    try:
+        encoder = OutputEncoder(**encoding)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+
+    tiling = None
+    if args.tile_size:
+        if not 0 <= args.tile_overlap < args.tile_size:
+            print(f"Error: --tile_overlap must be between 0 and --tile_size ({args.tile_size})")
+            return
+        tiling = {'tile_size': args.tile_size, 'overlap': args.tile_overlap, 'max_scales': args.tile_scales,
+                  'workers': args.tile_workers}
     
     # Create output directory if it doesn't exist
     os.makedirs('output', exist_ok=True)
@@ -103,58 +124,69 @@ def main():
     input_dir = 'input'
     output_dir = 'output'
     
-    # Supported image formats
-    image_extensions = ('.jpg', '.JPG', '.jpeg', '.png', '.PNG', '.bmp', '.gif', '.heic', '.HEIC', '.heif')
-    
-    # Get all image files and sort them
-    image_files = [f for f in os.listdir(input_dir) 
-                  if f.lower().endswith(image_extensions)]
-    image_files.sort()
+    # Skip inputs the manifest says are unchanged; drop outputs of changed or deleted sources
+    manifest = Manifest(os.path.abspath(output_dir))
+    params = {'crop': 'padded', 'padding': args.padding, 'size': args.size, 'proxy_size': args.proxy_size, 'model_selection': 1, 'min_detection_confidence': 0.5, 'resize': args.resize}
+    if tiling:
+        # Only recorded with tiling, so existing manifests stay current
+        params['tiling'] = tiling_variant(tiling)
+    if encoding_variant(encoding):
+        params['encoding'] = encoding_variant(encoding)
+    # Images are recognised by content, not extension
+    input_paths = list(iter_images(os.path.abspath(input_dir), args.recursive))
+    manifest.discard_missing(os.path.abspath(input_dir), input_paths)
+    pending = []
+    for input_path in input_paths:
+        if args.force or not manifest.is_current(input_path, params):
+            manifest.discard(input_path)
+            pending.append(input_path)
+    print(f"{len(input_paths) - len(pending)} unchanged image(s) skipped")
     
     # Find the highest existing output file number
-    output_files = [f for f in os.listdir(output_dir) if re.match(r'\d{3}\.jpg$', f)]
+    output_files = [f for f in os.listdir(output_dir) if f.endswith(OUTPUT_EXTENSIONS) and re.match(r'\d{3}\.\w+$', f)]
     if output_files:
         max_num = max(int(os.path.splitext(f)[0]) for f in output_files)
         face_counter = max_num + 1
     else:
         face_counter = 1
     
-    # Initialize MediaPipe Face Detection once
-    mp_face_detection = mp.solutions.face_detection
-    face_detection = mp_face_detection.FaceDetection(
-        model_selection=1,
-        min_detection_confidence=0.5
-    )
+    # Initialize MediaPipe Face Detection once for the whole run
+    face_detection = create_tiled_detector(create_face_detector, (params['model_selection'], params['min_detection_confidence']), tiling)
+    cache = None
+    if not args.no_cache:
+        cache = open_detection_cache(args.cache_path, params['model_selection'], params['min_detection_confidence'],
+                                     args.cache_entries, tiling_variant(tiling))
     
-    # Process each image in the input directory
-    for filename in image_files:
-        input_path = os.path.join(input_dir, filename)
-        
-        try:
-            # Read the image
-            image = np.array(Image.open(input_path))
-            if image.shape[2] == 4:  # If image has alpha channel
-                image = image[:, :, :3]
-            
-            # Detect faces
-            results = face_detection.process(image)
-            
-            # Skip if no faces found
-            if not results.detections:
-                print(f"No faces found in {filename}")
-                continue
-            
-            # Process each face in the image
-            for _ in results.detections:
+    # Process each changed image in the input directory
+    try:
+        for input_path in pending:
+            filename = os.path.basename(input_path)
+            outputs = []
+            with profile_item(input_path):
+                faces = detect_faces(input_path, face_detection, args.size, args.proxy_size,
+                                     args.resize, args.padding, cache)
+            # The faces of an image are encoded across the encoder's threads
+            saves = []
+            for i, face_image in enumerate(faces):
                 # Create new filename with sequential number
-                new_filename = f"{face_counter:03d}.jpg"  # This will create 001.jpg, 002.jpg, etc.
-                output_path = os.path.join(output_dir, new_filename)
-                detect_faces(input_path, output_path, args.size)
+                new_filename = f"{face_counter:03d}{encoder.extension}"  # This will create 001.jpg, 002.jpg, etc.
+                saves.append((i, new_filename, encoder.submit(face_image, os.path.join(output_dir, new_filename), input_path)))
                 face_counter += 1
-                
-        except Exception as e:
-            print(f"Error processing {filename}: {str(e)}")
-            continue
+            for i, new_filename, future in saves:
+                try:
+                    future.result()
+                    print(f"Processed face {i+1} from {filename} -> {new_filename}")
+                    outputs.append(new_filename)
+                except Exception as e:
+                    print(f"Error saving {new_filename}: {str(e)}")
+            manifest.record(input_path, params, outputs)
+    finally:
+        encoder.close()
+        manifest.save()
+        face_detection.close()
+        if cache is not None:
+            print(f"Detection cache: {cache.hits} hit(s), {cache.misses} miss(es)")
+            cache.close()
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import signal
+import socket
+import argparse
+import itertools
+import threading
+import socketserver
+import numpy as np
+from imagekit.detection import (default_socket_path, make_socket_dir, create_mediapipe_detector, send_message,
+                                recv_message, detection_to_dict, detect_path, attach_shared_memory)
+from imagekit.profiling import stage, item as profile_item, add_profile_arguments, start_profile
+
+# Factory for the warm detectors; a function so it can be swapped, e.g. for benchmarks
+create_detector = create_mediapipe_detector
+
+# Numbers every served image in the profile trace
+_served = itertools.count()
+
+class DetectorPool:
+    """
+    Warm detectors, one per (model_selection, min_detection_confidence), each
+    behind a lock since a MediaPipe graph must not run on two threads at once.
+    """
+    def __init__(self):
+        self.detectors = {}
+        self.lock = threading.Lock()
+
+    def get(self, model_selection, min_detection_confidence):
+        key = (model_selection, min_detection_confidence)
+        with self.lock:
+            if key not in self.detectors:
+                self.detectors[key] = (create_detector(model_selection, min_detection_confidence), threading.Lock())
+            return self.detectors[key]
+
+    def close(self):
+        for detector, _ in self.detectors.values():
+            detector.close()
+
+def detect_items(face_detection, items):
+    """
+    Run the detector over a batch of request items, each either
+    {'path', 'max_side'} or {'shm', 'offset', 'shape'} (an RGB array in shared memory).
+
+    Returns:
+        list: Per item, {'detections': [...]} (plus 'size' for paths) or {'error': message}
+    """
+    results = []
+    blocks = {}
+    try:
+        for item in items:
+            with profile_item(next(_served)):
+                if 'path' in item:
+                    results.append(detect_path(face_detection, item['path'], item.get('max_side')))
+                    continue
+                try:
+                    if item['shm'] not in blocks:
+                        blocks[item['shm']] = attach_shared_memory(item['shm'])
+                    image = np.ndarray(item['shape'], np.uint8, blocks[item['shm']].buf, item['offset'])
+                    with stage('detection'):
+                        detections = face_detection.process(image).detections or []
+                    del image
+                    results.append({'detections': [detection_to_dict(d) for d in detections]})
+                except Exception as e:
+                    results.append({'error': str(e)})
+    finally:
+        for block in blocks.values():
+            block.close()
+    return results
+
+class DetectionHandler(socketserver.BaseRequestHandler):
+    """
+    Serve one client connection: any number of batch requests, answered in order.
+    """
+    def handle(self):
+        while True:
+            try:
+                request = recv_message(self.request)
+            except (ConnectionError, ValueError):
+                return
+            if request is None:
+                return
+            try:
+                face_detection, lock = self.server.detectors.get(request.get('model_selection', 1),
+                                                                 request.get('min_detection_confidence', 0.5))
+                with lock:
+                    results = detect_items(face_detection, request['items'])
+                send_message(self.request, {'results': results})
+            except Exception as e:
+                send_message(self.request, {'results': [{'error': str(e)}] * len(request.get('items', []))})
+
+class DetectionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def remove_stale_socket(socket_path):
+    """
+    Remove a socket file left behind by a service that is no longer running.
+
+    Returns:
+        bool: False if another service is still listening on socket_path
+    """
+    if not os.path.exists(socket_path):
+        return True
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+        return False
+    except OSError:
+        os.remove(socket_path)
+        return True
+    finally:
+        probe.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep face detectors warm and serve detection requests over a Unix socket.')
+    parser.add_argument('--socket', type=str, default=None,
+                        help='Socket path (default: $IMAGEKIT_DETECTOR_SOCKET or a per-user path in the temp directory)')
+    parser.add_argument('--model_selection', type=int, default=1, choices=(0, 1),
+                        help='Model to load at startup: 0 short-range, 1 full-range (default: 1)')
+    parser.add_argument('--min_detection_confidence', type=float, default=0.5,
+                        help='Confidence threshold of the detector loaded at startup (default: 0.5)')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    start_profile(args, 'detection_service')
+
+    socket_path = args.socket or default_socket_path()
+    try:
+        make_socket_dir(socket_path)
+    except PermissionError as e:
+        print(f"Error: {e}")
+        return
+    if not remove_stale_socket(socket_path):
+        print(f"Error: a detection service is already listening on {socket_path}")
+        return
+
+    # The service opens any path it is sent, so only this user may connect. The socket
+    # is created owner-only by bind() itself: a chmod afterwards leaves a window open
+    umask = os.umask(0o177)
+    try:
+        server = DetectionServer(socket_path, DetectionHandler)
+    finally:
+        os.umask(umask)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    server.detectors = DetectorPool()
+    # Load the usual configuration now so the first request is already warm
+    server.detectors.get(args.model_selection, args.min_detection_confidence)
+    print(f"Detection service listening on {socket_path}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.detectors.close()
+        os.remove(socket_path)
+
+if __name__ == '__main__':
+    main()
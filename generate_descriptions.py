@@ -1,83 +1,418 @@
 #!/usr/bin/env python3
 
 import os
+import time
+import random
 import argparse
-import requests
 import base64
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from PIL import Image
-from pillow_heif import register_heif_opener
+from imagekit.cache import CaptionCache
+from imagekit.io import iter_images, decode_image
+from imagekit.watch import add_watch_arguments, create_watcher, print_latency_summary
+from imagekit.profiling import stage, item as profile_item, add_profile_arguments, start_profile
 
-api_key = os.getenv('OPENAI_API_KEY')
-if not api_key:
-    raise ValueError("Please set the OPENAI_API_KEY environment variable")
+API_URL = "https://api.openai.com/v1/chat/completions"
+MODEL = "gpt-4o-mini"
+PROMPT = """Describe the subject of the image in one line, consistently starting with: 'a photo of a person ...'.
+    Include facial expression, head angle or orientation, visible clothing or accessories, and lighting context.
+    For example: 'a photo of a person smiling, looking at camera, wearing a padded coat, indoor lighting'
+    """
 
-# Register HEIF opener with Pillow
-register_heif_opener()
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
 
-def encode_image_to_base64(image_path):
-    with Image.open(image_path) as img:
-        img = img.convert('RGB')
-        from io import BytesIO
-        buffer = BytesIO()
-        img.save(buffer, format='JPEG')
-        return base64.b64encode(buffer.getvalue()).decode('utf-8')
+# Longest wait taken from a Retry-After header, so a large value cannot stall a request thread
+MAX_RETRY_AFTER = 60.0
 
-def generate_description_openai(image_path, reference_token):
-    prompt = f"""Describe the subject of the image in one line, consistently starting with: 'a photo of a person ...'.
-    Include facial expression, head angle or orientation, visible clothing or accessories, and lighting context.
-    For example: 'a photo of a person smiling, looking at camera, wearing a padded coat, indoor lighting'
+# Caption cache kept inside the dataset folder
+CACHE_FILENAME = '.captions.sqlite'
+
+# The model only needs a low-detail view, so payload images are downscaled first
+DEFAULT_MAX_SIDE = 1024
+DEFAULT_QUALITY = 85
+DETAIL_CHOICES = ('low', 'high', 'auto')
+
+def encode_image_to_base64(image, max_side=DEFAULT_MAX_SIDE, quality=DEFAULT_QUALITY):
     """
-    base64_image = encode_image_to_base64(image_path)
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
-    payload = {
-        "model": "gpt-4o-mini",
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-                ]
-            }
-        ],
-        "max_tokens": 300
-    }
+    Encode an image as a base64 JPEG for the vision API payload.
+    
+    Args:
+        image (str or PIL.Image.Image): Path to the image, or an already decoded image
+        max_side (int): Maximum width or height sent; None or 0 keeps the original size (default: 1024)
+        quality (int): JPEG quality (default: 85)
+    """
+    if isinstance(image, Image.Image):
+        with stage('color'):
+            img = image.convert('RGB')
+        if max_side and max(img.size) > max_side:
+            with stage('resize'):
+                img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    else:
+        # Reduced-size decode where the format allows it (JPEG draft, HEIF thumbnail)
+        img = decode_image(image, 'RGB', max_side or None, Image.Resampling.LANCZOS)
+    from io import BytesIO
+    buffer = BytesIO()
+    with stage('encode'):
+        img.save(buffer, format='JPEG', quality=quality)
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+class CaptionClient:
+    """
+    Chat/completions client sharing one pooled HTTP session between threads.
+    Retries 429 and 5xx responses with exponential backoff, honoring Retry-After
+    up to max_retry_after seconds.
+    
+    Args:
+        api_key (str): OpenAI API key
+        api_url (str): Chat/completions endpoint (default: OpenAI)
+        concurrency (int): Maximum number of pooled connections (default: 8)
+        max_retries (int): Retries per image before giving up (default: 5)
+        backoff (float): Base delay in seconds, doubled after every retry (default: 1.0)
+        timeout (float): Per-request timeout in seconds (default: 60)
+        max_side (int): Maximum side of the image sent, see encode_image_to_base64 (default: 1024)
+        quality (int): JPEG quality of the image sent (default: 85)
+        detail (str): Vision detail level, one of 'low', 'high' or 'auto' (default: 'auto')
+        max_retry_after (float): Longest wait honored from a Retry-After header (default: 60)
+    """
+    def __init__(self, api_key, api_url=API_URL, concurrency=8, max_retries=5, backoff=1.0, timeout=60,
+                 max_side=DEFAULT_MAX_SIDE, quality=DEFAULT_QUALITY, detail='auto', max_retry_after=MAX_RETRY_AFTER):
+        self.api_url = api_url
+        self.max_side = max_side
+        self.quality = quality
+        self.detail = detail
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_retry_after = max_retry_after
+        # Imported here so that --help and cache-only runs skip loading requests
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.requests = requests
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        })
+
+    def _retry_delay(self, attempt, response=None):
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return min(max(0.0, float(retry_after)), self.max_retry_after)
+                except ValueError:
+                    pass
+        # Exponential backoff with jitter so parallel threads do not retry in lockstep
+        return self.backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+
+    def describe(self, image):
+        """
+        Request a one-line description of an image, raising if every attempt fails.
+        
+        Args:
+            image (str or PIL.Image.Image): Path to the image, or an already decoded image
+        """
+        payload = {
+            "model": MODEL,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": PROMPT},
+                        {"type": "image_url", "image_url": {
+                            "url": f"data:image/jpeg;base64,{encode_image_to_base64(image, self.max_side, self.quality)}",
+                            "detail": self.detail
+                        }}
+                    ]
+                }
+            ],
+            "max_tokens": 300
+        }
+        for attempt in range(self.max_retries + 1):
+            try:
+                with stage('api'):
+                    response = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+            except (self.requests.ConnectionError, self.requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._retry_delay(attempt))
+                continue
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                time.sleep(self._retry_delay(attempt, response))
+                continue
+            response.raise_for_status()
+            return response.json()["choices"][0]["message"]["content"].strip()
+
+    def close(self):
+        self.session.close()
+
+def generate_description_openai(image_path, reference_token, client):
+    description = _describe_or_none(image_path, client)
+    if description is None:
+        return f"{reference_token}, Error generating description"
+    return f"{reference_token}, {description}"
+
+def _describe_or_none(image_path, client, load=None):
     try:
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-        response.raise_for_status()
-        description = response.json()["choices"][0]["message"]["content"].strip()
-        return f"{reference_token}, {description}"
+        with profile_item(image_path):
+            return client.describe(load(image_path) if load else image_path)
     except Exception as e:
         print(f"Error processing {image_path}: {str(e)}")
-        return f"{reference_token}, Error generating description"
+        return None
+
+def caption_images(image_paths, client, concurrency=8, load=None):
+    """
+    Describe many images concurrently.
+    
+    Args:
+        image_paths (list): Paths of the images to describe
+        client (CaptionClient): Shared client
+        concurrency (int): Maximum number of requests in flight (default: 8)
+        load (callable): Turns each item of image_paths into the image passed to
+            CaptionClient.describe, on the request thread (default: None, items are paths)
+    
+    Yields:
+        tuple: (image_path, description) in completion order; description is None if the request failed
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(_describe_or_none, image_path, client, load): image_path
+                   for image_path in image_paths}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+def write_description(image_path, reference_token, description):
+    output_path = f"{os.path.splitext(image_path)[0]}.txt"
+    with profile_item(image_path), stage('write'), open(output_path, 'w') as f:
+        f.write(f"{reference_token}, {description}")
+
+def describe_images(image_paths, reference_token, client, concurrency=8, cache=None, cache_params=()):
+    """
+    Write a description next to each image, from the cache or from the API.
+    Cache hits skip both encoding and the API call.
+    
+    Args:
+        image_paths (list): Paths of the images to describe
+        reference_token (str): Prefix of every description
+        client (CaptionClient): Shared client
+        concurrency (int): Maximum number of requests in flight (default: 8)
+        cache (CaptionCache): Caption cache (default: None)
+        cache_params (tuple): Request parameters that are part of the cache key (default: ())
+    
+    Yields:
+        str: Path of each image once its description is written, cached ones first.
+        Images whose request failed get no description and are not yielded
+    """
+    pending = {}
+    for input_path in image_paths:
+        if cache is None:
+            pending[input_path] = None
+            continue
+        key = cache.key(input_path, PROMPT, MODEL, *cache_params)
+        description = cache.get(key)
+        if description is None:
+            pending[input_path] = key
+        else:
+            write_description(input_path, reference_token, description)
+            print(f"Cached description for {os.path.basename(input_path)}")
+            yield input_path
+
+    print(f"Processing {len(pending)} images with up to {concurrency} concurrent requests...")
+    # Each description is written as soon as its request completes
+    for input_path, description in caption_images(list(pending), client, concurrency):
+        if description is None:
+            # No error caption: it would pass for a description, in shards too, until overwritten
+            print(f"Failed to describe {os.path.basename(input_path)}, no description written; it is retried on the next run")
+            continue
+        write_description(input_path, reference_token, description)
+        if cache is not None:
+            cache.put(pending[input_path], description, MODEL)
+        print(f"Generated description for {os.path.basename(input_path)}")
+        yield input_path
+
+def watch_images(watcher, reference_token, client, concurrency=8, cache=None, cache_params=()):
+    """
+    Describe images as they arrive in a watched folder, with the client's
+    connections kept open between them, until interrupted.
+    
+    Args:
+        watcher (FolderWatcher): Watcher of the folder
+        Other arguments: see describe_images
+    
+    Returns:
+        list: Seconds from the arrival of each described image to its description being written
+    """
+    print(f"Watching {watcher.folder} for new images ({watcher.method}), press Ctrl+C to stop")
+    latencies = []
+    try:
+        for batch in watcher.batches():
+            arrivals = {input_path: arrival for input_path, arrival in batch
+                        if not os.path.basename(input_path).startswith('gray_')}
+            if not arrivals:
+                continue
+            for input_path in describe_images(list(arrivals), reference_token, client, concurrency, cache, cache_params):
+                latency = time.monotonic() - arrivals[input_path]
+                latencies.append(latency)
+                print(f"Latency: {os.path.basename(input_path)} described {latency:.2f} s after it arrived")
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    return latencies
+
+def caption_packed(dataset, reference_token, client, concurrency=8, cache=None, cache_params=()):
+    """
+    Caption every sample of a packed dataset that has no caption yet. Samples are
+    read straight from the memory-mapped array and cached by their pixels; failed
+    samples are left uncaptioned so the next run retries them.
+    
+    Args:
+        dataset (PackedDataset): Dataset opened for writing
+        reference_token (str): Prefix of every caption
+        client (CaptionClient): Shared client
+        concurrency (int): Maximum number of requests in flight (default: 8)
+        cache (CaptionCache): Caption cache (default: None)
+        cache_params (tuple): Request parameters that are part of the cache key (default: ())
+    """
+    images = dataset.images()
+    pending = {}
+    for index in dataset.valid_indices().tolist():
+        if index in dataset.captions:
+            continue
+        if cache is None:
+            pending[index] = None
+            continue
+        key = cache.pixels_key(images[index], PROMPT, MODEL, *cache_params)
+        description = cache.get(key)
+        if description is None:
+            pending[index] = key
+        else:
+            dataset.set_caption(index, f"{reference_token}, {description}")
+            print(f"Cached description for sample {index}")
+
+    print(f"Processing {len(pending)} samples with up to {concurrency} concurrent requests...")
+    for index, description in caption_images(list(pending), client, concurrency,
+                                             lambda index: Image.fromarray(images[index])):
+        if description is None:
+            continue
+        with profile_item(index), stage('write'):
+            dataset.set_caption(index, f"{reference_token}, {description}")
+        if cache is not None:
+            cache.put(pending[index], description, MODEL)
+        print(f"Generated description for sample {index}")
+
+def caption_cache_params(args):
+    """
+    Request parameters that change what the model sees, for the caption cache key.
+    The JPEG quality is only included when not the default, so existing caches stay valid.
+    
+    Args:
+        args (argparse.Namespace): Parsed command line arguments
+        
+    Returns:
+        tuple: Cache key parameters
+    """
+    params = (args.detail, args.max_side)
+    if args.quality != DEFAULT_QUALITY:
+        params += (args.quality,)
+    return params
+
+def print_cache_stats(cache):
+    stats = cache.stats()
+    print(f"Cache: {stats['entries']} entries, {stats['size_bytes'] / 1024:.0f} KiB, "
+          f"{stats['hits']} hits, {stats['misses']} misses this run")
 
 def main():
     parser = argparse.ArgumentParser(description='Generate detailed descriptions for images using OpenAI Vision API.')
     parser.add_argument('folder', type=str, help='Path to the folder containing images')
     parser.add_argument('--token', type=str, required=True, help='Reference token to prefix descriptions')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='Maximum number of API requests in flight (default: 8)')
+    parser.add_argument('--max_retries', type=int, default=5,
+                        help='Retries for rate-limited or failed requests (default: 5)')
+    parser.add_argument('--max_side', type=int, default=DEFAULT_MAX_SIDE,
+                        help=f'Downscale images so the longest side sent is at most this; 0 sends full size (default: {DEFAULT_MAX_SIDE})')
+    parser.add_argument('--quality', type=int, default=DEFAULT_QUALITY,
+                        help=f'JPEG quality of the images sent (default: {DEFAULT_QUALITY})')
+    parser.add_argument('--detail', type=str, default='auto', choices=DETAIL_CHOICES,
+                        help='Vision detail level requested from the API (default: auto)')
+    parser.add_argument('--no_cache', action='store_true',
+                        help=f'Do not read or write the caption cache ({CACHE_FILENAME} in the folder)')
+    parser.add_argument('--cache_stats', action='store_true',
+                        help='Print caption cache statistics and exit')
+    parser.add_argument('--prune_days', type=float, default=None,
+                        help='Before running, drop cache entries unused for this many days')
+    parser.add_argument('--recursive', action='store_true',
+                        help='Also describe images in subfolders')
+    parser.add_argument('--packed', action='store_true',
+                        help='The folder is a packed dataset written by crop_faces_new.py --packed; captions are stored in it')
+    add_watch_arguments(parser)
+    add_profile_arguments(parser)
     args = parser.parse_args()
+    start_profile(args, 'generate_descriptions')
 
     if not os.path.isdir(args.folder):
         print(f"Error: {args.folder} is not a valid directory")
         return
+    if args.watch and (args.packed or args.cache_stats):
+        print("Error: --watch describes images arriving in a folder, it cannot be combined with --packed or --cache_stats")
+        return
+
+    cache = None if args.no_cache else CaptionCache(os.path.join(args.folder, CACHE_FILENAME))
+    cache_params = caption_cache_params(args)
+    if cache is not None and args.prune_days is not None:
+        print(f"Pruned {cache.prune(args.prune_days)} cache entries unused for {args.prune_days:g} days")
+    if args.cache_stats:
+        if cache is not None:
+            print_cache_stats(cache)
+            cache.close()
+        return
 
-    image_extensions = ('.jpg', '.JPG', '.jpeg', '.png', '.PNG', '.bmp', '.gif', '.heic', '.HEIC', '.heif')
-    image_files = [f for f in os.listdir(args.folder) if f.lower().endswith(image_extensions)]
-    image_files.sort()
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        raise ValueError("Please set the OPENAI_API_KEY environment variable")
 
-    for filename in image_files:
-        if filename.startswith('gray_'):
-            continue
-        input_path = os.path.join(args.folder, filename)
-        output_path = os.path.join(args.folder, f"{os.path.splitext(filename)[0]}.txt")
-        print(f"Processing {filename}...")
-        description = generate_description_openai(input_path, args.token)
-        with open(output_path, 'w') as f:
-            f.write(description)
-        print(f"Generated description for {filename}")
+    if args.packed:
+        # Imported here so that folder runs do not load NumPy
+        from imagekit.packed import PackedDataset
+        try:
+            dataset = PackedDataset(args.folder, writable=True)
+        except (ValueError, OSError) as e:
+            print(f"Error: Cannot open packed dataset '{args.folder}': {e}")
+            return
+        client = CaptionClient(api_key, concurrency=args.concurrency, max_retries=args.max_retries,
+                               max_side=args.max_side, quality=args.quality, detail=args.detail)
+        try:
+            caption_packed(dataset, args.token, client, args.concurrency, cache, cache_params)
+        finally:
+            client.close()
+            dataset.close()
+            if cache is not None:
+                print_cache_stats(cache)
+                cache.close()
+        return
+
+    # Watching starts before the listing, so images arriving meanwhile are not missed
+    watcher = create_watcher(args, args.folder)
+    image_paths = [path for path in iter_images(args.folder, args.recursive)
+                   if not os.path.basename(path).startswith('gray_')]
+
+    client = CaptionClient(api_key, concurrency=args.concurrency, max_retries=args.max_retries,
+                           max_side=args.max_side, quality=args.quality, detail=args.detail)
+    try:
+        for _ in describe_images(image_paths, args.token, client, args.concurrency, cache, cache_params):
+            pass
+        if watcher is not None:
+            print_latency_summary(watch_images(watcher, args.token, client, args.concurrency, cache,
+                                               cache_params))
+    finally:
+        client.close()
+        if watcher is not None:
+            watcher.close()
+        if cache is not None:
+            print_cache_stats(cache)
+            cache.close()
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
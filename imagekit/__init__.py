@@ -0,0 +1 @@
+"""Shared helpers for the image-toolkit scripts."""
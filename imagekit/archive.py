@@ -0,0 +1,437 @@
+import io
+import os
+import re
+import json
+import time
+import tarfile
+import zipfile
+import threading
+import posixpath
+from contextlib import contextmanager
+
+# Bytes read to tell an archive from other files: a tar header is one 512-byte block
+ARCHIVE_SNIFF_BYTES = 512
+
+# Leading bytes of the compressions tarfile reads transparently
+COMPRESSED_MAGIC = (b'\x1f\x8b', b'BZh', b'\xfd7zXZ\x00')
+
+# Archive handles of the current process, see _handle
+_handles = {}
+_handles_pid = None
+_handles_lock = threading.Lock()
+
+class ArchiveMember(str):
+    """
+    An image inside a zip or tar archive, usable wherever the scripts expect an
+    image path. The string is a virtual path, the archive's path joined with the
+    member's name, so manifests, caches and messages treat members like files.
+    Bytes are read from the archive on demand and never extracted to disk: zip
+    members through zipfile, uncompressed tar members straight from their offset.
+    Members of compressed tars, which can only be read front to back, carry
+    their bytes instead. Members pickle to worker processes, which open the
+    archive themselves.
+
+    Args:
+        archive (str): Path of the archive
+        name (str): Name of the member in the archive
+        size (int): Size of the member in bytes
+        mtime_ns (int): Modification time recorded in the archive, in nanoseconds
+        offset (int): Offset of an uncompressed tar member's data (default: None, a zip member)
+        data (bytes): Bytes of a streamed member (default: None)
+    """
+    def __new__(cls, archive, name, size, mtime_ns, offset=None, data=None):
+        member = super().__new__(cls, os.path.join(archive, *_safe_name(name).split('/')))
+        member.archive = archive
+        member.name = name
+        member.size = size
+        member.mtime_ns = mtime_ns
+        member.offset = offset
+        member.data = data
+        member.format = None
+        member.caption_member = None
+        return member
+
+    def __getnewargs__(self):
+        return self.archive, self.name, self.size, self.mtime_ns, self.offset, self.data
+
+    def open(self):
+        """
+        Open the member for reading.
+
+        Returns:
+            A binary file object, seekable for zip and tar members
+        """
+        if self.data is not None:
+            return io.BytesIO(self.data)
+        if self.offset is not None:
+            return io.BufferedReader(_TarMemberFile(_handle(self.archive, 'tar'), self.offset, self.size))
+        return _handle(self.archive, 'zip').open(self.name)
+
+    def read(self):
+        with self.open() as f:
+            return f.read()
+
+    @property
+    def caption(self):
+        """
+        Text of the member with the same name and a .txt extension, e.g. a
+        WebDataset sample's caption, or None.
+        """
+        if self.caption_member is None:
+            return None
+        return self.caption_member.read().decode('utf-8').strip()
+
+class _TarMemberFile(io.RawIOBase):
+    # The bytes of one member of an uncompressed tar, read with pread so threads share the descriptor
+    def __init__(self, fd, offset, size):
+        self.fd = fd
+        self.start = offset
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(0, offset)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def readinto(self, buffer):
+        count = max(0, min(len(buffer), self.size - self.position))
+        if count == 0:
+            return 0
+        data = os.pread(self.fd, count, self.start + self.position)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+def _handle(archive, kind):
+    # Handles are opened once per process: after a fork, a zip file's shared offset would be raced
+    global _handles_pid
+    with _handles_lock:
+        if _handles_pid != os.getpid():
+            _handles.clear()
+            _handles_pid = os.getpid()
+        handle = _handles.get(archive)
+        if handle is None:
+            handle = zipfile.ZipFile(archive) if kind == 'zip' else os.open(archive, os.O_RDONLY)
+            _handles[archive] = handle
+        return handle
+
+def archive_format(path):
+    """
+    Identify an archive by its leading bytes rather than its extension.
+
+    Returns:
+        str: 'zip', 'tar', 'compressed_tar' (gzip, bzip2 or xz) or None
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(ARCHIVE_SNIFF_BYTES)
+    except OSError:
+        return None
+    if head[:4] in (b'PK\x03\x04', b'PK\x05\x06'):
+        return 'zip' if zipfile.is_zipfile(path) else None
+    if head[257:262] == b'ustar':
+        return 'tar'
+    if head.startswith(COMPRESSED_MAGIC):
+        try:
+            with tarfile.open(path, 'r:*') as archive:
+                archive.next()
+            return 'compressed_tar'
+        except (tarfile.TarError, OSError, EOFError):
+            return None
+    return None
+
+def _skipped(name):
+    # Hidden files and folders, like in folder listings, and the metadata macOS adds to zips
+    parts = name.split('/')
+    return any(part.startswith('.') or part == '__MACOSX' for part in parts)
+
+def _safe_name(name):
+    # Normalized member name, or None for names that would escape the archive's virtual folder
+    name = posixpath.normpath(name)
+    if name.startswith('/') or name in ('.', '..') or name.startswith('../'):
+        return None
+    return name
+
+def _zip_members(path):
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            mtime_ns = int(time.mktime(info.date_time + (0, 0, -1))) * 10**9
+            yield info.filename, info.file_size, mtime_ns, None, None
+
+def _tar_members(path, stream):
+    # Without stream, tarfile seeks from header to header and no data is read
+    with tarfile.open(path, 'r|*' if stream else 'r:') as archive:
+        for info in archive:
+            if not info.isreg():
+                continue
+            data = archive.extractfile(info).read() if stream else None
+            yield info.name, info.size, int(info.mtime) * 10**9, None if stream else info.offset_data, data
+
+def _sniff_member(member):
+    from imagekit.io import SNIFF_BYTES, sniff_image_bytes
+    if member.data is not None:
+        return sniff_image_bytes(member.data[:SNIFF_BYTES])
+    with member.open() as f:
+        return sniff_image_bytes(f.read(SNIFF_BYTES))
+
+def iter_archive_images(path, stream=False):
+    """
+    Yield the images in a zip or tar archive as ArchiveMember paths, in archive
+    order so the archive is read sequentially, recognised by content. Hidden
+    members are skipped. A member named like an image but with a .txt extension
+    is attached to it as its caption.
+
+    Zips and uncompressed tars are listed from their headers. A compressed tar
+    has no index and can only be read front to back, so it is refused unless
+    stream is set, in which case members are read as they are yielded; the
+    caption of a streamed image must then directly follow or precede it, as in
+    WebDataset shards.
+
+    Args:
+        path (str): Path of the archive
+        stream (bool): Accept compressed tars, reading them once front to back (default: False)
+
+    Yields:
+        ArchiveMember: Each image in the archive
+    """
+    kind = archive_format(path)
+    if kind is None:
+        raise ValueError(f"{path} is not a zip or tar archive")
+    if kind == 'compressed_tar' and not stream:
+        raise ValueError(f"{path} is a compressed tar, which can only be read front to back; "
+                         f"decompress it to a .tar or repack it as a .zip")
+    entries = _zip_members(path) if kind == 'zip' else _tar_members(path, kind == 'compressed_tar')
+
+    def members():
+        for name, size, mtime_ns, offset, data in entries:
+            safe_name = _safe_name(name)
+            if safe_name is not None and not _skipped(safe_name):
+                yield ArchiveMember(path, name, size, mtime_ns, offset, data)
+
+    if kind == 'compressed_tar':
+        yield from _with_adjacent_captions(members())
+    else:
+        yield from _with_captions(list(members()))
+
+def _with_captions(members):
+    captions = {posixpath.splitext(member.name)[0]: member for member in members
+                if member.name.lower().endswith('.txt')}
+    for member in members:
+        if member.name.lower().endswith('.txt'):
+            continue
+        member.format = _sniff_member(member)
+        if member.format is None:
+            continue
+        member.caption_member = captions.get(posixpath.splitext(member.name)[0])
+        yield member
+
+def _with_adjacent_captions(members):
+    # Streamed: only the members of the current sample, those sharing a name up to the extension, are held
+    group = []
+    for member in members:
+        if group and posixpath.splitext(member.name)[0] != posixpath.splitext(group[0].name)[0]:
+            yield from _with_captions(group)
+            group = []
+        group.append(member)
+    yield from _with_captions(group)
+
+@contextmanager
+def open_source(path):
+    """
+    Give what Pillow should open for an image path: a file object for an
+    archive member, the path itself otherwise.
+    """
+    if isinstance(path, ArchiveMember):
+        with path.open() as f:
+            yield f
+    else:
+        yield path
+
+def source_stat(path):
+    """
+    Return (size, mtime_ns) of an image file or archive member.
+    """
+    if isinstance(path, ArchiveMember):
+        return path.size, path.mtime_ns
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+def source_caption(path):
+    """
+    Return the caption of an image: its caption member inside an archive, or
+    the text of a .txt file next to it as generate_descriptions.py writes them,
+    or None.
+    """
+    if isinstance(path, ArchiveMember):
+        return path.caption
+    try:
+        with open(f"{os.path.splitext(path)[0]}.txt", encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+# Shard files, numbered shard-000000.tar, shard-000001.tar, ...
+SHARD_PATTERN = re.compile(r'shard-(\d{6})\.tar$')
+PARTIAL_SUFFIX = '.partial'
+FLUSHED_SUFFIX = '.flushed'
+
+# Keys of samples removed from the shards, one per line
+REMOVED_FILENAME = 'removed.txt'
+
+TAR_BLOCK = 512
+
+class ShardWriter:
+    """
+    Write samples into WebDataset-style tar shards of at most shard_size
+    samples: uncompressed tars in which each sample's files share a key and
+    differ by extension, e.g. 000003_000017.jpg next to 000003_000017.txt,
+    which WebDataset and other streaming loaders read as one sample. The shard
+    being filled is a .partial file, renamed once complete, so loaders only ever
+    see whole shards; the partial shard of an interrupted run is cut back to its
+    last flush() and completed when the directory is opened again.
+    Later runs start new shards after the existing ones.
+
+    Shards are never rewritten: removing a sample appends its key to
+    removed.txt, for loaders to filter on.
+
+    Args:
+        path (str): Directory of the shards, created if needed
+        shard_size (int): Samples per shard (default: 1000)
+    """
+    def __init__(self, path, shard_size=1000):
+        if shard_size < 1:
+            raise ValueError(f"The shard size must be positive, got {shard_size}")
+        self.path = path
+        self.shard_size = shard_size
+        os.makedirs(path, exist_ok=True)
+        for name in sorted(os.listdir(path)):
+            if name.endswith(PARTIAL_SUFFIX) and SHARD_PATTERN.match(name[:-len(PARTIAL_SUFFIX)]):
+                self._recover(os.path.join(path, name))
+        numbers = [int(match.group(1)) for match in map(SHARD_PATTERN.match, os.listdir(path)) if match]
+        self.shard = max(numbers) + 1 if numbers else 0
+        self.shards_written = 0
+        self.samples_written = 0
+        self.count = 0
+        self._tar = None
+
+    def _shard_path(self, shard):
+        return os.path.join(self.path, f"shard-{shard:06d}.tar")
+
+    def _recover(self, partial_path):
+        # Keep what the last flush made durable, then end the tar properly; without a flush nothing is kept
+        flushed_path = partial_path + FLUSHED_SUFFIX
+        try:
+            with open(flushed_path) as f:
+                length = int(f.read())
+        except (OSError, ValueError):
+            length = 0
+        shard_path = partial_path[:-len(PARTIAL_SUFFIX)]
+        if length > 0:
+            with open(partial_path, 'r+b') as f:
+                f.truncate(length)
+                f.seek(length)
+                f.write(b'\0' * 2 * TAR_BLOCK)
+            os.replace(partial_path, shard_path)
+            print(f"Recovered {os.path.basename(shard_path)} from an interrupted run")
+        else:
+            os.remove(partial_path)
+        if os.path.exists(flushed_path):
+            os.remove(flushed_path)
+
+    def write(self, files):
+        """
+        Append one sample.
+
+        Args:
+            files (dict): Extension (e.g. 'jpg', 'txt', 'json') -> bytes or str of each file
+
+        Returns:
+            str: Key of the sample, unique across the directory
+        """
+        if self._tar is None:
+            self._tar = tarfile.open(self._shard_path(self.shard) + PARTIAL_SUFFIX, 'w', format=tarfile.USTAR_FORMAT)
+            self.count = 0
+        key = f"{self.shard:06d}_{self.count:06d}"
+        now = int(time.time())
+        for extension, data in files.items():
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            info = tarfile.TarInfo(f"{key}.{extension}")
+            info.size = len(data)
+            info.mtime = now
+            info.mode = 0o644
+            self._tar.addfile(info, io.BytesIO(data))
+        self.count += 1
+        self.samples_written += 1
+        if self.count >= self.shard_size:
+            self._finish()
+        return key
+
+    def _finish(self):
+        self._tar.close()
+        self._tar = None
+        partial_path = self._shard_path(self.shard) + PARTIAL_SUFFIX
+        os.replace(partial_path, self._shard_path(self.shard))
+        if os.path.exists(partial_path + FLUSHED_SUFFIX):
+            os.remove(partial_path + FLUSHED_SUFFIX)
+        self.shard += 1
+        self.shards_written += 1
+
+    def flush(self):
+        """
+        Make the samples written so far durable, e.g. before a manifest refers
+        to them: the open shard is synced to disk and its length recorded, so an
+        interrupted run's partial shard is recovered up to here.
+        """
+        if self._tar is None:
+            return
+        self._tar.fileobj.flush()
+        os.fsync(self._tar.fileobj.fileno())
+        flushed_path = self._shard_path(self.shard) + PARTIAL_SUFFIX + FLUSHED_SUFFIX
+        with open(flushed_path + '.tmp', 'w') as f:
+            f.write(str(self._tar.offset))
+        os.replace(flushed_path + '.tmp', flushed_path)
+
+    def remove(self, key):
+        """
+        Mark a sample as removed in removed.txt.
+        """
+        with open(os.path.join(self.path, REMOVED_FILENAME), 'a') as f:
+            f.write(f"{key}\n")
+
+    def close(self):
+        """
+        Complete the shard being filled, which may hold fewer than shard_size samples.
+        """
+        if self._tar is not None:
+            self._finish()
+
+def sample_metadata(input_path, **fields):
+    """
+    JSON metadata stored with a sample: its source and e.g. the face number.
+    """
+    return json.dumps(dict({'source': str(input_path)}, **fields))
+
+def add_shard_arguments(parser):
+    """
+    Add the tar shard output options shared by the scripts writing images.
+    """
+    parser.add_argument('--shards', type=str, default=None,
+                        help='Write samples into WebDataset-style tar shards in this directory, each image next to its .txt caption if it has one, instead of image files')
+    parser.add_argument('--shard_size', type=int, default=1000,
+                        help='Samples per tar shard (default: 1000)')
@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from imagekit.archive import ArchiveMember
+
+def file_digest(path, *extra):
+    """
+    Hash a file's bytes, optionally together with extra strings such as parameters.
+    
+    Args:
+        path (str): Path to the file, or an ArchiveMember
+        *extra (str): Additional values mixed into the hash
+    
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    with (path.open() if isinstance(path, ArchiveMember) else open(path, 'rb')) as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return _finish_digest(digest, extra)
+
+def data_digest(data, *extra):
+    """
+    Hash an in-memory buffer, e.g. a NumPy array, like file_digest hashes a file.
+    """
+    digest = hashlib.sha256()
+    digest.update(memoryview(data).cast('B'))
+    return _finish_digest(digest, extra)
+
+def _finish_digest(digest, extra):
+    for value in extra:
+        digest.update(b'\0' + str(value).encode('utf-8'))
+    return digest.hexdigest()
+
+class CaptionCache:
+    """
+    Persistent SQLite cache of image descriptions, keyed by a hash of the image
+    bytes, the prompt, the model name and any request parameters that change the answer.
+    
+    Args:
+        db_path (str): Path to the SQLite database, created if missing
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS captions (
+            key TEXT PRIMARY KEY,
+            description TEXT NOT NULL,
+            model TEXT NOT NULL,
+            created REAL NOT NULL,
+            last_used REAL NOT NULL)""")
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(image_path, prompt, model, *params):
+        return file_digest(image_path, prompt, model, *params)
+
+    @staticmethod
+    def pixels_key(pixels, prompt, model, *params):
+        return data_digest(pixels, prompt, model, *params)
+
+    def get(self, key):
+        """
+        Return the cached description for a key, or None on a miss.
+        """
+        row = self.conn.execute("SELECT description FROM captions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute("UPDATE captions SET last_used = ? WHERE key = ?", (time.time(), key))
+        self.conn.commit()
+        return row[0]
+
+    def put(self, key, description, model):
+        now = time.time()
+        self.conn.execute("INSERT OR REPLACE INTO captions VALUES (?, ?, ?, ?, ?)",
+                          (key, description, model, now, now))
+        self.conn.commit()
+
+    def prune(self, max_age_days):
+        """
+        Delete entries that have not been used for more than max_age_days.
+        
+        Returns:
+            int: Number of deleted entries
+        """
+        cutoff = time.time() - max_age_days * 86400
+        deleted = self.conn.execute("DELETE FROM captions WHERE last_used < ?", (cutoff,)).rowcount
+        self.conn.commit()
+        self.conn.execute("VACUUM")
+        return deleted
+
+    def stats(self):
+        """
+        Return entry count, database size and this session's hits and misses.
+        """
+        entries, oldest = self.conn.execute("SELECT COUNT(*), MIN(last_used) FROM captions").fetchone()
+        return {
+            'entries': entries,
+            'size_bytes': self.conn.execute("PRAGMA page_count").fetchone()[0] *
+                          self.conn.execute("PRAGMA page_size").fetchone()[0],
+            'oldest_last_used': oldest,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def close(self):
+        self.conn.close()
+
+def default_detection_cache_path():
+    """
+    Per-user location of the detection cache, shared by every script and folder.
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'imagekit', 'detections.sqlite')
+
+class DetectionCache:
+    """
+    Persistent SQLite cache of face detections for one detector configuration,
+    keyed by a hash of the image bytes, the detector parameters and the size the
+    detector was run at. Holds at most max_entries entries, evicting the least
+    recently used ones. Safe to open from several processes at once, and to share
+    between the threads of one process.
+    
+    Args:
+        db_path (str): Path to the SQLite database, created if missing
+        model_selection (int): Detector model the entries were produced with
+        min_detection_confidence (float): Detector threshold the entries were produced with
+        max_entries (int): Number of entries kept (default: 100000)
+        variant (str): Any other detector setting the entries depend on, e.g. the
+            tiling, see imagekit.tiling.tiling_variant (default: None)
+    """
+    # Eviction runs after this many insertions, and on close
+    EVICT_EVERY = 256
+
+    def __init__(self, db_path, model_selection, min_detection_confidence, max_entries=100000, variant=None):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        # Without a variant, keys stay those of earlier versions
+        self.params = (model_selection, min_detection_confidence) + ((variant,) if variant else ())
+        self.max_entries = max_entries
+        # One connection shared by threads, e.g. the readers of a pipelined run, under a lock
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.lock = threading.Lock()
+        # WAL lets worker processes read while another one writes
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS detections (
+            key TEXT PRIMARY KEY,
+            detections TEXT NOT NULL,
+            last_used REAL NOT NULL)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS detections_last_used ON detections (last_used)")
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.puts = 0
+
+    def key(self, image_path, detect_size=None):
+        """
+        Cache key of an image, for detection at full resolution or on a proxy with
+        maximum side detect_size.
+        """
+        return file_digest(image_path, *self.params, detect_size)
+
+    def get(self, key):
+        """
+        Return the cached detections for a key as a list of dicts with relative
+        'box', 'score' and 'keypoints', or None on a miss.
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT detections FROM detections WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE detections SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, detections):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO detections VALUES (?, ?, ?)",
+                              (key, json.dumps(detections), time.time()))
+            self.conn.commit()
+            self.puts += 1
+            evict = self.puts % self.EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently used entries beyond max_entries.
+        
+        Returns:
+            int: Number of deleted entries
+        """
+        with self.lock:
+            deleted = self.conn.execute("""DELETE FROM detections WHERE key IN (
+                SELECT key FROM detections ORDER BY last_used DESC LIMIT -1 OFFSET ?)""", (self.max_entries,)).rowcount
+            self.conn.commit()
+        return deleted
+
+    def close(self):
+        self.evict()
+        self.conn.close()
+
+def open_detection_cache(db_path, model_selection, min_detection_confidence, max_entries=100000, variant=None):
+    """
+    Open a DetectionCache, or return None with a warning if it cannot be used,
+    so that detection simply runs uncached.
+    """
+    try:
+        return DetectionCache(db_path, model_selection, min_detection_confidence, max_entries, variant)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Warning: Detection cache {db_path} unavailable, detecting every image: {str(e)}")
+        return None
@@ -0,0 +1,156 @@
+import os
+import numpy as np
+from PIL import UnidentifiedImageError
+from imagekit.io import decode_image
+from imagekit.encode import OutputEncoder
+from imagekit.profiling import stage, item as profile_item
+from imagekit.detection import detect_image_file
+from imagekit.geometry import boxes_from_detections, square_crop_boxes
+from imagekit.resize import crop_reduce_factor, resize_square, resize_square_array
+
+def face_crop_boxes(detections, width, height):
+    """
+    Square pixel crop boxes where each face is ~2/3 of the image, see square_crop_boxes.
+    """
+    return square_crop_boxes(boxes_from_detections(detections), width, height, 'center', expand=3.0)
+
+def crop_detections(pil_image, detections, size=512, filename='image', full_size=None, resize='fast'):
+    """
+    Crop and resize every detected face from an RGB image.
+    
+    Args:
+        pil_image (PIL.Image.Image or numpy.ndarray): RGB image the detections refer to,
+            or an (height, width, 3) uint8 array such as a shared memory frame, of
+            which only the pixels around each crop are copied
+        detections (list): MediaPipe detections with relative bounding boxes, may be empty
+        size (int): Target size for the output square images (default: 512)
+        filename (str): Name used in log messages (default: 'image')
+        full_size (tuple): (width, height) of the full-resolution image when pil_image
+            is a reduced-scale decode of it; crop boxes are computed at full resolution
+            and scaled onto pil_image (default: pil_image.size)
+        resize (str): 'fast' or 'exact', see imagekit.resize.resize_square (default: 'fast')
+    
+    Returns:
+        tuple: (faces, messages) where faces is a list of (face_index, square_side, PIL image)
+        and messages is the list of log lines for this image
+    """
+    faces = []
+    messages = []
+    if not detections:
+        messages.append(f"No faces found in {filename}")
+        return faces, messages
+
+    if isinstance(pil_image, np.ndarray):
+        height, width = pil_image.shape[:2]
+        resize_crop = resize_square_array
+    else:
+        width, height = pil_image.size
+        resize_crop = resize_square
+    w_img, h_img = full_size or (width, height)
+    scale_x = width / w_img
+    scale_y = height / h_img
+    messages.append(f"Found {len(detections)} face(s) in {filename}")
+    with stage('crop'):
+        crop_boxes = face_crop_boxes(detections, w_img, h_img)
+    for i, (left, top, right, bottom) in enumerate(crop_boxes.tolist()):
+        square_side = right - left
+        if square_side <= 0:
+            messages.append(f"Skipping face #{i+1} in {filename}: Crop region is empty after clipping to the image.")
+            continue
+
+        if (scale_x, scale_y) != (1, 1):
+            left, right = left * scale_x, right * scale_x
+            top, bottom = top * scale_y, bottom * scale_y
+        faces.append((i, square_side, resize_crop(pil_image, (left, top, right, bottom), size, resize)))
+
+    return faces, messages
+
+def crop_faces(pil_image, face_detection, size=512, filename='image', resize='fast'):
+    """
+    Detect faces in an in-memory RGB image and crop each of them.
+    
+    Args:
+        pil_image (PIL.Image.Image): RGB image
+        face_detection: MediaPipe FaceDetection instance
+        size (int): Target size for the output square images (default: 512)
+        filename (str): Name used in log messages (default: 'image')
+        resize (str): 'fast' or 'exact', see imagekit.resize.resize_square (default: 'fast')
+    
+    Returns:
+        tuple: (faces, messages) as returned by crop_detections
+    """
+    with stage('detection'):
+        results = face_detection.process(np.array(pil_image))
+    return crop_detections(pil_image, results.detections, size, filename, resize=resize)
+
+def encode_face_crops(input_path, detections, full_size, image=None, size=512, resize='fast', raw=False, encoder=None):
+    """
+    Crop every detected face from an image file and encode each crop.
+    
+    Args:
+        input_path (str): Path to the input image
+        detections (list): Detections in the image, possibly empty
+        full_size (tuple): (width, height) of the full-resolution image
+        image (PIL.Image.Image): Full-resolution RGB decode if the detector needed one;
+            otherwise the image is decoded here, see process_image (default: None)
+        size (int): Target size for the output square images (default: 512)
+        resize (str): 'fast' or 'exact', see process_image (default: 'fast')
+        raw (bool): Return each crop as a (size, size, 3) uint8 array instead of JPEG bytes (default: False)
+        encoder (OutputEncoder): Output format and settings; the crops of the image are
+            encoded across its threads. None encodes quality 95 JPEGs (default: None)
+    
+    Returns:
+        tuple: (faces, messages) as returned by process_image
+    """
+    filename = os.path.basename(input_path)
+    if not detections:
+        return [], [f"No faces found in {filename}"]
+    if image is None:
+        # The crops are known before the full decode, so it only needs enough pixels for the smallest one
+        max_reduce = crop_reduce_factor(face_crop_boxes(detections, *full_size), size) if resize == 'fast' else 1
+        image = decode_image(input_path, max_reduce=max_reduce)
+    cropped, messages = crop_detections(image, detections, size, filename, full_size, resize)
+
+    if raw:
+        return [(i, square_side, np.asarray(resized_image)) for i, square_side, resized_image in cropped], messages
+    encoded = (encoder or OutputEncoder()).encode_all([resized_image for _, _, resized_image in cropped], input_path)
+    return [(i, square_side, data) for (i, square_side, _), data in zip(cropped, encoded)], messages
+
+def error_message(input_path, error):
+    """
+    Log line for an image that could not be processed.
+    """
+    if isinstance(error, FileNotFoundError):
+        return f"Error: Image file not found: {input_path}"
+    if isinstance(error, UnidentifiedImageError):
+        return f"Error: Cannot identify image file (possibly corrupt or unsupported format): {input_path}"
+    return f"Error processing image {os.path.basename(input_path)}: {str(error)}"
+
+def process_image(input_path, face_detection, size=512, proxy_size=None, resize='fast', cache=None, raw=False, encoder=None):
+    """
+    Detect and crop every face in one image, encoding each crop, as JPEG by default.
+    Nothing is written to disk so that output numbering can be assigned by the caller.
+    
+    Args:
+        input_path (str): Path to the input image
+        face_detection: MediaPipe FaceDetection instance
+        size (int): Target size for the output square images (default: 512)
+        proxy_size (int): If set, detect on a proxy decoded with this maximum side and
+            only decode the full image when there is a face to crop (default: None)
+        resize (str): 'fast' or 'exact', see imagekit.resize.resize_square. With a
+            proxy, 'fast' also decodes the full image at the smallest JPEG/HEIF scale
+            every crop can be resized from (default: 'fast')
+        cache (DetectionCache): Detection cache; on a hit the detector is not run (default: None)
+        raw (bool): Return each crop as a (size, size, 3) uint8 array instead of JPEG bytes (default: False)
+        encoder (OutputEncoder): Output format and settings, see encode_face_crops (default: None)
+    
+    Returns:
+        tuple: (faces, messages) where faces is a list of (face_index, square_side, encoded bytes or array)
+        and messages is the list of log lines for this image
+    """
+    try:
+        with profile_item(input_path):
+            detections, full_size, image = detect_image_file(face_detection, input_path, proxy_size, cache)
+            return encode_face_crops(input_path, detections, full_size, image, size, resize, raw, encoder)
+    except Exception as e:
+        return [], [error_message(input_path, e)]
@@ -0,0 +1,387 @@
+import os
+import json
+import stat
+import socket
+import struct
+import tempfile
+from types import SimpleNamespace
+from imagekit.profiling import stage
+
+# Set to override where the detection service listens
+SOCKET_ENV = 'IMAGEKIT_DETECTOR_SOCKET'
+
+# Every message is a 4-byte big-endian length followed by that much JSON
+_HEADER = struct.Struct('>I')
+
+def default_socket_path():
+    """
+    Socket path of the detection service: $IMAGEKIT_DETECTOR_SOCKET, else in
+    $XDG_RUNTIME_DIR, else in a per-user directory of the temporary directory
+    that make_socket_dir creates owner-only.
+    """
+    if os.environ.get(SOCKET_ENV):
+        return os.environ[SOCKET_ENV]
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, 'imagekit-detector.sock')
+    return os.path.join(_private_socket_dir(), 'detector.sock')
+
+def _private_socket_dir():
+    return os.path.join(tempfile.gettempdir(), f"imagekit-{os.getuid()}")
+
+def make_socket_dir(socket_path):
+    """
+    Create the per-user directory of the default socket path with mode 0700. A
+    directory that already exists must be owned by this user and closed to others,
+    since whoever can write to it can replace the socket.
+
+    Args:
+        socket_path (str): Socket path; only the per-user default directory is created or checked
+
+    Raises:
+        PermissionError: If the directory is owned by another user or open to others
+    """
+    directory = os.path.dirname(os.path.abspath(socket_path))
+    if directory != _private_socket_dir():
+        return
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"{directory} must be a directory owned by this user with mode 0700")
+
+def is_own_socket(socket_path):
+    """
+    Whether socket_path is a socket owned by this user. Anyone can bind a path in a
+    shared directory first, and would then answer detections and learn the names
+    of the shared memory blocks sent to it.
+    """
+    try:
+        info = os.lstat(socket_path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(info.st_mode) and info.st_uid == os.getuid()
+
+def create_mediapipe_detector(model_selection=1, min_detection_confidence=0.5):
+    """
+    Create an in-process MediaPipe face detector.
+
+    Args:
+        model_selection (int): 0 for the short-range model, 1 for the full-range model (default: 1)
+        min_detection_confidence (float): Minimum confidence for a detection (default: 0.5)
+    """
+    # Imported here so that --help and callers using the service skip loading MediaPipe
+    import mediapipe as mp
+    mp_face_detection = mp.solutions.face_detection
+    return mp_face_detection.FaceDetection(
+        model_selection=model_selection,
+        min_detection_confidence=min_detection_confidence
+    )
+
+def create_face_detector(model_selection=1, min_detection_confidence=0.5, socket_path=None):
+    """
+    Return a client of the detection service if one is running, otherwise an
+    in-process MediaPipe detector. Both offer process(rgb_array) and close().
+
+    Args:
+        model_selection (int): 0 for the short-range model, 1 for the full-range model (default: 1)
+        min_detection_confidence (float): Minimum confidence for a detection (default: 0.5)
+        socket_path (str): Service socket (default: default_socket_path())
+    """
+    detector = connect_detection_service(model_selection, min_detection_confidence, socket_path)
+    if detector is not None:
+        return detector
+    return create_mediapipe_detector(model_selection, min_detection_confidence)
+
+def send_message(sock, message):
+    payload = json.dumps(message).encode()
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+def _recv_exactly(sock, count):
+    chunks = []
+    while count:
+        chunk = sock.recv(min(count, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Detection service closed the connection")
+        chunks.append(chunk)
+        count -= len(chunk)
+    return b''.join(chunks)
+
+def recv_message(sock):
+    """
+    Read one message, or return None if the peer closed the connection cleanly.
+    """
+    header = sock.recv(_HEADER.size, socket.MSG_WAITALL)
+    if not header:
+        return None
+    if len(header) < _HEADER.size:
+        header += _recv_exactly(sock, _HEADER.size - len(header))
+    return json.loads(_recv_exactly(sock, _HEADER.unpack(header)[0]))
+
+def detection_to_dict(detection):
+    """
+    Flatten a MediaPipe detection into {'box', 'score', 'keypoints'} with relative coordinates.
+    """
+    bbox = detection.location_data.relative_bounding_box
+    score = getattr(detection, 'score', None)
+    return {
+        'box': [bbox.xmin, bbox.ymin, bbox.width, bbox.height],
+        'score': float(score[0]) if score else None,
+        'keypoints': [[kp.x, kp.y] for kp in getattr(detection.location_data, 'relative_keypoints', [])],
+    }
+
+def detection_from_dict(data):
+    """
+    Rebuild an object with the attributes of a MediaPipe detection from detection_to_dict output.
+    """
+    xmin, ymin, width, height = data['box']
+    return SimpleNamespace(
+        score=[data['score']] if data['score'] is not None else [],
+        location_data=SimpleNamespace(
+            relative_bounding_box=SimpleNamespace(xmin=xmin, ymin=ymin, width=width, height=height),
+            relative_keypoints=[SimpleNamespace(x=x, y=y) for x, y in data['keypoints']],
+        ),
+    )
+
+def attach_shared_memory(name):
+    """
+    Open a shared memory block created by another process without taking
+    ownership of it, so this process never unlinks it on exit.
+    """
+    from multiprocessing import resource_tracker, shared_memory
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Python < 3.13 always registers the block with the resource tracker
+        shm = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+class ServiceFaceDetector:
+    """
+    Client of the detection service (detection_service.py), usable in place of
+    a MediaPipe FaceDetection. Images are handed over through one shared memory
+    block that is reused, and only grown, across requests.
+
+    If the service goes away mid-run, detection continues with an in-process detector.
+
+    Args:
+        sock (socket.socket): Connected Unix socket
+        model_selection (int): Detector model the service should use
+        min_detection_confidence (float): Detector confidence threshold
+    """
+    def __init__(self, sock, model_selection=1, min_detection_confidence=0.5):
+        self.sock = sock
+        self.config = {'model_selection': model_selection, 'min_detection_confidence': min_detection_confidence}
+        self.shm = None
+        self.fallback = None
+
+    def _buffer(self, nbytes):
+        from multiprocessing import shared_memory
+        if self.shm is None or self.shm.size < nbytes:
+            self._release_buffer()
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        return self.shm
+
+    def _release_buffer(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def _request(self, items):
+        send_message(self.sock, dict(self.config, items=items))
+        response = recv_message(self.sock)
+        if response is None:
+            raise ConnectionError("Detection service closed the connection")
+        return response['results']
+
+    def _use_fallback(self, error):
+        print(f"Warning: Detection service unavailable ({str(error)}), detecting in-process")
+        self.close()
+        self.fallback = create_mediapipe_detector(**self.config)
+
+    def _detect_in_process(self, image):
+        try:
+            return {'detections': [detection_to_dict(d) for d in self.fallback.process(image).detections or []]}
+        except Exception as e:
+            return {'error': str(e)}
+
+    def detect_arrays(self, images):
+        """
+        Detect faces in a batch of RGB uint8 arrays with one round trip.
+
+        Returns:
+            list: Per image, {'detections': [detection dicts, see detection_to_dict]} or {'error': message}
+        """
+        import numpy as np
+        if self.fallback is not None:
+            return [self._detect_in_process(image) for image in images]
+
+        images = [np.ascontiguousarray(image, dtype=np.uint8) for image in images]
+        shm = self._buffer(max(1, sum(image.nbytes for image in images)))
+        items = []
+        offset = 0
+        for image in images:
+            np.ndarray(image.shape, np.uint8, shm.buf, offset)[...] = image
+            items.append({'shm': shm.name, 'offset': offset, 'shape': list(image.shape)})
+            offset += image.nbytes
+        try:
+            return self._request(items)
+        except OSError as e:
+            self._use_fallback(e)
+            return self.detect_arrays(images)
+
+    def detect_paths(self, paths, max_side=None):
+        """
+        Have the service decode and detect a batch of image files.
+
+        Args:
+            paths (list): Image paths readable by the service
+            max_side (int): Detect on a reduced-size decode with this maximum side (default: full size)
+
+        Returns:
+            list: Per image, {'detections': [...], 'size': [width, height]} or {'error': message}
+        """
+        if self.fallback is not None:
+            return [detect_path(self.fallback, path, max_side) for path in paths]
+        try:
+            return self._request([{'path': os.path.abspath(path), 'max_side': max_side} for path in paths])
+        except OSError as e:
+            self._use_fallback(e)
+            return self.detect_paths(paths, max_side)
+
+    def process(self, image):
+        """
+        Detect faces in one RGB array, returning a result shaped like MediaPipe's.
+        """
+        if self.fallback is not None:
+            return self.fallback.process(image)
+        result = self.detect_arrays([image])[0]
+        if 'error' in result:
+            raise RuntimeError(f"Detection service: {result['error']}")
+        return SimpleNamespace(detections=[detection_from_dict(d) for d in result['detections']] or None)
+
+    def close(self):
+        self._release_buffer()
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        if self.fallback is not None:
+            self.fallback.close()
+
+def detect_path(face_detection, path, max_side=None):
+    """
+    Decode one image file and detect faces in it, reporting failures in the result.
+
+    Args:
+        face_detection: MediaPipe FaceDetection (or compatible) instance
+        path (str): Image path
+        max_side (int): Detect on a reduced-size decode with this maximum side (default: full size)
+
+    Returns:
+        dict: {'detections': [...], 'size': [width, height]} or {'error': message}
+    """
+    import numpy as np
+    from imagekit.io import decode_image
+    try:
+        image = decode_image(path, max_side=max_side)
+        with stage('detection'):
+            detections = face_detection.process(np.array(image)).detections or []
+        return {'detections': [detection_to_dict(d) for d in detections], 'size': list(image.size)}
+    except Exception as e:
+        return {'error': str(e)}
+
+def connect_detection_service(model_selection=1, min_detection_confidence=0.5, socket_path=None):
+    """
+    Connect to the detection service.
+
+    Returns:
+        ServiceFaceDetector: A client, or None if no service is listening or the
+        socket is not one of this user's
+    """
+    socket_path = socket_path or default_socket_path()
+    if not os.path.lexists(socket_path):
+        return None
+    if not is_own_socket(socket_path):
+        print(f"Warning: Not using the detection service at {socket_path}: not a socket owned by this user")
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+    return ServiceFaceDetector(sock, model_selection, min_detection_confidence)
+
+def load_for_detection(input_path, proxy_size=None, cache=None):
+    """
+    The I/O half of detect_image_file: look the image up in a DetectionCache,
+    and on a miss decode the image the detector needs. Does not touch the
+    detector, so it can run on another thread than detection.
+
+    Args:
+        input_path (str): Path to the input image
+        proxy_size (int): If set, decode a reduced-size proxy with this maximum side (default: None)
+        cache (DetectionCache): Cache to read (default: None)
+
+    Returns:
+        tuple: (key, detections, (full_width, full_height), detect_image, image) where
+        detections are the cached detections or None on a miss, detect_image is the
+        RGB image to run the detector on (None on a hit), and image the full-resolution
+        decode if one was needed, else None
+    """
+    from imagekit.io import decode_image, load_reduced_image, image_size
+
+    key = None
+    if cache is not None:
+        key = cache.key(input_path, proxy_size)
+        cached = cache.get(key)
+        if cached is not None:
+            return key, [detection_from_dict(d) for d in cached], image_size(input_path), None, None
+
+    if proxy_size:
+        # Relative boxes found on the proxy map straight back to full resolution
+        proxy_image, full_size = load_reduced_image(input_path, proxy_size)
+        return key, None, full_size, proxy_image, None
+    image = decode_image(input_path)
+    return key, None, image.size, image, image
+
+def run_detection(face_detection, detect_image, key=None, cache=None):
+    """
+    The detector half of detect_image_file: detect faces in a decoded image, or
+    an RGB uint8 array, and store the result in the cache.
+
+    Returns:
+        list: MediaPipe detections, possibly empty
+    """
+    import numpy as np
+
+    with stage('detection'):
+        # No copy for an array, e.g. a shared memory frame
+        detections = face_detection.process(np.asarray(detect_image)).detections or []
+    if cache is not None:
+        cache.put(key, [detection_to_dict(d) for d in detections])
+    return detections
+
+def detect_image_file(face_detection, input_path, proxy_size=None, cache=None):
+    """
+    Detect faces in an image file, looking the result up in a DetectionCache first.
+
+    Args:
+        face_detection: MediaPipe FaceDetection (or compatible) instance
+        input_path (str): Path to the input image
+        proxy_size (int): If set, detect on a reduced-size decode with this maximum side (default: None)
+        cache (DetectionCache): Cache to read and fill (default: None)
+
+    Returns:
+        tuple: (detections, (full_width, full_height), image) where image is the
+        full-resolution RGB decode if detection needed one, or None when the caller
+        still has to decode the image (proxy detection or a cache hit)
+    """
+    key, detections, full_size, detect_image, image = load_for_detection(input_path, proxy_size, cache)
+    if detections is None:
+        detections = run_detection(face_detection, detect_image, key, cache)
+    return detections, full_size, image
@@ -0,0 +1,259 @@
+from io import BytesIO
+from concurrent.futures import Future, ThreadPoolExecutor
+from imagekit.profiling import stage, item as profile_item
+
+# Output formats: (Pillow format, file extension, whether quality trades size for fidelity)
+OUTPUT_FORMATS = {
+    'jpeg': ('JPEG', '.jpg', True),
+    'png': ('PNG', '.png', False),
+    'webp': ('WEBP', '.webp', True),
+    'webp_lossless': ('WEBP', '.webp', False),
+}
+
+# Extensions of every output format, e.g. to find numbered outputs of earlier runs
+OUTPUT_EXTENSIONS = tuple(sorted({extension for _, extension, _ in OUTPUT_FORMATS.values()}))
+
+JPEG_SUBSAMPLING = ('4:4:4', '4:2:2', '4:2:0')
+
+# Encoder options of the scripts before they were configurable: outputs and manifests stay as they were
+DEFAULT_ENCODING = {'format': 'jpeg', 'quality': 95, 'optimize': False, 'progressive': False,
+                    'subsampling': None, 'target_kb': None, 'target_ssim': None}
+
+# Quality range searched for a target size or SSIM
+MIN_QUALITY = 1
+MAX_QUALITY = 100
+
+class OutputEncoder:
+    """
+    Encode output images in a chosen format, at a fixed quality or at the
+    quality a binary search finds for a target file size or SSIM, optionally on
+    a thread pool (Pillow releases the GIL while encoding).
+
+    Args:
+        format (str): 'jpeg', 'png', 'webp' or 'webp_lossless' (default: 'jpeg')
+        quality (int): Quality of the lossy formats, 1-100 (default: 95)
+        optimize (bool): Spend more time for smaller files: optimized Huffman tables
+            for JPEG, PNG optimize, WebP method 6 (default: False)
+        progressive (bool): Progressive JPEG (default: False)
+        subsampling (str): JPEG chroma subsampling, '4:4:4', '4:2:2' or '4:2:0';
+            None keeps Pillow's default, 4:2:0 (default: None)
+        target_kb (float): Search the highest quality whose file is at most this many
+            KB, instead of using quality (default: None)
+        target_ssim (float): Search the lowest quality whose decoded output has at
+            least this luma SSIM against the input, instead of using quality (default: None)
+        threads (int): Threads of submit() and encode_all(); 0 encodes on the
+            calling thread (default: 0)
+    """
+    def __init__(self, format='jpeg', quality=95, optimize=False, progressive=False, subsampling=None,
+                 target_kb=None, target_ssim=None, threads=0):
+        if format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format '{format}', expected one of {', '.join(OUTPUT_FORMATS)}")
+        self.pillow_format, self.extension, self.lossy = OUTPUT_FORMATS[format]
+        if not MIN_QUALITY <= quality <= MAX_QUALITY:
+            raise ValueError(f"The quality must be between {MIN_QUALITY} and {MAX_QUALITY}, got {quality}")
+        if target_kb is not None and target_ssim is not None:
+            raise ValueError("Give a target size or a target SSIM, not both")
+        if (target_kb is not None or target_ssim is not None) and not self.lossy:
+            raise ValueError(f"A target size or SSIM needs a lossy format, not '{format}'")
+        if target_kb is not None and target_kb <= 0:
+            raise ValueError(f"The target size must be positive, got {target_kb}")
+        if target_ssim is not None and not 0 < target_ssim <= 1:
+            raise ValueError(f"The target SSIM must be in (0, 1], got {target_ssim}")
+        if (subsampling is not None or progressive) and format != 'jpeg':
+            raise ValueError("Subsampling and progressive only apply to JPEG")
+        if subsampling is not None and subsampling not in JPEG_SUBSAMPLING:
+            raise ValueError(f"Unknown subsampling '{subsampling}', expected one of {', '.join(JPEG_SUBSAMPLING)}")
+        self.format = format
+        self.quality = quality
+        self.optimize = optimize
+        self.progressive = progressive
+        self.subsampling = subsampling
+        self.target_bytes = target_kb * 1000 if target_kb is not None else None
+        self.target_ssim = target_ssim
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='encoder') if threads > 0 else None
+
+    def _save_args(self, quality):
+        # Only options that differ from Pillow's defaults, so the default encoder writes the bytes it always did
+        if self.format == 'jpeg':
+            args = {'quality': quality}
+            if self.optimize:
+                args['optimize'] = True
+            if self.progressive:
+                args['progressive'] = True
+            if self.subsampling is not None:
+                args['subsampling'] = self.subsampling
+            return args
+        if self.format == 'png':
+            return {'optimize': True} if self.optimize else {}
+        args = {'lossless': True} if self.format == 'webp_lossless' else {'quality': quality}
+        if self.optimize:
+            args['method'] = 6
+        return args
+
+    def _encode_at(self, img, quality):
+        buffer = BytesIO()
+        img.save(buffer, format=self.pillow_format, **self._save_args(quality))
+        return buffer.getvalue()
+
+    def _search(self, img):
+        # Size falls and SSIM rises with quality, so either target is a boundary to bisect
+        from PIL import Image
+        from imagekit.quality import ssim_reference
+
+        similarity = ssim_reference(img) if self.target_ssim is not None else None
+        low, high = MIN_QUALITY, MAX_QUALITY
+        best = None
+        while low <= high:
+            quality = (low + high) // 2
+            data = self._encode_at(img, quality)
+            if self.target_bytes is not None:
+                acceptable = len(data) <= self.target_bytes
+            else:
+                acceptable = similarity(Image.open(BytesIO(data))) >= self.target_ssim
+            if acceptable:
+                best = data
+            # Smaller files below an acceptable size; SSIM only holds at or above an acceptable quality
+            if acceptable == (self.target_bytes is not None):
+                low = quality + 1
+            else:
+                high = quality - 1
+        if best is None:
+            # Out of reach: the smallest file, or the most faithful one
+            best = self._encode_at(img, MIN_QUALITY if self.target_bytes is not None else MAX_QUALITY)
+        return best
+
+    def encode(self, img):
+        """
+        Encode an image on this thread.
+
+        Args:
+            img (PIL.Image.Image): Image to encode
+
+        Returns:
+            bytes: The encoded file
+        """
+        with stage('encode'):
+            if self.target_bytes is None and self.target_ssim is None:
+                return self._encode_at(img, self.quality)
+            return self._search(img)
+
+    def save(self, img, output_path):
+        """
+        Encode an image and write it to output_path, whatever its extension.
+        """
+        data = self.encode(img)
+        with stage('write'):
+            with open(output_path, 'wb') as f:
+                f.write(data)
+
+    def _run(self, name, function, *args):
+        if name is None:
+            return function(*args)
+        with profile_item(name):
+            return function(*args)
+
+    def _submit(self, name, function, *args):
+        if self.executor is not None:
+            return self.executor.submit(self._run, name, function, *args)
+        future = Future()
+        try:
+            future.set_result(self._run(name, function, *args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def submit(self, img, output_path, name=None):
+        """
+        Encode and write an image on the thread pool, or right away without one.
+
+        Args:
+            img (PIL.Image.Image): Image to save; not to be modified until the future is done
+            output_path (str): Destination path
+            name (str): Profiling item the encode and write are timed under, e.g. the input path (default: None)
+
+        Returns:
+            concurrent.futures.Future: Resolves to None once written, or to the error
+        """
+        return self._submit(name, self.save, img, output_path)
+
+    def submit_encode(self, img, name=None):
+        """
+        Encode an image on the thread pool, or right away without one, for
+        callers that write the bytes themselves, e.g. into a tar shard.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the encoded bytes, or to the error
+        """
+        return self._submit(name, self.encode, img)
+
+    def encode_all(self, images, name=None):
+        """
+        Encode several images, e.g. the face crops of one input, across the thread pool.
+
+        Returns:
+            list: The encoded files, in the order of images
+        """
+        if self.executor is None or len(images) < 2:
+            return [self.encode(img) for img in images]
+        return list(self.executor.map(lambda img: self._run(name, self.encode, img), images))
+
+    def close(self):
+        """
+        Wait for submitted images and stop the thread pool.
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+def encoding_variant(encoding):
+    """
+    Describe encoder options for manifest params, or None for the default
+    encoder, so manifests of earlier runs stay current. The number of threads
+    does not change the output, so it is left out.
+    """
+    options = dict(DEFAULT_ENCODING, **{k: v for k, v in (encoding or {}).items() if k != 'threads'})
+    if options == DEFAULT_ENCODING:
+        return None
+    parts = [options['format']]
+    if options['target_kb'] is not None:
+        parts.append(f"kb{options['target_kb']:g}")
+    elif options['target_ssim'] is not None:
+        parts.append(f"ssim{options['target_ssim']:g}")
+    elif OUTPUT_FORMATS[options['format']][2]:
+        parts.append(f"q{options['quality']}")
+    for flag in ('optimize', 'progressive'):
+        if options[flag]:
+            parts.append(flag)
+    if options['subsampling']:
+        parts.append(options['subsampling'])
+    return ':'.join(parts)
+
+def add_encoder_arguments(parser):
+    """
+    Add the output format and encoder options shared by the scripts writing images.
+    """
+    parser.add_argument('--format', type=str, default='jpeg', choices=list(OUTPUT_FORMATS),
+                        help='Output format (default: jpeg)')
+    parser.add_argument('--quality', type=int, default=95,
+                        help='Quality of jpeg and webp outputs, 1-100 (default: 95)')
+    parser.add_argument('--optimize', action='store_true',
+                        help='Smaller files for more encode time: optimized JPEG Huffman tables, PNG optimize, WebP method 6')
+    parser.add_argument('--progressive', action='store_true',
+                        help='Write progressive JPEGs')
+    parser.add_argument('--subsampling', type=str, default=None, choices=JPEG_SUBSAMPLING,
+                        help="JPEG chroma subsampling (default: Pillow's, 4:2:0)")
+    parser.add_argument('--target_kb', type=float, default=None,
+                        help='Binary-search the highest quality whose output is at most this many KB, instead of --quality')
+    parser.add_argument('--target_ssim', type=float, default=None,
+                        help='Binary-search the lowest quality whose output has at least this SSIM against the crop, e.g. 0.98, instead of --quality')
+    parser.add_argument('--encode_threads', type=int, default=0,
+                        help='Threads encoding and writing outputs while the next image is processed (default: 0, encode in line)')
+
+def encoding_from_args(args):
+    """
+    Return the OutputEncoder options given on the command line, see add_encoder_arguments.
+    """
+    return {'format': args.format, 'quality': args.quality, 'optimize': args.optimize,
+            'progressive': args.progressive, 'subsampling': args.subsampling,
+            'target_kb': args.target_kb, 'target_ssim': args.target_ssim, 'threads': args.encode_threads}
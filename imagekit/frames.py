@@ -0,0 +1,103 @@
+import queue
+import shutil
+import numpy as np
+
+# Where POSIX shared memory blocks live on Linux, a tmpfs of its own size (64 MB by default in Docker)
+SHM_DIR = '/dev/shm'
+
+def shared_memory_free():
+    """
+    Free bytes for shared memory blocks, or None where SHM_DIR does not exist.
+    A block larger than this is created without complaint, and the process
+    touching its pages past the limit dies of SIGBUS.
+    """
+    try:
+        return shutil.disk_usage(SHM_DIR).free
+    except OSError:
+        return None
+
+class FrameRing:
+    """
+    Fixed-size slots for RGB frames in one shared memory block, handed between
+    processes without pickling: a decoder process writes a frame into a slot and
+    the process that owns the ring reads it back as a NumPy view, without a copy.
+    The owner hands out free slots in turn and takes them back once a frame is
+    no longer needed, so at most `slots` frames are in flight. Pages of the
+    block are only allocated once a frame is written to them.
+
+    Args:
+        slots (int): Number of frames held at once
+        slot_bytes (int): Capacity of each slot, e.g. width * height * 3 of the largest frame
+        name (str): Shared memory block of a ring to attach to, from a process the
+            owner started; None creates a new ring owned by this process (default: None)
+    """
+    def __init__(self, slots, slot_bytes, name=None):
+        from multiprocessing import shared_memory
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.owner = name is None
+        if self.owner:
+            free = shared_memory_free()
+            if free is not None and slots * slot_bytes > free:
+                raise MemoryError(f"{slots} frame slots of {slot_bytes / 1e6:.0f} MB need {slots * slot_bytes / 1e6:.0f} MB "
+                                  f"of shared memory, but {SHM_DIR} has {free / 1e6:.0f} MB free")
+            self.shm = shared_memory.SharedMemory(create=True, size=max(1, slots * slot_bytes))
+            self.free = queue.Queue()
+            for slot in range(slots):
+                self.free.put(slot)
+        else:
+            # Processes started by the owner share its resource tracker, so attaching
+            # registers nothing new and the block is only unlinked by the owner
+            self.shm = shared_memory.SharedMemory(name)
+            self.free = None
+        self.name = self.shm.name
+
+    def acquire(self, timeout=None):
+        """
+        Wait for a free slot and return its number, or None if none was freed
+        within timeout seconds. Owner only.
+        """
+        try:
+            return self.free.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def release(self, slot):
+        """
+        Give a slot back once nothing reads its frame any more. Owner only.
+        """
+        self.free.put(slot)
+
+    def fits(self, shape):
+        return int(np.prod(shape)) <= self.slot_bytes
+
+    def frame(self, slot, shape):
+        """
+        Return the frame in a slot as a uint8 view of the shared block.
+        """
+        return np.ndarray(shape, np.uint8, self.shm.buf, slot * self.slot_bytes)
+
+    def write(self, slot, pixels):
+        """
+        Copy a uint8 frame, e.g. np.asarray of a decoded image, into a slot.
+
+        Returns:
+            tuple: Shape of the frame, to read it back with frame()
+        """
+        if not self.fits(pixels.shape):
+            raise ValueError(f"A {'x'.join(map(str, pixels.shape))} frame does not fit a {self.slot_bytes}-byte slot")
+        self.frame(slot, pixels.shape)[...] = pixels
+        return pixels.shape
+
+    def close(self):
+        """
+        Detach from the block, and free it if this process owns the ring. Every
+        view returned by frame() must be gone by then.
+        """
+        try:
+            self.shm.close()
+        except BufferError:
+            # A frame view outlived the ring, e.g. after an error; the mapping goes with the process
+            pass
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,141 @@
+import numpy as np
+
+CROP_POLICIES = ('center', 'anchor')
+
+def boxes_from_detections(detections):
+    """
+    Collect MediaPipe relative bounding boxes into an array.
+
+    Args:
+        detections (list): MediaPipe detections, may be None or empty
+
+    Returns:
+        numpy.ndarray: (N, 4) float array of (xmin, ymin, width, height)
+    """
+    if not detections:
+        return np.zeros((0, 4))
+    return np.array([(bbox.xmin, bbox.ymin, bbox.width, bbox.height)
+                     for bbox in (d.location_data.relative_bounding_box for d in detections)], dtype=np.float64)
+
+def square_crop_boxes(rel_boxes, width, height, policy='center', expand=3.0, padding=0.2):
+    """
+    Compute square pixel crop boxes around many relative face boxes at once.
+
+    The 'center' policy (crop_faces_new.py) takes a square `expand` times the
+    larger face side, clips it to the image, shrinks it to the smaller clipped side
+    and re-centers it so the face is ~1/expand of the crop.
+    The 'anchor' policy (detect_faces.py) adds `padding` times the larger face side
+    on each side, clips from the top-left corner and shrinks to a square.
+
+    Args:
+        rel_boxes (numpy.ndarray): (N, 4) relative (xmin, ymin, width, height)
+        width (int): Image width in pixels
+        height (int): Image height in pixels
+        policy (str): 'center' or 'anchor' (default: 'center')
+        expand (float): Crop side over face side for the 'center' policy (default: 3.0)
+        padding (float): Padding per side, relative to the face side, for the 'anchor' policy (default: 0.2)
+
+    Returns:
+        numpy.ndarray: (N, 4) int64 array of (left, top, right, bottom). Faces
+        that cannot be cropped get an empty box with right == left.
+    """
+    rel_boxes = np.asarray(rel_boxes, dtype=np.float64).reshape(-1, 4)
+    # int() in the scalar code truncates towards zero
+    abs_x = np.trunc(rel_boxes[:, 0] * width).astype(np.int64)
+    abs_y = np.trunc(rel_boxes[:, 1] * height).astype(np.int64)
+    abs_w = np.trunc(rel_boxes[:, 2] * width).astype(np.int64)
+    abs_h = np.trunc(rel_boxes[:, 3] * height).astype(np.int64)
+    face_max_dim = np.maximum(abs_w, abs_h)
+
+    if policy == 'center':
+        left, top, side = _center_policy(abs_x, abs_y, abs_w, abs_h, face_max_dim, width, height, expand)
+    elif policy == 'anchor':
+        left, top, side = _anchor_policy(abs_x, abs_y, abs_w, abs_h, face_max_dim, width, height, padding)
+    else:
+        raise ValueError(f"Unknown crop policy: {policy}")
+
+    side = np.maximum(side, 0)
+    return np.stack([left, top, left + side, top + side], axis=1)
+
+def _center_policy(abs_x, abs_y, abs_w, abs_h, face_max_dim, width, height, expand):
+    face_cx = abs_x + abs_w / 2
+    face_cy = abs_y + abs_h / 2
+    half_side = face_max_dim * expand / 2
+
+    # Clip the ideal box to the image; np.round rounds half to even like round()
+    x1 = np.maximum(0, np.round(face_cx - half_side)).astype(np.int64)
+    y1 = np.maximum(0, np.round(face_cy - half_side)).astype(np.int64)
+    x2 = np.minimum(width, np.round(face_cx + half_side)).astype(np.int64)
+    y2 = np.minimum(height, np.round(face_cy + half_side)).astype(np.int64)
+    clipped_w = x2 - x1
+    clipped_h = y2 - y1
+
+    # Center the largest square that fits in the clipped box, then shift it back inside the image
+    side = np.minimum(clipped_w, clipped_h)
+    left = np.maximum(0, np.round(x1 + clipped_w / 2 - side / 2)).astype(np.int64)
+    top = np.maximum(0, np.round(y1 + clipped_h / 2 - side / 2)).astype(np.int64)
+    left = np.maximum(0, np.where(left + side > width, width - side, left))
+    top = np.maximum(0, np.where(top + side > height, height - side, top))
+
+    valid = (abs_w > 0) & (abs_h > 0) & (clipped_w > 0) & (clipped_h > 0) & \
+            (left < width) & (top < height) & (left + side <= width) & (top + side <= height)
+    return left, top, np.where(valid, side, 0)
+
+def _anchor_policy(abs_x, abs_y, abs_w, abs_h, face_max_dim, width, height, padding):
+    crop_size = face_max_dim + 2 * np.trunc(face_max_dim * padding).astype(np.int64)
+    center_x = abs_x + abs_w // 2
+    center_y = abs_y + abs_h // 2
+    left = np.maximum(0, center_x - crop_size // 2)
+    top = np.maximum(0, center_y - crop_size // 2)
+    right = np.minimum(width, left + crop_size)
+    bottom = np.minimum(height, top + crop_size)
+    return left, top, np.minimum(right - left, bottom - top)
+
+def box_iou(boxes_a, boxes_b):
+    """
+    Intersection over union of every pair of boxes.
+
+    Args:
+        boxes_a (numpy.ndarray): (N, 4) boxes (left, top, right, bottom)
+        boxes_b (numpy.ndarray): (M, 4) boxes (left, top, right, bottom)
+
+    Returns:
+        numpy.ndarray: (N, M) float array
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    left = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    top = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    right = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    bottom = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    intersection = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+def non_max_suppression(boxes, scores, iou_threshold=0.3):
+    """
+    Greedy non-maximum suppression: keep the highest-scoring box, drop every box
+    overlapping it by more than iou_threshold, repeat. The pairwise overlaps are
+    computed once for all boxes.
+
+    Args:
+        boxes (numpy.ndarray): (N, 4) boxes (left, top, right, bottom)
+        scores (numpy.ndarray): (N,) scores
+        iou_threshold (float): Overlap above which the lower-scoring box is dropped (default: 0.3)
+
+    Returns:
+        numpy.ndarray: Indices of the kept boxes, highest score first
+    """
+    scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+    order = np.argsort(-scores, kind='stable')
+    overlaps = box_iou(boxes, boxes)[np.ix_(order, order)] > iou_threshold
+    suppressed = np.zeros(len(order), dtype=bool)
+    keep = []
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+        keep.append(order[i])
+        suppressed |= overlaps[i]
+    return np.array(keep, dtype=np.int64)
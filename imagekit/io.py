@@ -0,0 +1,218 @@
+import os
+from imagekit.profiling import stage
+from imagekit.archive import archive_format, iter_archive_images, open_source
+
+# Leading bytes needed to recognise every supported format
+SNIFF_BYTES = 32
+
+# ftyp brands of HEIF still images
+HEIF_BRANDS = (b'heic', b'heix', b'hevc', b'hevx', b'heim', b'heis', b'mif1', b'msf1')
+
+# Canonical file extension for each sniffed format
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp',
+                     'TIFF': '.tif', 'HEIF': '.heic', 'BMP': '.bmp'}
+
+# EXIF orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+_heif_registered = False
+
+def _register_heif():
+    """
+    Register the HEIF opener with Pillow on first use, so scripts that never
+    decode an image (e.g. rename_images.py, which only sniffs) do not pay for
+    importing Pillow and pillow_heif.
+    """
+    global _heif_registered
+    if not _heif_registered:
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+        _heif_registered = True
+
+def sniff_image_format(path):
+    """
+    Identify an image by its leading bytes rather than its extension.
+
+    Args:
+        path (str): Path to the file
+
+    Returns:
+        str: Pillow format name ('JPEG', 'PNG', 'GIF', 'BMP', 'WEBP', 'TIFF' or 'HEIF'), or None
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(SNIFF_BYTES)
+    except OSError:
+        return None
+    return sniff_image_bytes(head)
+
+def sniff_image_bytes(head):
+    """
+    Identify an image from its first SNIFF_BYTES bytes, see sniff_image_format.
+    """
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'JPEG'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'PNG'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'GIF'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    if head[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'TIFF'
+    if head[4:8] == b'ftyp' and head[8:12] in HEIF_BRANDS:
+        return 'HEIF'
+    # 'BM' alone is too weak, so also check the DIB header size
+    if head[:2] == b'BM' and len(head) >= 18 and int.from_bytes(head[14:18], 'little') in (12, 40, 52, 56, 64, 108, 124):
+        return 'BMP'
+    return None
+
+def iter_images(folder, recursive=False, with_format=False, archives=False, stream=False):
+    """
+    Lazily yield the images in a folder, in sorted order, recognised by content.
+    Hidden files are skipped. Each directory is listed with os.scandir and sorted
+    on its own, so a recursive walk starts yielding before the whole tree is read.
+
+    With archives, zip and tar archives in the folder, or the folder itself if it
+    is an archive, are expanded in place into their images, yielded as
+    ArchiveMember paths that are decoded without extracting anything to disk
+    (see iter_archive_images).
+
+    Args:
+        folder (str): Folder to scan, or with archives an archive
+        recursive (bool): Descend into subfolders (default: False)
+        with_format (bool): Yield (path, format) instead of paths (default: False)
+        archives (bool): Expand zip and tar archives (default: False)
+        stream (bool): With archives, also expand compressed tars, which can only be
+            read front to back; otherwise those in the folder are skipped with a warning
+            and a compressed tar given as the folder raises ValueError (default: False)
+
+    Yields:
+        str or tuple: Path of each image, or (path, format name)
+    """
+    if archives and os.path.isfile(folder):
+        for member in iter_archive_images(folder, stream):
+            yield (member, member.format) if with_format else member
+        return
+    with os.scandir(folder) as it:
+        entries = sorted((entry for entry in it if not entry.name.startswith('.')), key=lambda entry: entry.name)
+    for entry in entries:
+        if entry.is_dir():
+            if recursive:
+                yield from iter_images(entry.path, recursive, with_format, archives, stream)
+            continue
+        if not entry.is_file():
+            continue
+        image_format = sniff_image_format(entry.path)
+        if image_format is None:
+            kind = archive_format(entry.path) if archives else None
+            if kind == 'compressed_tar' and not stream:
+                print(f"Warning: Skipping {entry.path}, a compressed tar can only be read front to back")
+            elif kind is not None:
+                yield from iter_images(entry.path, recursive, with_format, archives, stream)
+            continue
+        yield (entry.path, image_format) if with_format else entry.path
+
+def decode_image(input_path, mode='RGB', max_side=None, resample=None, max_reduce=1):
+    """
+    Open an image, apply its EXIF orientation and convert it to a single mode.
+
+    JPEGs are decoded straight into the target mode (e.g. luma only for 'L') and,
+    with max_side, at 1/2, 1/4 or 1/8 scale via Image.draft; HEIF files then use
+    an embedded thumbnail when one is large enough. max_reduce allows the same
+    reduced-scale decode without any further resize, for callers that map pixel
+    coordinates from the full-size image onto the result.
+
+    Args:
+        input_path (str): Path to the input image, or an ArchiveMember
+        mode (str): Target mode such as 'RGB' or 'L'; None keeps the decoded mode (default: 'RGB')
+        max_side (int): If set, downscale so neither side exceeds this (default: None)
+        resample: Filter for the final downscale (default: BILINEAR)
+        max_reduce (int): Largest factor the decode may shrink each side by (default: 1)
+
+    Returns:
+        PIL.Image.Image: The decoded image
+    """
+    from PIL import Image, ImageOps
+
+    _register_heif()
+    with stage('decode'), open_source(input_path) as source:
+        img = Image.open(source)
+        if max_side and max(img.size) > max_side:
+            img.draft(mode, (max_side, max_side))
+        elif max_reduce > 1:
+            img.draft(mode, (-(-img.width // max_reduce), -(-img.height // max_reduce)))
+        elif mode and mode != img.mode:
+            img.draft(mode, img.size)
+
+        if img.getexif().get(0x0112, 1) != 1:
+            img = ImageOps.exif_transpose(img)
+        img.load()
+
+    if mode and img.mode != mode:
+        with stage('color'):
+            # Go through RGBA so palette transparency is handled explicitly
+            if img.mode == 'P' and 'transparency' in img.info:
+                img = img.convert('RGBA')
+            img = img.convert(mode)
+    if max_side and max(img.size) > max_side:
+        with stage('resize'):
+            img.thumbnail((max_side, max_side), Image.Resampling.BILINEAR if resample is None else resample)
+    return img
+
+def save_image(img, output_path, format=None, **save_args):
+    """
+    Encode an image in memory, then write it to output_path, so that encoding and
+    writing are timed as separate stages when profiling.
+
+    Args:
+        img (PIL.Image.Image): Image to save
+        output_path (str): Destination path; the format follows its extension unless given
+        format (str): Pillow format name such as 'JPEG' (default: None)
+        **save_args: Extra arguments for Image.save, e.g. quality
+    """
+    from io import BytesIO
+    from PIL import Image
+
+    if format is None:
+        extension = os.path.splitext(output_path)[1].lower()
+        format = Image.registered_extensions().get(extension)
+        if format is None:
+            raise ValueError(f"Unknown file extension: {extension}")
+    buffer = BytesIO()
+    with stage('encode'):
+        img.save(buffer, format=format, **save_args)
+    with stage('write'):
+        with open(output_path, 'wb') as f:
+            f.write(buffer.getbuffer())
+
+def image_size(input_path):
+    """
+    Return an image's (width, height) after EXIF orientation, reading only its header.
+
+    Args:
+        input_path (str): Path to the image
+    """
+    from PIL import Image
+
+    _register_heif()
+    with open_source(input_path) as source, Image.open(source) as img:
+        width, height = img.size
+        if img.getexif().get(0x0112, 1) in TRANSPOSED_ORIENTATIONS:
+            return height, width
+        return width, height
+
+def load_reduced_image(input_path, max_side, resample=None):
+    """
+    Decode a reduced-size RGB copy of an image, e.g. a proxy to run face detection on,
+    without decoding the full-resolution pixels where the format allows it.
+
+    Args:
+        input_path (str): Path to the input image
+        max_side (int): Maximum width or height of the result
+        resample: Filter for the final downscale (default: BILINEAR)
+
+    Returns:
+        tuple: (reduced PIL image, (full_width, full_height))
+    """
+    return decode_image(input_path, 'RGB', max_side, resample), image_size(input_path)
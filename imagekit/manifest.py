@@ -0,0 +1,108 @@
+import os
+import json
+from imagekit.cache import file_digest
+from imagekit.archive import source_stat
+
+# Manifest kept inside the output folder
+MANIFEST_FILENAME = '.manifest.json'
+
+class Manifest:
+    """
+    Record, per source file, its size, mtime, content hash, the parameters it was
+    processed with and the output files it produced, so re-runs can skip it.
+
+    Args:
+        output_dir (str): Output folder the manifest lives in
+        remove_output (callable): Called with the name of each output to delete;
+            outputs are files in output_dir by default (default: None)
+    """
+    def __init__(self, output_dir, remove_output=None):
+        self.output_dir = output_dir
+        self.remove_output = remove_output or self._remove_file
+        self.path = os.path.join(output_dir, MANIFEST_FILENAME)
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.entries = json.load(f)['sources']
+            except (ValueError, KeyError) as e:
+                print(f"Warning: Ignoring unreadable manifest {self.path}: {str(e)}")
+
+    def is_current(self, input_path, params):
+        """
+        Return True if input_path was already processed with the same parameters and
+        its content has not changed. Size and mtime are checked first; the file is
+        only hashed when they differ from the recorded values.
+
+        Args:
+            input_path (str): Absolute path of the source file, or an ArchiveMember
+            params (dict): Parameters the source would be processed with
+        """
+        entry = self.entries.get(input_path)
+        if entry is None or entry['params'] != params:
+            return False
+        size, mtime_ns = source_stat(input_path)
+        if size != entry['size']:
+            return False
+        if mtime_ns == entry['mtime_ns']:
+            return True
+        # Touched but possibly unchanged: fall back to the content hash
+        if file_digest(input_path) != entry['sha256']:
+            return False
+        entry['mtime_ns'] = mtime_ns
+        return True
+
+    def discard(self, input_path):
+        """
+        Forget a source and delete the outputs it produced.
+
+        Returns:
+            list: Names of the deleted output files
+        """
+        entry = self.entries.pop(input_path, None)
+        if entry is None:
+            return []
+        for output in entry['outputs']:
+            self.remove_output(output)
+        return entry['outputs']
+
+    def _remove_file(self, output):
+        try:
+            os.remove(os.path.join(self.output_dir, output))
+        except FileNotFoundError:
+            pass
+
+    def discard_missing(self, input_dir, input_paths):
+        """
+        Discard every source under input_dir, including its subfolders, that is no
+        longer in input_paths.
+
+        Returns:
+            list: Names of the deleted output files
+        """
+        present = set(input_paths)
+        removed = []
+        for input_path in list(self.entries):
+            if input_path.startswith(os.path.join(input_dir, '')) and input_path not in present:
+                removed.extend(self.discard(input_path))
+        return removed
+
+    def record(self, input_path, params, outputs):
+        """
+        Remember that input_path was processed with params into the given output files.
+        """
+        size, mtime_ns = source_stat(input_path)
+        self.entries[input_path] = {
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'sha256': file_digest(input_path),
+            'params': params,
+            'outputs': list(outputs),
+        }
+
+    def save(self):
+        # Write to a temporary file first so an interrupted save never corrupts the manifest
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': 1, 'sources': self.entries}, f, indent=1)
+        os.replace(tmp_path, self.path)
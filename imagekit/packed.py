@@ -0,0 +1,195 @@
+import os
+import json
+import numpy as np
+
+# Files of a packed dataset directory
+META_FILENAME = 'meta.json'
+DATA_FILENAME = 'images.u8'
+INDEX_FILENAME = 'index.jsonl'
+CAPTIONS_FILENAME = 'captions.jsonl'
+
+CHANNELS = 3
+
+class PackedDataset:
+    """
+    Fixed-size RGB crops packed into one raw uint8 file of shape N x size x size x 3,
+    read back without copies through numpy.memmap. Next to it, index.jsonl has one
+    line per sample (its source and face number) and captions.jsonl one line per
+    caption. All three files are only ever appended to, so later runs add samples
+    and captions to an existing dataset; samples are removed by appending a
+    tombstone to the index rather than by rewriting the data file.
+
+    Args:
+        path (str): Dataset directory
+        size (int): Side of the square samples; required to create a new dataset,
+            checked against an existing one (default: None, read it from meta.json)
+        writable (bool): Open for appending, creating the directory if needed (default: False)
+    """
+    def __init__(self, path, size=None, writable=False):
+        self.path = path
+        self.writable = writable
+        meta_path = os.path.join(path, META_FILENAME)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if size is not None and meta['size'] != size:
+                raise ValueError(f"{path} holds {meta['size']}x{meta['size']} samples, not {size}x{size}")
+            size = meta['size']
+        elif not writable:
+            raise FileNotFoundError(f"No packed dataset in {path}")
+        elif size is None:
+            raise ValueError("A size is required to create a packed dataset")
+        else:
+            os.makedirs(path, exist_ok=True)
+            tmp_path = meta_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': 1, 'size': size, 'channels': CHANNELS, 'dtype': 'uint8'}, f)
+            os.replace(tmp_path, meta_path)
+        self.size = size
+        self.sample_bytes = size * size * CHANNELS
+
+        self.samples = []
+        self.removed = set()
+        self.captions = {}
+        self._load_index()
+        self._load_captions()
+
+        self._data_file = None
+        self._index_file = None
+        self._captions_file = None
+        if writable:
+            self._truncate_partial()
+            self._data_file = open(self._file(DATA_FILENAME), 'ab')
+            self._index_file = open(self._file(INDEX_FILENAME), 'a')
+            self._captions_file = open(self._file(CAPTIONS_FILENAME), 'a')
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _read_jsonl(self, name):
+        # Returns (entries, complete); lines cut short by an interrupted run are skipped
+        if not os.path.exists(self._file(name)):
+            return [], True
+        entries = []
+        complete = True
+        with open(self._file(name)) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    complete = False
+        return entries, complete
+
+    def _load_index(self):
+        data_path = self._file(DATA_FILENAME)
+        self._data_size = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+        stored = self._data_size // self.sample_bytes
+        entries, self._index_complete = self._read_jsonl(INDEX_FILENAME)
+        for entry in entries:
+            if 'removed' in entry:
+                self.removed.add(entry['removed'])
+            elif len(self.samples) < stored:
+                self.samples.append(entry)
+            else:
+                self._index_complete = False
+        self.removed = {i for i in self.removed if i < len(self.samples)}
+
+    def _load_captions(self):
+        entries, _ = self._read_jsonl(CAPTIONS_FILENAME)
+        for entry in entries:
+            if entry['sample'] < len(self.samples):
+                self.captions[entry['sample']] = entry['caption']
+
+    def _truncate_partial(self):
+        # After an interrupted run the data and the index may disagree by a few
+        # samples; keep the ones both agree on before appending
+        if self._data_size != len(self.samples) * self.sample_bytes:
+            with open(self._file(DATA_FILENAME), 'r+b') as f:
+                f.truncate(len(self.samples) * self.sample_bytes)
+        if not self._index_complete:
+            with open(self._file(INDEX_FILENAME), 'w') as f:
+                for entry in self.samples:
+                    f.write(json.dumps(entry) + '\n')
+                for i in sorted(self.removed):
+                    f.write(json.dumps({'removed': i}) + '\n')
+        # A caption line cut short is skipped on reading once a newline ends it
+        captions_path = self._file(CAPTIONS_FILENAME)
+        if os.path.exists(captions_path) and os.path.getsize(captions_path):
+            with open(captions_path, 'rb+') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+
+    def __len__(self):
+        return len(self.samples)
+
+    def images(self):
+        """
+        Map every sample, removed ones included, into memory without reading it.
+
+        Returns:
+            numpy.ndarray: Read-only (N, size, size, 3) uint8 memmap
+        """
+        shape = (len(self.samples), self.size, self.size, CHANNELS)
+        if not self.samples:
+            return np.zeros(shape, dtype=np.uint8)
+        if self._data_file is not None:
+            self._data_file.flush()
+        return np.memmap(self._file(DATA_FILENAME), dtype=np.uint8, mode='r', shape=shape)
+
+    def __getitem__(self, index):
+        return self.images()[index]
+
+    def valid_indices(self):
+        """
+        Return the indices of the samples that were not removed, in order.
+        """
+        return np.array([i for i in range(len(self.samples)) if i not in self.removed], dtype=np.int64)
+
+    def append(self, pixels, **metadata):
+        """
+        Append one sample.
+
+        Args:
+            pixels (numpy.ndarray): (size, size, 3) uint8 RGB array
+            **metadata: JSON values recorded in the index, e.g. source and face
+
+        Returns:
+            int: Index of the new sample
+        """
+        pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+        if pixels.shape != (self.size, self.size, CHANNELS):
+            raise ValueError(f"Expected a {self.size}x{self.size} RGB sample, got shape {pixels.shape}")
+        index = len(self.samples)
+        entry = dict(metadata, sample=index)
+        self._data_file.write(pixels.data)
+        self._index_file.write(json.dumps(entry) + '\n')
+        self.samples.append(entry)
+        return index
+
+    def remove(self, index):
+        """
+        Mark a sample as removed; its pixels stay in the data file.
+        """
+        self._index_file.write(json.dumps({'removed': index}) + '\n')
+        self.removed.add(index)
+
+    def set_caption(self, index, caption):
+        """
+        Store the caption of a sample, replacing any earlier one.
+        """
+        self._captions_file.write(json.dumps({'sample': index, 'caption': caption}) + '\n')
+        self.captions[index] = caption
+
+    def flush(self):
+        # Data before index, so an index line never points past the data file
+        for f in (self._data_file, self._index_file, self._captions_file):
+            if f is not None:
+                f.flush()
+
+    def close(self):
+        self.flush()
+        for f in (self._data_file, self._index_file, self._captions_file):
+            if f is not None:
+                f.close()
+        self._data_file = self._index_file = self._captions_file = None
@@ -0,0 +1,258 @@
+import numpy as np
+from PIL import Image
+from imagekit.io import decode_image
+from imagekit.profiling import stage
+
+HASH_METHODS = ('dhash', 'phash')
+
+# Images are decoded (JPEG draft, HEIF thumbnail) no larger than this before hashing
+HASH_DECODE_SIDE = 64
+
+# pHash keeps the 8x8 lowest frequencies of a 32x32 DCT
+_PHASH_SIZE = 32
+_BIT_WEIGHTS = (1 << np.arange(63, -1, -1, dtype=np.uint64)).astype(np.uint64)
+
+def _dct_matrix(n):
+    # Orthonormal DCT-II basis, one row per frequency
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+_DCT = _dct_matrix(_PHASH_SIZE)[:8]
+
+def hash_thumbnail(img, method='dhash'):
+    """
+    Shrink an image to the grayscale thumbnail a hash is computed from: 9x8 for
+    dHash, 32x32 for pHash.
+
+    Args:
+        img (PIL.Image.Image): Image to hash
+        method (str): 'dhash' or 'phash' (default: 'dhash')
+
+    Returns:
+        numpy.ndarray: uint8 array of shape (8, 9) or (32, 32)
+    """
+    size = (9, 8) if method == 'dhash' else (_PHASH_SIZE, _PHASH_SIZE)
+    with stage('color'):
+        img = img.convert('L')
+    with stage('resize'):
+        return np.asarray(img.resize(size, Image.Resampling.BOX), dtype=np.uint8)
+
+def hash_input(input_path, method='dhash'):
+    """
+    Decode an image file straight to its hash thumbnail, see hash_thumbnail. JPEGs
+    are decoded at 1/8 scale and luma only.
+    """
+    return hash_thumbnail(decode_image(input_path, 'L', HASH_DECODE_SIDE), method)
+
+def pack_bits(bits):
+    """
+    Pack an (N, 64) boolean array into N uint64 hashes, first bit most significant.
+    """
+    return (bits.astype(np.uint64) * _BIT_WEIGHTS).sum(axis=1, dtype=np.uint64)
+
+def dhash(thumbnails):
+    """
+    Difference hashes of many 9x8 thumbnails at once: one bit per horizontally
+    adjacent pixel pair, set where brightness increases.
+
+    Args:
+        thumbnails (numpy.ndarray): (N, 8, 9) grayscale thumbnails
+
+    Returns:
+        numpy.ndarray: (N,) uint64 hashes
+    """
+    thumbnails = np.asarray(thumbnails, dtype=np.int16)
+    bits = thumbnails[:, :, 1:] > thumbnails[:, :, :-1]
+    return pack_bits(bits.reshape(len(thumbnails), 64))
+
+def phash(thumbnails):
+    """
+    Perceptual hashes of many 32x32 thumbnails at once: the 8x8 lowest DCT
+    frequencies, each compared with their median (the DC term is excluded from
+    the median).
+
+    Args:
+        thumbnails (numpy.ndarray): (N, 32, 32) grayscale thumbnails
+
+    Returns:
+        numpy.ndarray: (N,) uint64 hashes
+    """
+    thumbnails = np.asarray(thumbnails, dtype=np.float64)
+    # Separable 2D DCT of the whole batch, keeping only the low frequencies
+    low = np.einsum('ij,njk,lk->nil', _DCT, thumbnails, _DCT).reshape(len(thumbnails), 64)
+    median = np.median(low[:, 1:], axis=1, keepdims=True)
+    return pack_bits(low > median)
+
+def compute_hashes(thumbnails, method='dhash'):
+    return dhash(thumbnails) if method == 'dhash' else phash(thumbnails)
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(values):
+        return np.bitwise_count(np.asarray(values, dtype=np.uint64)).astype(np.int64)
+else:
+    _BYTE_COUNTS = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+    def popcount(values):
+        values = np.ascontiguousarray(values, dtype=np.uint64)
+        return _BYTE_COUNTS[values.view(np.uint8).reshape(values.shape + (8,))].sum(axis=-1)
+
+class HashIndex:
+    """
+    Multi-index hashing over 64-bit hashes: each hash is split into four 16-bit
+    chunks with one table per chunk. Two hashes within Hamming distance t must
+    differ by at most t // 4 bits in at least one chunk (pigeonhole), so a query
+    only probes the table entries within that radius of its own chunks and
+    compares the few hashes found there, instead of every indexed hash.
+
+    Args:
+        threshold (int): Largest Hamming distance that counts as a match (0-63)
+    """
+    CHUNKS = 4
+    CHUNK_BITS = 16
+
+    def __init__(self, threshold):
+        if not 0 <= threshold < 64:
+            raise ValueError(f"Hamming threshold must be between 0 and 63, got {threshold}")
+        self.threshold = threshold
+        self.probes = _chunk_probes(threshold // self.CHUNKS, self.CHUNK_BITS)
+        self.tables = [{} for _ in range(self.CHUNKS)]
+        self.hashes = []
+
+    def _chunks(self, value):
+        mask = (1 << self.CHUNK_BITS) - 1
+        return [(value >> (i * self.CHUNK_BITS)) & mask for i in range(self.CHUNKS)]
+
+    def add(self, value):
+        """
+        Insert a hash and return its id (insertion index).
+        """
+        value = int(value)
+        index = len(self.hashes)
+        self.hashes.append(value)
+        for chunk, table in zip(self._chunks(value), self.tables):
+            table.setdefault(chunk, []).append(index)
+        return index
+
+    def query(self, value):
+        """
+        Return the indexed hashes within the threshold, sorted by distance then id.
+
+        Returns:
+            list: (id, distance) pairs
+        """
+        value = int(value)
+        candidates = set()
+        for chunk, table in zip(self._chunks(value), self.tables):
+            for probe in self.probes:
+                ids = table.get(chunk ^ probe)
+                if ids:
+                    candidates.update(ids)
+        if not candidates:
+            return []
+        ids = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        distances = popcount(np.array([self.hashes[i] for i in ids], dtype=np.uint64) ^ np.uint64(value))
+        keep = distances <= self.threshold
+        return sorted(zip(ids[keep].tolist(), distances[keep].tolist()), key=lambda pair: (pair[1], pair[0]))
+
+    def __len__(self):
+        return len(self.hashes)
+
+def _chunk_probes(radius, chunk_bits):
+    # Every chunk value within `radius` bits of zero, XORed onto a chunk to probe its neighbours
+    return [value for value in range(1 << chunk_bits) if bin(value).count('1') <= radius]
+
+def near_pairs(hashes, threshold):
+    """
+    All pairs of hashes within the threshold Hamming distance, found with the
+    same multi-index scheme as HashIndex but for the whole batch at once: for
+    every chunk and probe, one vectorized lookup in a table of 16-bit bucket
+    offsets yields the candidate pairs, which are then checked by popcount.
+
+    Args:
+        hashes (numpy.ndarray): (N,) uint64 hashes, assumed distinct
+        threshold (int): Largest Hamming distance that counts as a match
+
+    Returns:
+        tuple: (i, j, distance) int64 arrays with j < i, sorted by i, distance, j
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    count = len(hashes)
+    chunk_bits = HashIndex.CHUNK_BITS
+    probes = np.array(_chunk_probes(threshold // HashIndex.CHUNKS, chunk_bits), dtype=np.int64)
+    positions = np.arange(count)
+    found = []
+    for c in range(HashIndex.CHUNKS):
+        chunk = ((hashes >> np.uint64(c * chunk_bits)) & np.uint64((1 << chunk_bits) - 1)).astype(np.int64)
+        order = np.argsort(chunk, kind='stable')
+        # starts[v]:starts[v + 1] is the range of sorted positions holding chunk value v
+        starts = np.searchsorted(chunk[order], np.arange((1 << chunk_bits) + 1))
+        for probe in probes:
+            target = chunk ^ probe
+            low = starts[target]
+            counts = starts[target + 1] - low
+            total = int(counts.sum())
+            if not total:
+                continue
+            i = np.repeat(positions, counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            j = order[np.repeat(low, counts) + offsets]
+            keep = j < i
+            i, j = i[keep], j[keep]
+            distance = popcount(hashes[i] ^ hashes[j])
+            keep = distance <= threshold
+            found.append((i[keep], j[keep], distance[keep]))
+    if not found:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    i, j, distance = (np.concatenate(parts) for parts in zip(*found))
+    # A pair close in several chunks is found once per chunk
+    i, distance, j = np.unique(np.stack([i, distance, j], axis=1), axis=0).T
+    return i, j, distance
+
+def find_duplicates(hashes, threshold):
+    """
+    Walk hashes in order, keeping each one unless it is within the threshold of
+    an already kept hash; the first image of every group is the one kept.
+    Identical hashes are collapsed first and the rest is matched with
+    near_pairs, so a large folder never needs all-pairs comparisons.
+
+    Args:
+        hashes (numpy.ndarray): (N,) uint64 hashes
+        threshold (int): Largest Hamming distance that counts as a duplicate
+
+    Returns:
+        list: For each hash, None if it is kept, else (index of the kept hash it duplicates, distance)
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    if not len(hashes):
+        return []
+    # Distinct values, numbered in order of their first occurrence
+    values, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+    by_first = np.argsort(first)
+    rank = np.empty_like(by_first)
+    rank[by_first] = np.arange(len(by_first))
+    distinct = values[by_first]
+    first = first[by_first]
+    inverse = rank[inverse.ravel()]
+
+    # Leader of every distinct value: itself if kept, else the closest earlier kept value
+    leader = np.arange(len(distinct))
+    leader_distance = np.zeros(len(distinct), dtype=np.int64)
+    kept = np.ones(len(distinct), dtype=bool)
+    decided = -1
+    for i, j, distance in zip(*(part.tolist() for part in near_pairs(distinct, threshold))):
+        if i != decided and kept[j]:
+            kept[i] = False
+            leader[i] = j
+            leader_distance[i] = distance
+            decided = i
+
+    matches = []
+    for position, value in enumerate(inverse.tolist()):
+        if kept[value]:
+            matches.append(None if first[value] == position else (int(first[value]), 0))
+        else:
+            matches.append((int(first[leader[value]]), int(leader_distance[value])))
+    return matches
@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+# Trace file of the current run; set by start_profile and inherited by worker processes
+PROFILE_ENV = 'IMAGEKIT_PROFILE'
+
+# Stages timed across the toolkit, in pipeline order; summaries list them in this order
+STAGES = ('decode', 'color', 'detection', 'crop', 'resize', 'encode', 'write', 'api')
+
+PERCENTILES = (50, 95, 99)
+
+_trace_path = os.environ.get(PROFILE_ENV) or None
+_trace_fd = None
+_trace_pid = None
+_trace_lock = threading.Lock()
+_local = threading.local()
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        record = getattr(_local, 'record', None)
+        if record is None:
+            # Outside any item, e.g. loading a model: a trace line of its own
+            _write({'item': None, 'pid': os.getpid(), 'stages': {self.name: elapsed}})
+        else:
+            record[self.name] = record.get(self.name, 0.0) + elapsed
+        return False
+
+def enabled():
+    return _trace_path is not None
+
+def stage(name):
+    """
+    Time a block as one stage of the item being processed on this thread, e.g.
+    `with stage('decode'):`. Repeated stages of one item add up. Costs a single
+    check when profiling is off.
+
+    Args:
+        name (str): Stage name, usually one of STAGES
+    """
+    if _trace_path is None:
+        return _NULL_STAGE
+    return _Stage(name)
+
+@contextmanager
+def item(name):
+    """
+    Collect the stages timed on this thread inside the block into one trace line
+    for an item, e.g. an input image. Lines with the same name, say detection in
+    a worker process and the write in the parent, are merged in the summary.
+
+    Args:
+        name (str): Item name, usually the input path
+    """
+    if _trace_path is None:
+        yield
+        return
+    outer = getattr(_local, 'record', None)
+    _local.record = {}
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record = _local.record
+        _local.record = outer
+        _write({'item': name, 'pid': os.getpid(), 'time': time.time(),
+                'total': time.perf_counter() - start, 'stages': record})
+
+def _write(entry):
+    global _trace_fd, _trace_pid
+    line = (json.dumps(entry) + '\n').encode('utf-8')
+    with _trace_lock:
+        if _trace_pid != os.getpid():
+            # Every process, forked workers included, opens its own descriptor; with
+            # O_APPEND each single write lands as a whole line at the end of the file
+            _trace_fd = os.open(_trace_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            _trace_pid = os.getpid()
+        os.write(_trace_fd, line)
+
+def enable(trace_path):
+    """
+    Start a new trace at trace_path, truncating it, for this process and every
+    process it starts from now on.
+    """
+    global _trace_path
+    _trace_path = os.path.abspath(trace_path)
+    os.environ[PROFILE_ENV] = _trace_path
+    open(_trace_path, 'w').close()
+
+def peak_rss_mib(children=False):
+    """
+    Return the peak resident set size of this process, or of its largest finished
+    child process, in MiB.
+    """
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return rss / (1 << 20) if sys.platform == 'darwin' else rss / 1024
+
+def percentile(values, q):
+    import statistics
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1]
+
+def summarize(trace_path, wall_time):
+    """
+    Aggregate a trace into per-stage statistics. A stage's samples are its total
+    time per item, plus every stage timed outside an item.
+
+    Args:
+        trace_path (str): JSONL trace written during the run
+        wall_time (float): Duration of the run in seconds
+
+    Returns:
+        dict: items, wall_time, items_per_second, peak RSS of the process and of
+        its worker processes in MiB, and per stage count, total and p50/p95/p99 in seconds
+    """
+    items = {}
+    loose = {}
+    with open(trace_path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if 'stages' not in entry:
+                continue
+            if entry['item'] is None:
+                for name, seconds in entry['stages'].items():
+                    loose.setdefault(name, []).append(seconds)
+                continue
+            record = items.setdefault(str(entry['item']), {})
+            for name, seconds in entry['stages'].items():
+                record[name] = record.get(name, 0.0) + seconds
+
+    samples = {name: list(values) for name, values in loose.items()}
+    for record in items.values():
+        for name, seconds in record.items():
+            samples.setdefault(name, []).append(seconds)
+    order = list(STAGES) + sorted(set(samples) - set(STAGES))
+    stages = {}
+    for name in order:
+        if name in samples:
+            values = samples[name]
+            stages[name] = dict({'count': len(values), 'total': sum(values)},
+                                **{f"p{q}": percentile(values, q) for q in PERCENTILES})
+    return {
+        'items': len(items),
+        'wall_time': wall_time,
+        'items_per_second': len(items) / wall_time if wall_time > 0 else 0.0,
+        'peak_rss_mib': peak_rss_mib(),
+        'peak_worker_rss_mib': peak_rss_mib(children=True),
+        'stages': stages,
+    }
+
+def print_summary(summary):
+    workers = f" (child processes: {summary['peak_worker_rss_mib']:.0f} MiB)" if summary['peak_worker_rss_mib'] else ''
+    print(f"Profile: {summary['items']} image(s) in {summary['wall_time']:.2f} s, "
+          f"{summary['items_per_second']:.1f} images/s, peak RSS {summary['peak_rss_mib']:.0f} MiB{workers}")
+    print(f"{'stage':<12}{'count':>8}{'total s':>10}" + ''.join(f"{f'p{q} ms':>10}" for q in PERCENTILES))
+    for name, stats in summary['stages'].items():
+        print(f"{name:<12}{stats['count']:>8}{stats['total']:>10.2f}"
+              + ''.join(f"{stats[f'p{q}'] * 1000:>10.1f}" for q in PERCENTILES))
+
+def add_profile_arguments(parser):
+    """
+    Add the --profile and --profile_trace options shared by every script.
+    """
+    parser.add_argument('--profile', action='store_true',
+                        help='Time every stage per image; write a JSONL trace and print p50/p95/p99 per stage, images/s and peak RSS at the end')
+    parser.add_argument('--profile_trace', type=str, default=None,
+                        help='Trace file written with --profile (default: profile-<script>-<time>.jsonl in the current directory)')
+
+def start_profile(args, script_name):
+    """
+    Turn profiling on if --profile was given. The summary is printed and appended
+    to the trace when the script exits, however it exits.
+
+    Args:
+        args (argparse.Namespace): Parsed arguments, see add_profile_arguments
+        script_name (str): Name used in the default trace file name
+
+    Returns:
+        str: Path of the trace, or None if profiling is off
+    """
+    if not args.profile:
+        return None
+    trace_path = args.profile_trace or f"profile-{script_name}-{time.strftime('%Y%m%d-%H%M%S')}.jsonl"
+    enable(trace_path)
+    atexit.register(_finish, _trace_path, time.perf_counter(), os.getpid())
+    return _trace_path
+
+def _finish(trace_path, start, pid):
+    # Worker processes inherit the handler when forked; only the main process reports
+    if os.getpid() != pid:
+        return
+    summary = summarize(trace_path, time.perf_counter() - start)
+    _write({'summary': summary})
+    print_summary(summary)
+    print(f"Profile trace: {trace_path}")
@@ -0,0 +1,91 @@
+import numpy as np
+
+# Window and constants of the usual SSIM definition (K1=0.01, K2=0.03, 8-bit range)
+SSIM_WINDOW = 7
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+def _luma(image):
+    """
+    Return an image as a float64 luma array.
+    """
+    if hasattr(image, 'convert'):
+        image = image.convert('L')
+    pixels = np.asarray(image, dtype=np.float64)
+    if pixels.ndim == 3:
+        # ITU-R 601-2 weights, as used by Pillow's convert('L')
+        pixels = pixels[..., :3] @ np.array([0.299, 0.587, 0.114])
+    return pixels
+
+def psnr(reference, image):
+    """
+    Peak signal-to-noise ratio between two same-size images, in dB.
+
+    Args:
+        reference: PIL image or uint8 array
+        image: PIL image or uint8 array of the same shape
+
+    Returns:
+        float: PSNR in dB (inf for identical images)
+    """
+    reference = np.asarray(reference, dtype=np.float64)
+    image = np.asarray(image, dtype=np.float64)
+    if reference.shape != image.shape:
+        raise ValueError(f"Shape mismatch: {reference.shape} vs {image.shape}")
+    mse = np.mean((reference - image) ** 2)
+    if mse == 0:
+        return float('inf')
+    return float(10 * np.log10(255.0 ** 2 / mse))
+
+def _box_mean(pixels, window):
+    # Mean over every window x window block, from a summed-area table
+    table = np.pad(pixels, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+    sums = table[window:, window:] - table[:-window, window:] - table[window:, :-window] + table[:-window, :-window]
+    return sums / (window * window)
+
+def ssim(reference, image, window=SSIM_WINDOW):
+    """
+    Mean structural similarity of the luma of two same-size images, using a
+    uniform window over every valid position.
+
+    Args:
+        reference: PIL image or uint8 array
+        image: PIL image or uint8 array of the same size
+        window (int): Side of the sliding window (default: 7)
+
+    Returns:
+        float: SSIM, 1.0 for identical images
+    """
+    return ssim_reference(reference, window)(image)
+
+def ssim_reference(reference, window=SSIM_WINDOW):
+    """
+    Precompute the reference side of ssim(), to compare many images against one,
+    e.g. encodes of it at several qualities, at about half the cost per image.
+
+    Args:
+        reference: PIL image or uint8 array
+        window (int): Side of the sliding window (default: 7)
+
+    Returns:
+        function: Takes an image of the same size and returns its SSIM against reference
+    """
+    x = _luma(reference)
+    mu_x = _box_mean(x, window)
+    # Sample (co)variances, as in the reference implementation
+    correction = window * window / (window * window - 1)
+    var_x = (_box_mean(x * x, window) - mu_x * mu_x) * correction
+    mu_x_sq = mu_x * mu_x
+
+    def compare(image):
+        y = _luma(image)
+        if x.shape != y.shape:
+            raise ValueError(f"Shape mismatch: {x.shape} vs {y.shape}")
+        mu_y = _box_mean(y, window)
+        var_y = (_box_mean(y * y, window) - mu_y * mu_y) * correction
+        cov = (_box_mean(x * y, window) - mu_x * mu_y) * correction
+        ssim_map = ((2 * mu_x * mu_y + SSIM_C1) * (2 * cov + SSIM_C2)) / \
+                   ((mu_x_sq + mu_y ** 2 + SSIM_C1) * (var_x + var_y + SSIM_C2))
+        return float(ssim_map.mean())
+
+    return compare
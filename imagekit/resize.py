@@ -0,0 +1,110 @@
+import math
+from PIL import Image
+from imagekit.profiling import stage
+
+# 'fast' reduces by an integer factor first; 'exact' is a single LANCZOS pass over the crop
+RESIZE_MODES = ('fast', 'exact')
+
+# The final LANCZOS pass always shrinks by at least this much after the integer reduction
+REDUCING_GAP = 2.0
+
+# Reach of the LANCZOS filter around a target pixel, in source pixels per unit of scale
+LANCZOS_SUPPORT = 3.0
+
+def reduce_factor(source_side, size, reducing_gap=REDUCING_GAP):
+    """
+    Largest integer downscale of a source that still leaves `reducing_gap` times
+    the target side for the final LANCZOS pass.
+
+    Args:
+        source_side (float): Side of the region to resize, in pixels
+        size (int): Target side in pixels
+        reducing_gap (float): Minimum ratio left for LANCZOS (default: 2.0)
+
+    Returns:
+        int: Reduction factor, at least 1
+    """
+    return max(1, int(source_side // (size * reducing_gap)))
+
+def crop_reduce_factor(boxes, size, reducing_gap=REDUCING_GAP):
+    """
+    Integer downscale an image can be decoded at so that every crop box still
+    keeps enough pixels for resize_square, e.g. to pick a JPEG draft scale.
+
+    Args:
+        boxes (numpy.ndarray): (N, 4) crop boxes (left, top, right, bottom); empty boxes are ignored
+        size (int): Target side in pixels
+        reducing_gap (float): Minimum ratio left for LANCZOS (default: 2.0)
+
+    Returns:
+        int: Reduction factor, at least 1
+    """
+    sides = boxes[:, 2] - boxes[:, 0]
+    sides = sides[sides > 0]
+    if not len(sides):
+        return 1
+    return reduce_factor(sides.min(), size, reducing_gap)
+
+def resize_square(img, box, size=512, mode='fast', reducing_gap=REDUCING_GAP):
+    """
+    Resize a square region of an image to size x size.
+
+    In 'fast' mode the region is first shrunk by an integer factor with
+    Image.reduce (a box average, cheap at any factor) and LANCZOS only covers the
+    remaining, at most `reducing_gap`-fold downscale; the region is read in place
+    and never copied out. 'exact' crops and runs LANCZOS over the full region.
+
+    Args:
+        img (PIL.Image.Image): Source image
+        box (tuple): (left, top, right, bottom) of the region; may be fractional in 'fast' mode
+        size (int): Target side in pixels (default: 512)
+        mode (str): 'fast' or 'exact' (default: 'fast')
+        reducing_gap (float): Minimum ratio left for LANCZOS in 'fast' mode (default: 2.0)
+
+    Returns:
+        PIL.Image.Image: The resized square image
+    """
+    if mode == 'exact':
+        with stage('crop'):
+            img = img.crop(box)
+        with stage('resize'):
+            return img.resize((size, size), Image.Resampling.LANCZOS)
+    if mode != 'fast':
+        raise ValueError(f"Unknown resize mode: {mode}")
+    with stage('resize'):
+        return img.resize((size, size), Image.Resampling.LANCZOS, box=box, reducing_gap=reducing_gap)
+
+def resize_square_array(pixels, box, size=512, mode='fast', reducing_gap=REDUCING_GAP):
+    """
+    resize_square for an RGB array, e.g. a frame in shared memory. Only the
+    pixels the filters read around the box are copied into an image, not the
+    whole frame. With an integer box the result is identical to resizing from
+    the full image; fractional boxes may differ by one level from float rounding.
+
+    Args:
+        pixels (numpy.ndarray): (height, width, 3) uint8 source
+        box (tuple): (left, top, right, bottom) of the region; may be fractional in 'fast' mode
+        size (int): Target side in pixels (default: 512)
+        mode (str): 'fast' or 'exact' (default: 'fast')
+        reducing_gap (float): Minimum ratio left for LANCZOS in 'fast' mode (default: 2.0)
+
+    Returns:
+        PIL.Image.Image: The resized square image
+    """
+    height, width = pixels.shape[:2]
+    if mode == 'exact':
+        # Image.crop rounds the box the same way
+        left, top, right, bottom = (int(round(v)) for v in box)
+        with stage('crop'):
+            region = Image.fromarray(pixels[max(0, top):bottom, max(0, left):right])
+        with stage('resize'):
+            return region.resize((size, size), Image.Resampling.LANCZOS)
+    if mode != 'fast':
+        raise ValueError(f"Unknown resize mode: {mode}")
+    left, top, right, bottom = box
+    margin = math.ceil(LANCZOS_SUPPORT * max(1.0, (right - left) / size)) + 2
+    x0, y0 = max(0, int(left) - margin), max(0, int(top) - margin)
+    x1, y1 = min(width, math.ceil(right) + margin), min(height, math.ceil(bottom) + margin)
+    with stage('crop'):
+        region = Image.fromarray(pixels[y0:y1, x0:x1])
+    return resize_square(region, (left - x0, top - y0, right - x0, bottom - y0), size, mode, reducing_gap)
@@ -0,0 +1,474 @@
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from multiprocessing import Pool
+from multiprocessing.util import Finalize
+import numpy as np
+from imagekit import detection
+from imagekit.cache import open_detection_cache
+from imagekit.crops import encode_face_crops, error_message, process_image
+from imagekit.detection import load_for_detection, run_detection
+from imagekit.encode import OutputEncoder
+from imagekit.frames import FrameRing
+from imagekit.profiling import stage, item as profile_item
+from imagekit.tiling import create_tiled_detector, tiling_variant
+
+# Crop context of the current worker process (see _init_worker)
+_worker_context = None
+
+# Frame ring and detection cache of the current decoder process (see _init_decoder)
+_decoder_ring = None
+_decoder_cache = None
+
+class CropOptions:
+    """
+    What to detect and crop, the same whichever strategy runs it. Plain values
+    only, so that worker processes can be handed a copy.
+
+    Args:
+        size (int): Target size for the output square images (default: 512)
+        proxy_size (int): Maximum side of the detection proxy, see process_image (default: None)
+        resize (str): 'fast' or 'exact', see process_image (default: 'fast')
+        raw (bool): Yield crops as arrays instead of encoded bytes, see process_image (default: False)
+        model_selection (int): Detector model, see create_face_detector (default: 1)
+        min_detection_confidence (float): Detector confidence threshold (default: 0.5)
+        cache_path (str): Detection cache database; None disables the cache (default: None)
+        cache_entries (int): Maximum number of cached detections (default: 100000)
+        tiling (dict): Tiled detection options, see imagekit.tiling.TiledFaceDetector (default: None, single pass)
+        encoding (dict): OutputEncoder options, see imagekit.encode (default: None, quality 95 JPEG)
+    """
+    def __init__(self, size=512, proxy_size=None, resize='fast', raw=False, model_selection=1,
+                 min_detection_confidence=0.5, cache_path=None, cache_entries=100000, tiling=None, encoding=None):
+        self.size = size
+        self.proxy_size = proxy_size
+        self.resize = resize
+        self.raw = raw
+        self.model_selection = model_selection
+        self.min_detection_confidence = min_detection_confidence
+        self.cache_path = cache_path
+        self.cache_entries = cache_entries
+        self.tiling = tiling
+        self.encoding = encoding
+
+    def create_detector(self, tile_workers=True):
+        # Looked up on every call so that a patched create_face_detector, e.g. in benchmarks
+        # and tests, is used for tiles and worker processes too
+        tiling = self.tiling if tile_workers or not self.tiling else dict(self.tiling, workers=0)
+        return create_tiled_detector(detection.create_face_detector,
+                                     (self.model_selection, self.min_detection_confidence), tiling)
+
+    def open_cache(self):
+        if not self.cache_path:
+            return None
+        return open_detection_cache(self.cache_path, self.model_selection, self.min_detection_confidence,
+                                    self.cache_entries, tiling_variant(self.tiling))
+
+    def create_encoder(self):
+        return OutputEncoder(**self.encoding) if self.encoding else None
+
+class CropContext:
+    """
+    The detector, detection cache and output encoder one process crops with,
+    kept for its whole lifetime.
+
+    Args:
+        options (CropOptions): What to detect and crop
+        tile_workers (bool): Whether tiled detection may start worker processes,
+            which daemonic pool workers cannot (default: True)
+    """
+    def __init__(self, options, tile_workers=True):
+        self.options = options
+        self.face_detection = None
+        self.cache = None
+        self.encoder = None
+        try:
+            self.encoder = options.create_encoder()
+            self.face_detection = options.create_detector(tile_workers)
+            self.cache = options.open_cache()
+        except BaseException:
+            self.close()
+            raise
+
+    def process(self, input_path):
+        """
+        Detect and crop every face in one image, see process_image.
+        """
+        options = self.options
+        return process_image(input_path, self.face_detection, options.size, options.proxy_size, options.resize,
+                             self.cache, options.raw, self.encoder)
+
+    def close(self):
+        if self.face_detection is not None:
+            self.face_detection.close()
+            self.face_detection = None
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+        if self.encoder is not None:
+            self.encoder.close()
+            self.encoder = None
+
+class CropStrategy:
+    """
+    How detection and cropping run over many images. Every strategy yields the
+    same (faces, messages) per input path, in source order, so outputs are
+    numbered the same whichever one runs.
+
+    Args:
+        options (CropOptions): What to detect and crop
+    """
+    def __init__(self, options):
+        self.options = options
+
+    def run(self, input_paths):
+        """
+        Detect and crop every face in each image.
+
+        Yields:
+            tuple: (faces, messages) for each input path, as returned by process_image
+        """
+        raise NotImplementedError
+
+    def describe(self):
+        """
+        One line on how the images are processed, or None for the plain serial loop.
+        """
+        return None
+
+class SerialCrops(CropStrategy):
+    """
+    One image after the other in this process.
+    """
+    def run(self, input_paths):
+        context = CropContext(self.options)
+        try:
+            yield from self.crops(context, input_paths)
+        finally:
+            context.close()
+
+    def run_batches(self, batches):
+        """
+        Process batches of images as they arrive, e.g. from a FolderWatcher, with
+        one detector, cache and encoder kept for the whole run instead of one per batch.
+
+        Args:
+            batches: Iterable of lists of input paths, which may block until the next batch arrives
+
+        Yields:
+            tuple: (input_path, (faces, messages)) for each path, in batch order
+        """
+        context = CropContext(self.options)
+        try:
+            for batch in batches:
+                # Results first, so a pipelined batch finishes and shuts its threads down
+                for result, input_path in zip(self.crops(context, batch), batch):
+                    yield input_path, result
+        finally:
+            context.close()
+
+    def crops(self, context, input_paths):
+        for input_path in input_paths:
+            yield context.process(input_path)
+
+def _read_job(input_path, proxy_size, cache):
+    # Reader thread: cache lookup, or decode of the image the detector needs
+    try:
+        with profile_item(input_path):
+            return load_for_detection(input_path, proxy_size, cache), None
+    except Exception as e:
+        return None, error_message(input_path, e)
+
+def _encode_job(input_path, detections, full_size, image, options, encoder):
+    # Writer thread: full decode if still needed, crop, resize and encode
+    try:
+        with profile_item(input_path):
+            return encode_face_crops(input_path, detections, full_size, image, options.size, options.resize,
+                                     options.raw, encoder)
+    except Exception as e:
+        return [], [error_message(input_path, e)]
+
+def _done(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+class PipelinedCrops(SerialCrops):
+    """
+    Three overlapping stages in this process: a reader thread pool reads and
+    decodes images ahead, this thread runs the detector, and a writer thread
+    pool crops, resizes and encodes. At most queue_size decoded images and
+    queue_size encoded results are held between the stages.
+
+    Args:
+        options (CropOptions): What to detect and crop
+        read_threads (int): Reader threads (default: 2)
+        write_threads (int): Writer threads (default: 2)
+        queue_size (int): Images held between two stages (default: 8)
+    """
+    def __init__(self, options, read_threads=2, write_threads=2, queue_size=8):
+        super().__init__(options)
+        self.read_threads = max(1, read_threads)
+        self.write_threads = max(1, write_threads)
+        self.queue_size = max(1, queue_size)
+
+    def describe(self):
+        return f"Pipelining with {self.read_threads} reader and {self.write_threads} writer thread(s)"
+
+    def crops(self, context, input_paths):
+        options = self.options
+        cache = context.cache
+        paths = iter(input_paths)
+        reads = deque()
+        encodes = deque()
+        readers = ThreadPoolExecutor(self.read_threads, thread_name_prefix='crop-reader')
+        writers = ThreadPoolExecutor(self.write_threads, thread_name_prefix='crop-writer')
+        try:
+            for input_path in islice(paths, self.queue_size):
+                reads.append((input_path, readers.submit(_read_job, input_path, options.proxy_size, cache)))
+            while reads:
+                input_path, future = reads.popleft()
+                loaded, error = future.result()
+                # Refill the read queue before detecting, so the readers never wait on the detector
+                for next_path in islice(paths, 1):
+                    reads.append((next_path, readers.submit(_read_job, next_path, options.proxy_size, cache)))
+
+                if error is not None:
+                    encodes.append(_done(([], [error])))
+                else:
+                    key, detections, full_size, detect_image, image = loaded
+                    try:
+                        if detections is None:
+                            with profile_item(input_path):
+                                detections = run_detection(context.face_detection, detect_image, key, cache)
+                    except Exception as e:
+                        encodes.append(_done(([], [error_message(input_path, e)])))
+                    else:
+                        encodes.append(writers.submit(_encode_job, input_path, detections, full_size, image, options,
+                                                      context.encoder))
+
+                # Hand back finished results in order; block only when the queue is full
+                while encodes and (len(encodes) >= self.queue_size or encodes[0].done()):
+                    yield encodes.popleft().result()
+            while encodes:
+                yield encodes.popleft().result()
+        finally:
+            readers.shutdown(cancel_futures=True)
+            writers.shutdown(cancel_futures=True)
+
+def _init_decoder(ring_name, slots, slot_bytes, options):
+    """
+    Attach each decoder process to the frame ring and give it its own cache connection.
+    """
+    global _decoder_ring, _decoder_cache
+    _decoder_ring = FrameRing(slots, slot_bytes, ring_name)
+    Finalize(None, _decoder_ring.close, exitpriority=10)
+    _decoder_cache = options.open_cache()
+    if _decoder_cache is not None:
+        Finalize(None, _decoder_cache.close, exitpriority=10)
+
+def _decode_in_worker(job):
+    # Decoder process: cache lookup, or decode and copy the detector's frame into its slot.
+    # Only this small dict goes back through the pipe
+    input_path, proxy_size, slot = job
+    try:
+        with profile_item(input_path):
+            key, detections, full_size, detect_image, _ = load_for_detection(input_path, proxy_size, _decoder_cache)
+            if detections is not None:
+                return {'slot': slot, 'key': key, 'detections': detections, 'size': full_size}
+            pixels = np.asarray(detect_image)
+            if not _decoder_ring.fits(pixels.shape):
+                # Larger than a slot: pickled through the pipe instead
+                return {'slot': slot, 'key': key, 'size': full_size, 'pixels': pixels}
+            with stage('frame'):
+                shape = _decoder_ring.write(slot, pixels)
+            return {'slot': slot, 'key': key, 'size': full_size, 'shape': shape}
+    except Exception as e:
+        return {'slot': slot, 'error': error_message(input_path, e)}
+
+def _encode_frame_job(ring, slot, input_path, detections, full_size, image, options, encoder):
+    # Writer thread: crop from the shared frame (or a fresh decode), then recycle the slot
+    try:
+        return _encode_job(input_path, detections, full_size, image, options, encoder)
+    finally:
+        del image
+        if slot is not None:
+            ring.release(slot)
+
+class SharedFrameCrops(CropStrategy):
+    """
+    Decoder processes decode into a shared memory FrameRing of queue_size slots
+    and this process detects on the frames in place, cropping on writer
+    threads; a slot is recycled once the crops of its frame are encoded.
+
+    Args:
+        options (CropOptions): What to detect and crop
+        decoders (int): Decoder processes
+        write_threads (int): Writer threads (default: 0, one)
+        queue_size (int): Frame slots, and encoded results held (default: 8)
+        frame_megapixels (float): Largest frame a slot holds without a proxy; larger
+            frames are pickled through the pipe (default: 24)
+    """
+    def __init__(self, options, decoders, write_threads=0, queue_size=8, frame_megapixels=24):
+        super().__init__(options)
+        self.decoders = decoders
+        self.write_threads = max(1, write_threads)
+        self.queue_size = max(1, queue_size)
+        # A proxy frame never exceeds proxy_size on its longest side
+        proxy_size = options.proxy_size
+        self.slot_bytes = proxy_size * proxy_size * 3 if proxy_size else int(frame_megapixels * 1e6) * 3
+
+    @property
+    def ring_bytes(self):
+        """
+        Shared memory the frame ring takes once every slot was written.
+        """
+        return self.queue_size * self.slot_bytes
+
+    def describe(self):
+        return (f"Decoding in {self.decoders} process(es) into {self.queue_size} shared memory frame slots, "
+                f"cropping on {self.write_threads} writer thread(s)")
+
+    def run(self, input_paths):
+        options = self.options
+        ring = FrameRing(self.queue_size, self.slot_bytes)
+        pool = None
+        context = None
+        try:
+            pool = Pool(self.decoders, initializer=_init_decoder,
+                        initargs=(ring.name, self.queue_size, self.slot_bytes, options))
+            context = CropContext(options)
+            yield from self._frames(pool, ring, input_paths, context)
+        except BaseException:
+            if pool is not None:
+                pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            if pool is not None:
+                pool.join()
+            if context is not None:
+                context.close()
+            ring.close()
+
+    def _frames(self, pool, ring, input_paths, context):
+        # Detect on frames written into the ring by the decoder pool and crop from them
+        # on writer threads, yielding results in source order
+        options = self.options
+        stopped = threading.Event()
+
+        def jobs():
+            # Runs on the pool's task thread: a job is only handed out once a slot is free
+            for input_path in input_paths:
+                slot = None
+                while slot is None:
+                    if stopped.is_set():
+                        return
+                    slot = ring.acquire(timeout=0.1)
+                yield input_path, options.proxy_size, slot
+
+        encodes = deque()
+        writers = ThreadPoolExecutor(self.write_threads, thread_name_prefix='crop-writer')
+        try:
+            for input_path, decoded in zip(input_paths, pool.imap(_decode_in_worker, jobs())):
+                slot = decoded['slot'] if 'shape' in decoded else None
+                if slot is None:
+                    ring.release(decoded['slot'])
+                if 'error' in decoded:
+                    encodes.append(_done(([], [decoded['error']])))
+                else:
+                    frame = ring.frame(slot, decoded['shape']) if slot is not None else decoded.get('pixels')
+                    detections = decoded.get('detections')
+                    try:
+                        if detections is None:
+                            with profile_item(input_path):
+                                detections = run_detection(context.face_detection, frame, decoded['key'], context.cache)
+                    except Exception as e:
+                        if slot is not None:
+                            ring.release(slot)
+                        encodes.append(_done(([], [error_message(input_path, e)])))
+                    else:
+                        # A proxy frame is not the full image, so its crops come from a reduced-scale decode
+                        image = None if options.proxy_size else frame
+                        encodes.append(writers.submit(_encode_frame_job, ring, slot, input_path, detections,
+                                                      decoded['size'], image, options, context.encoder))
+                        del image
+                    del frame
+
+                while encodes and (len(encodes) >= self.queue_size or encodes[0].done()):
+                    yield encodes.popleft().result()
+            while encodes:
+                yield encodes.popleft().result()
+        finally:
+            stopped.set()
+            writers.shutdown(cancel_futures=True)
+
+def _init_worker(options):
+    """
+    Give each worker process its own detector, cache connection and encoder for its whole lifetime.
+    """
+    global _worker_context
+    # Worker processes are daemons and cannot start tile workers of their own
+    _worker_context = CropContext(options, tile_workers=False)
+    # Runs when the worker exits normally, releasing e.g. a detection service connection
+    Finalize(None, _worker_context.close, exitpriority=10)
+
+def _process_in_worker(input_path):
+    return _worker_context.process(input_path)
+
+class PoolCrops(CropStrategy):
+    """
+    Worker processes, each with its own detector, cache connection and encoder.
+
+    Args:
+        options (CropOptions): What to detect and crop
+        workers (int): Worker processes
+    """
+    def __init__(self, options, workers):
+        super().__init__(options)
+        self.workers = workers
+
+    def describe(self):
+        return f"Using {self.workers} worker processes"
+
+    def run(self, input_paths):
+        pool = Pool(self.workers, initializer=_init_worker, initargs=(self.options,))
+        try:
+            # imap yields results in source order, so numbering matches a serial run
+            yield from pool.imap(_process_in_worker, input_paths)
+        except BaseException:
+            pool.terminate()
+            raise
+        else:
+            # Let workers exit on their own so their detectors are closed
+            pool.close()
+        finally:
+            pool.join()
+
+def create_crop_strategy(options, workers=1, read_threads=0, write_threads=0, queue_size=8, decoders=0,
+                         frame_megapixels=24):
+    """
+    Pick the strategy the crop_faces_new.py options ask for: worker processes
+    when workers > 1, else decoder processes when decoders > 0, else reader and
+    writer threads when either count is set, else the serial loop.
+
+    Args:
+        options (CropOptions): What to detect and crop
+        workers (int): Worker processes; 1 runs in this process (default: 1)
+        read_threads (int): Reader threads of a pipelined run (default: 0)
+        write_threads (int): Writer threads of a pipelined run or of decoders (default: 0)
+        queue_size (int): Images held between two stages, and frame slots with decoders (default: 8)
+        decoders (int): Decoder processes handing frames to the detector through shared memory (default: 0)
+        frame_megapixels (float): Largest frame a slot holds without a proxy (default: 24)
+
+    Returns:
+        CropStrategy: The strategy
+    """
+    if workers > 1:
+        return PoolCrops(options, workers)
+    if decoders > 0:
+        return SharedFrameCrops(options, decoders, write_threads, queue_size, frame_megapixels)
+    if read_threads or write_threads:
+        return PipelinedCrops(options, read_threads, write_threads, queue_size)
+    return SerialCrops(options)
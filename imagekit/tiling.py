@@ -0,0 +1,257 @@
+from types import SimpleNamespace
+from multiprocessing.util import Finalize
+import numpy as np
+from imagekit.detection import detection_to_dict, detection_from_dict
+from imagekit.geometry import non_max_suppression
+
+# Detections this close to an edge shared with a neighbouring tile, relative to
+# the tile side, are faces cut by the tile; the neighbour or a coarser scale sees them whole
+EDGE_MARGIN = 0.02
+
+# Tiles sent to a worker process per task
+TILE_BATCH = 8
+
+# Detector and attached image block of the current tile worker process (see _init_tile_worker)
+_tile_detector = None
+_tile_block = None
+
+def pyramid_scales(width, height, tile_size, max_scales):
+    """
+    Scales an image is tiled at: 1, 1/2, 1/4, ... while the scaled image is
+    still larger than one tile, at most max_scales of them.
+    """
+    scales = []
+    scale = 1.0
+    while len(scales) < max_scales and max(width, height) * scale > tile_size:
+        scales.append(scale)
+        scale /= 2
+    return scales
+
+def tile_boxes(width, height, tile_size, overlap):
+    """
+    Square tiles covering an image, neighbours sharing `overlap` pixels; the
+    last row and column are moved inwards to end at the image edge.
+
+    Returns:
+        numpy.ndarray: (N, 4) int64 array of (left, top, right, bottom)
+    """
+    if not 0 <= overlap < tile_size:
+        raise ValueError(f"The tile overlap must be in [0, {tile_size}), got {overlap}")
+
+    def starts(length):
+        if length <= tile_size:
+            return np.zeros(1, dtype=np.int64)
+        stride = tile_size - overlap
+        count = -(-(length - overlap) // stride)
+        return np.minimum(np.arange(count, dtype=np.int64) * stride, length - tile_size)
+
+    left, top = (a.ravel() for a in np.meshgrid(starts(width), starts(height)))
+    return np.stack([left, top, np.minimum(left + tile_size, width), np.minimum(top + tile_size, height)], axis=1)
+
+def detect_tile(face_detection, level, tile):
+    """
+    Detect faces in one tile of a pyramid level.
+
+    Returns:
+        list: detection_to_dict dicts, relative to the tile
+    """
+    left, top, right, bottom = (int(v) for v in tile)
+    detections = face_detection.process(np.ascontiguousarray(level[top:bottom, left:right])).detections or []
+    return [detection_to_dict(d) for d in detections]
+
+def _init_tile_worker(create_detector, detector_args):
+    global _tile_detector
+    _tile_detector = create_detector(*detector_args)
+    Finalize(None, _tile_detector.close, exitpriority=10)
+
+def _detect_tile_batch(job):
+    # Tile worker: read the levels from the parent's block in place and detect on each tile of the batch
+    global _tile_block
+    from multiprocessing import shared_memory
+    block_name, levels, batch = job
+    if _tile_block is None or _tile_block.name != block_name:
+        if _tile_block is not None:
+            _tile_block.close()
+        # The parent's resource tracker already knows the block, so attaching registers nothing new
+        _tile_block = shared_memory.SharedMemory(block_name)
+    results = []
+    for level_index, tile in batch:
+        offset, shape = levels[level_index]
+        level = np.ndarray(shape, np.uint8, _tile_block.buf, offset)
+        try:
+            results.append(detect_tile(_tile_detector, level, tile))
+        except Exception as e:
+            results.append({'error': str(e)})
+        del level
+    return results
+
+def tiling_variant(tiling):
+    """
+    Describe tiling options for detection cache keys, or None without tiling.
+    The number of workers does not change the detections, so it is left out.
+    """
+    if not tiling:
+        return None
+    return f"tiles:{tiling['tile_size']}:{tiling.get('overlap', 128)}:{tiling.get('max_scales', 2)}"
+
+class TiledFaceDetector:
+    """
+    Face detector for very large images with small faces, usable in place of a
+    MediaPipe FaceDetection. MediaPipe shrinks every input to its fixed model
+    size, so faces a few dozen pixels wide in an 8K photo vanish. Here the
+    detector also runs over overlapping tiles at scales 1, 1/2, ... (each tile
+    shrunk far less than the whole image), and the detections of every tile and
+    of the usual full-frame pass are merged with non-maximum suppression.
+
+    With workers, tiles run in batches across a pool of processes, each with its
+    own detector, reading the image from shared memory.
+
+    Args:
+        face_detection: Detector for the full-frame pass and, without workers, the tiles
+        tile_size (int): Side of the tiles in pixels (default: 1024)
+        overlap (int): Pixels shared by neighbouring tiles; faces smaller than
+            this are whole in at least one tile (default: 128)
+        max_scales (int): Most pyramid levels tiled, halving the image each time (default: 2)
+        workers (int): Tile worker processes; 0 runs tiles in this process (default: 0)
+        create_detector: Factory of the workers' detectors, e.g. create_face_detector (default: None)
+        detector_args (tuple): Arguments of create_detector (default: ())
+        iou_threshold (float): Overlap above which duplicate detections are merged (default: 0.3)
+    """
+    def __init__(self, face_detection, tile_size=1024, overlap=128, max_scales=2, workers=0,
+                 create_detector=None, detector_args=(), iou_threshold=0.3):
+        if not 0 <= overlap < tile_size:
+            raise ValueError(f"The tile overlap must be in [0, {tile_size}), got {overlap}")
+        self.face_detection = face_detection
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.max_scales = max_scales
+        self.iou_threshold = iou_threshold
+        self.block = None
+        self.pool = None
+        if workers > 0:
+            from multiprocessing import Pool, resource_tracker
+            # Workers must share this process's resource tracker: one of their own would
+            # unlink the image block when they exit
+            resource_tracker.ensure_running()
+            self.pool = Pool(workers, initializer=_init_tile_worker, initargs=(create_detector, detector_args))
+
+    def _levels(self, image):
+        # Scale 1 is the image itself; each further level halves the previous one
+        from PIL import Image
+        height, width = image.shape[:2]
+        levels = [(1.0, image)]
+        scales = pyramid_scales(width, height, self.tile_size, self.max_scales)
+        if len(scales) > 1:
+            pil_image = Image.fromarray(image)
+            for scale in scales[1:]:
+                pil_image = pil_image.reduce(2)
+                levels.append((scale, np.asarray(pil_image)))
+        return levels, len(scales) > 0
+
+    def _buffer(self, nbytes):
+        from multiprocessing import shared_memory
+        if self.block is None or self.block.size < nbytes:
+            self._release_buffer()
+            self.block = shared_memory.SharedMemory(create=True, size=nbytes)
+        return self.block
+
+    def _release_buffer(self):
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+
+    def _submit_tasks(self, levels, tasks):
+        # Copy the levels into shared memory and hand the tiles to the pool in batches
+        block = self._buffer(sum(level.nbytes for _, level in levels))
+        layout = []
+        offset = 0
+        for _, level in levels:
+            np.ndarray(level.shape, np.uint8, block.buf, offset)[...] = level
+            layout.append((offset, level.shape))
+            offset += level.nbytes
+        batches = [(block.name, layout, tasks[i:i + TILE_BATCH]) for i in range(0, len(tasks), TILE_BATCH)]
+        return self.pool.map_async(_detect_tile_batch, batches)
+
+    def process(self, image):
+        """
+        Detect faces in one RGB array, returning a result shaped like MediaPipe's.
+        """
+        image = np.asarray(image)
+        height, width = image.shape[:2]
+        levels, tiled = self._levels(image)
+        if not tiled:
+            # Fits in one tile: the full-frame pass alone
+            return self.face_detection.process(image)
+
+        tasks = []
+        for level_index, (_, level) in enumerate(levels):
+            tasks.extend((level_index, tuple(tile)) for tile in tile_boxes(level.shape[1], level.shape[0], self.tile_size, self.overlap).tolist())
+        pending = self._submit_tasks(levels, tasks) if self.pool is not None else None
+        # The full-frame pass runs in this process, meanwhile the workers run the tiles
+        full_frame = [detection_to_dict(d) for d in self.face_detection.process(image).detections or []]
+        if pending is not None:
+            results = [result for batch in pending.get() for result in batch]
+        else:
+            results = [detect_tile(self.face_detection, levels[level_index][1], tile) for level_index, tile in tasks]
+
+        boxes = [(d['box'][0] * width, d['box'][1] * height, (d['box'][0] + d['box'][2]) * width,
+                  (d['box'][1] + d['box'][3]) * height) for d in full_frame]
+        candidates = list(full_frame)
+        for (level_index, tile), detections in zip(tasks, results):
+            if isinstance(detections, dict):
+                raise RuntimeError(f"Tile detection failed: {detections['error']}")
+            scale, level = levels[level_index]
+            left, top, right, bottom = tile
+            tile_w, tile_h = right - left, bottom - top
+            # Edges shared with a neighbour, not the image border
+            inner = (left > 0, top > 0, right < level.shape[1], bottom < level.shape[0])
+            for d in detections:
+                xmin, ymin, box_w, box_h = d['box']
+                if (inner[0] and xmin < EDGE_MARGIN) or (inner[1] and ymin < EDGE_MARGIN) or \
+                        (inner[2] and xmin + box_w > 1 - EDGE_MARGIN) or (inner[3] and ymin + box_h > 1 - EDGE_MARGIN):
+                    continue
+                # Tile-relative to pixels of the full image
+                x1 = (left + xmin * tile_w) / scale
+                y1 = (top + ymin * tile_h) / scale
+                boxes.append((x1, y1, x1 + box_w * tile_w / scale, y1 + box_h * tile_h / scale))
+                candidates.append({
+                    'box': [x1 / width, y1 / height, box_w * tile_w / scale / width, box_h * tile_h / scale / height],
+                    'score': d['score'],
+                    'keypoints': [[(left + x * tile_w) / scale / width, (top + y * tile_h) / scale / height] for x, y in d['keypoints']],
+                })
+
+        if not candidates:
+            return SimpleNamespace(detections=None)
+        scores = [d['score'] if d['score'] is not None else 0.0 for d in candidates]
+        keep = non_max_suppression(np.array(boxes), scores, self.iou_threshold)
+        return SimpleNamespace(detections=[detection_from_dict(candidates[i]) for i in keep.tolist()])
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        self._release_buffer()
+        self.face_detection.close()
+
+def create_tiled_detector(create_detector, detector_args=(), tiling=None):
+    """
+    Create a detector with create_detector(*detector_args), wrapped in a
+    TiledFaceDetector when tiling options are given; its workers get their
+    detectors from the same factory.
+
+    Args:
+        create_detector: Detector factory, e.g. create_face_detector
+        detector_args (tuple): Arguments of create_detector (default: ())
+        tiling (dict): TiledFaceDetector options (tile_size, overlap, max_scales, workers);
+            None detects in a single pass (default: None)
+    """
+    face_detection = create_detector(*detector_args)
+    if not tiling:
+        return face_detection
+    try:
+        return TiledFaceDetector(face_detection, create_detector=create_detector, detector_args=detector_args, **tiling)
+    except BaseException:
+        face_detection.close()
+        raise
@@ -0,0 +1,263 @@
+import os
+import time
+import struct
+from imagekit.io import sniff_image_format
+
+# inotify event bits, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_IGNORED = 0x00008000
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# struct inotify_event: wd, mask, cookie, len, then len bytes of NUL-padded name
+_EVENT = struct.Struct('iIII')
+
+# Longest wait for events, so settled files are checked even when nothing else happens
+MAX_WAIT = 1.0
+
+class _Inotify:
+    """
+    Minimal inotify binding through ctypes, so watching needs no extra package.
+    Raises OSError where inotify is unavailable.
+    """
+    def __init__(self):
+        import ctypes
+        self.ctypes = ctypes
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError("inotify is not available on this platform")
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.folders = {}
+
+    def add(self, folder):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            error = self.ctypes.get_errno()
+            raise OSError(error, os.strerror(error), folder)
+        self.folders[wd] = folder
+
+    def read(self, timeout):
+        """
+        Wait up to timeout seconds for events.
+
+        Returns:
+            list: (path, mask) of each event, or None if the kernel queue overflowed
+        """
+        import select
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & IN_IGNORED:
+                # The folder was removed or moved away
+                self.folders.pop(wd, None)
+                continue
+            folder = self.folders.get(wd)
+            if folder is not None and name:
+                events.append((os.path.join(folder, os.fsdecode(name)), mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class FolderWatcher:
+    """
+    Report images that arrive in a folder, or are rewritten, once they are
+    complete. Changes are seen through inotify where available and by listing
+    the folder every poll_interval seconds otherwise. A file is complete once
+    neither its size nor its mtime changed for `settle` seconds, so images still
+    being copied or written are not read half-way; files that are not images
+    once complete, and hidden files such as partial downloads, are ignored.
+    Files present when the watcher is created are not reported.
+
+    Args:
+        folder (str): Folder to watch
+        recursive (bool): Also watch subfolders, including ones created later (default: False)
+        settle (float): Seconds a file must stay unchanged (default: 0.5)
+        poll_interval (float): Seconds between listings without inotify (default: 1.0)
+        polling (bool): List the folder even where inotify is available, e.g. on
+            network filesystems, whose remote writes inotify does not see (default: False)
+    """
+    def __init__(self, folder, recursive=False, settle=0.5, poll_interval=1.0, polling=False):
+        self.folder = folder
+        self.recursive = recursive
+        self.settle = settle
+        self.poll_interval = poll_interval
+        # (size, mtime_ns) of every file already present or reported
+        self.known = {}
+        # path -> [arrival time, (size, mtime_ns), time of its last change]
+        self.pending = {}
+        self.inotify = None
+        if not polling:
+            try:
+                self.inotify = _Inotify()
+            except (OSError, AttributeError):
+                self.inotify = None
+        self.method = 'inotify' if self.inotify is not None else 'polling'
+        # Watches first, then the listing, so nothing arriving in between is missed
+        self._scan(folder, time.monotonic(), initial=True)
+
+    def _scan(self, folder, now, initial=False):
+        if self.inotify is not None:
+            try:
+                self.inotify.add(folder)
+            except OSError as e:
+                print(f"Warning: Cannot watch {folder}: {e}")
+        try:
+            with os.scandir(folder) as it:
+                entries = [entry for entry in it if not entry.name.startswith('.')]
+        except OSError:
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if self.recursive:
+                    self._scan(entry.path, now, initial)
+            elif entry.is_file():
+                if initial:
+                    stat = entry.stat()
+                    self.known[entry.path] = (stat.st_size, stat.st_mtime_ns)
+                else:
+                    self._touch(entry.path, now)
+
+    def _touch(self, path, now):
+        # Something may have changed: track the file until it settles, unless it is as last seen
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.pending.pop(path, None)
+            return
+        signature = (stat.st_size, stat.st_mtime_ns)
+        entry = self.pending.get(path)
+        if entry is not None:
+            if entry[1] != signature:
+                entry[1] = signature
+                entry[2] = now
+        elif self.known.get(path) != signature:
+            self.pending[path] = [now, signature, now]
+
+    def _handle(self, events, now):
+        if events is None:
+            # Events were lost: list everything again
+            print("Warning: inotify queue overflowed, rescanning")
+            self._scan(self.folder, now)
+            return
+        for path, mask in events:
+            if mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files may already be inside, e.g. a folder moved in
+                    self._scan(path, now)
+                continue
+            if os.path.basename(path).startswith('.'):
+                continue
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                self.pending.pop(path, None)
+                self.known.pop(path, None)
+            else:
+                self._touch(path, now)
+
+    def _settled(self, now):
+        ready = []
+        for path, (arrival, signature, changed) in list(self.pending.items()):
+            if now - changed < self.settle:
+                continue
+            # Checked once more, as inotify does not report every write on every filesystem
+            self._touch(path, now)
+            entry = self.pending.get(path)
+            if entry is None or entry[2] != changed:
+                continue
+            del self.pending[path]
+            self.known[path] = signature
+            if sniff_image_format(path) is not None:
+                ready.append((path, arrival))
+        return sorted(ready, key=lambda item: (item[1], item[0]))
+
+    def _wait(self, now):
+        if not self.pending:
+            return MAX_WAIT if self.inotify is not None else self.poll_interval
+        next_settle = min(changed for _, _, changed in self.pending.values()) + self.settle
+        wait = max(0.01, next_settle - now)
+        return min(wait, MAX_WAIT) if self.inotify is not None else min(wait, self.poll_interval)
+
+    def batches(self):
+        """
+        Wait for images to arrive, forever.
+
+        Yields:
+            list: (path, arrival) of each image that became complete, arrival being
+            the time.monotonic() it was first seen, oldest first
+        """
+        while True:
+            wait = self._wait(time.monotonic())
+            if self.inotify is not None:
+                events = self.inotify.read(wait)
+                self._handle(events, time.monotonic())
+            else:
+                time.sleep(wait)
+                self._scan(self.folder, time.monotonic())
+            ready = self._settled(time.monotonic())
+            if ready:
+                yield ready
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+def add_watch_arguments(parser):
+    """
+    Add the --watch options shared by the scripts that can run as a daemon.
+    """
+    parser.add_argument('--watch', action='store_true',
+                        help='After processing the folder, keep running and process images as they arrive (Ctrl+C to stop)')
+    parser.add_argument('--settle', type=float, default=0.5,
+                        help='With --watch, seconds an arriving file must stay unchanged before it is read (default: 0.5)')
+    parser.add_argument('--poll_interval', type=float, default=1.0,
+                        help='With --watch, seconds between folder listings where inotify is unavailable (default: 1.0)')
+    parser.add_argument('--polling', action='store_true',
+                        help='With --watch, list the folder instead of using inotify, e.g. on network filesystems')
+
+def create_watcher(args, folder):
+    """
+    Start watching folder if --watch was given, see add_watch_arguments.
+
+    Returns:
+        FolderWatcher: The watcher, or None without --watch
+    """
+    if not args.watch:
+        return None
+    return FolderWatcher(folder, getattr(args, 'recursive', False), args.settle, args.poll_interval, args.polling)
+
+def print_latency_summary(latencies):
+    """
+    Print the arrival-to-output latency of the images processed while watching.
+    """
+    if not latencies:
+        return
+    from imagekit.profiling import percentile
+    values = sorted(latencies)
+    print(f"Latency from arrival to output over {len(values)} image(s): "
+          f"p50 {percentile(values, 50):.2f} s, p95 {percentile(values, 95):.2f} s, max {values[-1]:.2f} s")
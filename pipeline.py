@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+import os
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from imagekit.io import iter_images, decode_image, save_image
+from imagekit.archive import ShardWriter, archive_format, add_shard_arguments, sample_metadata
+from imagekit.profiling import stage, item as profile_item, add_profile_arguments, start_profile
+from crop_and_center import center_crop_image
+from to_grayscale import to_grayscale_image
+
+STAGES = ('crop_faces', 'center_crop', 'grayscale', 'dedup', 'rename', 'caption')
+
+class Sample:
+    """
+    One image flowing through the pipeline, together with what the stages learned about it.
+
+    Args:
+        source (str): Path of the source image
+        image (PIL.Image.Image): Current in-memory image
+    """
+    def __init__(self, source, image):
+        self.source = source
+        self.image = image
+        self.name = os.path.splitext(os.path.basename(source))[0]
+        self.caption = None
+
+def read_stage(input_paths):
+    """
+    Decode source images one at a time. When profiling, the stages that run while
+    a sample flows downstream are attributed to its source image.
+    """
+    for input_path in input_paths:
+        with profile_item(input_path):
+            try:
+                sample = Sample(input_path, decode_image(input_path))
+            except Exception as e:
+                # A truncated or corrupt image is skipped like a missing one, not the end of the run
+                print(f"Error reading {input_path}: {str(e)}")
+                continue
+            yield sample
+
+def crop_faces_stage(samples, size=512):
+    """
+    Replace each sample by one sample per detected face.
+    """
+    from imagekit import detection
+    from imagekit.crops import crop_faces
+
+    face_detection = detection.create_face_detector()
+    try:
+        for sample in samples:
+            faces, messages = crop_faces(sample.image, face_detection, size, os.path.basename(sample.source))
+            for message in messages:
+                print(message)
+            for i, _, face_image in faces:
+                face = Sample(sample.source, face_image)
+                face.name = f"{sample.name}_face{i+1}"
+                yield face
+    finally:
+        face_detection.close()
+
+def center_crop_stage(samples, size=512):
+    for sample in samples:
+        sample.image = center_crop_image(sample.image, size)
+        yield sample
+
+def grayscale_stage(samples):
+    for sample in samples:
+        sample.image = to_grayscale_image(sample.image)
+        yield sample
+
+def dedup_stage(samples, threshold=6, method='phash'):
+    """
+    Drop samples whose perceptual hash is within `threshold` bits of an earlier
+    kept sample, e.g. burst shots, before they are renamed or captioned.
+    """
+    from imagekit.phash import HashIndex, hash_thumbnail, compute_hashes
+
+    index = HashIndex(threshold)
+    kept_names = []
+    for sample in samples:
+        value = compute_hashes(hash_thumbnail(sample.image, method)[None], method)[0]
+        found = index.query(value)
+        if found:
+            kept, distance = found[0]
+            print(f"Dropped near-duplicate {sample.name} ~ {kept_names[kept]} (distance {distance})")
+            continue
+        index.add(value)
+        kept_names.append(sample.name)
+        yield sample
+
+def rename_stage(samples, start=1):
+    """
+    Name samples sequentially (001, 002, ...) in the order they arrive.
+    """
+    for index, sample in enumerate(samples, start=start):
+        sample.name = f"{index:03d}"
+        yield sample
+
+def caption_stage(samples, client, reference_token, concurrency=8):
+    """
+    Describe samples with up to `concurrency` requests in flight, preserving order.
+    Only that many samples are held in memory while waiting for the API. A sample
+    whose request fails is written without a caption.
+    """
+    def describe(sample):
+        try:
+            return f"{reference_token}, {client.describe(sample.image)}"
+        except Exception as e:
+            print(f"Failed to describe {sample.name}, writing it without a description: {str(e)}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = deque()
+        for sample in samples:
+            in_flight.append((sample, executor.submit(describe, sample)))
+            if len(in_flight) >= concurrency:
+                sample, future = in_flight.popleft()
+                sample.caption = future.result()
+                yield sample
+        while in_flight:
+            sample, future = in_flight.popleft()
+            sample.caption = future.result()
+            yield sample
+
+def write_stage(samples, output_dir, quality=95, shards=None):
+    """
+    Encode each sample once and write it, plus its caption if any, to output_dir
+    or, given a ShardWriter, as one sample of the tar shards.
+    """
+    from io import BytesIO
+
+    for sample in samples:
+        if shards is not None:
+            buffer = BytesIO()
+            with stage('encode'):
+                sample.image.save(buffer, format='JPEG', quality=quality)
+            files = {'jpg': buffer.getvalue(), 'json': sample_metadata(sample.source, name=sample.name)}
+            if sample.caption is not None:
+                files['txt'] = sample.caption
+            with stage('write'):
+                key = shards.write(files)
+            print(f"Sharded: sample {key} (Original: {os.path.basename(sample.source)})")
+            yield sample
+            continue
+        output_path = os.path.join(output_dir, f"{sample.name}.jpg")
+        save_image(sample.image, output_path, quality=quality)
+        if sample.caption is not None:
+            with stage('write'), open(os.path.join(output_dir, f"{sample.name}.txt"), 'w') as f:
+                f.write(sample.caption)
+        print(f"Saved: {output_path} (Original: {os.path.basename(sample.source)})")
+        yield sample
+
+def build_pipeline(input_paths, stages, output_dir, size=512, client=None, reference_token=None, concurrency=8,
+                   dedup_threshold=6, dedup_method='phash', shards=None):
+    """
+    Chain the requested stages as generators so each image is streamed through them.
+
+    Args:
+        input_paths (list): Paths of the source images
+        stages (list): Stage names from STAGES, applied in order
+        output_dir (str): Directory the final images are written to
+        size (int): Target size for crop stages (default: 512)
+        client (CaptionClient): Client for the caption stage (default: None)
+        reference_token (str): Token to prefix captions with (default: None)
+        concurrency (int): Maximum caption requests in flight (default: 8)
+        dedup_threshold (int): Hamming distance under which the dedup stage drops a sample (default: 6)
+        dedup_method (str): 'phash' or 'dhash' for the dedup stage (default: 'phash')
+        shards (ShardWriter): Write tar shards instead of files to output_dir (default: None)
+    """
+    samples = read_stage(input_paths)
+    for stage in stages:
+        if stage == 'crop_faces':
+            samples = crop_faces_stage(samples, size)
+        elif stage == 'center_crop':
+            samples = center_crop_stage(samples, size)
+        elif stage == 'grayscale':
+            samples = grayscale_stage(samples)
+        elif stage == 'dedup':
+            samples = dedup_stage(samples, dedup_threshold, dedup_method)
+        elif stage == 'rename':
+            samples = rename_stage(samples)
+        elif stage == 'caption':
+            samples = caption_stage(samples, client, reference_token, concurrency)
+        else:
+            raise ValueError(f"Unknown stage: {stage}")
+    return write_stage(samples, output_dir, shards=shards)
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream images through crop, grayscale, rename and caption stages in memory, writing each result once.')
+    parser.add_argument('--input_dir', type=str, default='input',
+                        help='Directory containing input images, or a zip or tar archive; archives in the directory are streamed too. Default: "input"')
+    parser.add_argument('--output_dir', type=str, default='output',
+                        help='Directory to save processed images. Default: "output"')
+    parser.add_argument('--stages', type=str, nargs='+', default=['crop_faces', 'rename'], choices=STAGES,
+                        help='Stages to apply, in order (default: crop_faces rename)')
+    parser.add_argument('--size', type=int, default=512,
+                        help='Target size for the square image (default: 512)')
+    parser.add_argument('--token', type=str, default=None,
+                        help='Reference token to prefix descriptions, required by the caption stage')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='Maximum number of caption requests in flight (default: 8)')
+    parser.add_argument('--dedup_threshold', type=int, default=6,
+                        help='Hamming distance under which the dedup stage drops an image (default: 6)')
+    parser.add_argument('--dedup_method', type=str, default='phash', choices=('phash', 'dhash'),
+                        help='Perceptual hash used by the dedup stage (default: phash)')
+    parser.add_argument('--recursive', action='store_true',
+                        help='Also process images in subdirectories of the input directory')
+    add_shard_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    start_profile(args, 'pipeline')
+
+    if not os.path.isdir(args.input_dir) and archive_format(args.input_dir) is None:
+        print(f"Error: {args.input_dir} is not a valid directory or archive")
+        return
+
+    client = None
+    if 'caption' in args.stages:
+        if not args.token:
+            parser.error("the caption stage requires --token")
+        api_key = os.getenv('OPENAI_API_KEY')
+        if not api_key:
+            raise ValueError("Please set the OPENAI_API_KEY environment variable")
+        from generate_descriptions import CaptionClient
+        client = CaptionClient(api_key, concurrency=args.concurrency)
+
+    shards = None
+    if args.shards:
+        try:
+            shards = ShardWriter(args.shards, args.shard_size)
+        except (ValueError, OSError) as e:
+            print(f"Error: Cannot write shards to '{args.shards}': {e}")
+            return
+    else:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    # Images are recognised by content and streamed in sorted order, archive members in archive order
+    input_paths = iter_images(args.input_dir, args.recursive, archives=True, stream=True)
+
+    count = 0
+    try:
+        for _ in build_pipeline(input_paths, args.stages, args.output_dir, args.size,
+                                client, args.token, args.concurrency, args.dedup_threshold, args.dedup_method, shards):
+            count += 1
+    finally:
+        if client is not None:
+            client.close()
+        if shards is not None:
+            shards.close()
+    print(f"Processing complete: {count} image(s) written.")
+
+if __name__ == '__main__':
+    main()
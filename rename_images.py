@@ -1,72 +1,208 @@
 #!/usr/bin/env python3
 
 import os
+import json
 import argparse
-import shutil
+from imagekit.io import iter_images, FORMAT_EXTENSIONS
+from imagekit.profiling import stage, item as profile_item, add_profile_arguments, start_profile
+
+# Journal of an in-progress rename, kept in the folder until the rename completes
+JOURNAL_FILENAME = '.rename_journal'
+
+def plan_renames(folder_path):
+    """
+    Compute the full rename plan for a folder: images are numbered sequentially
+    from 001 in sorted order, with the extension of their actual format
+    (a PNG becomes NNN.png even if it was named .jpg), and a matching .txt
+    caption file follows its image. When several images share a stem
+    (IMG_1.HEIC and IMG_1.JPG), the caption follows the first of them only.
+
+    Args:
+        folder_path (str): Path to the folder containing images
+
+    Returns:
+        list: (old_name, new_name) pairs for the files that need to move
+    """
+    existing = set(os.listdir(folder_path))
+
+    moves = []
+    captions = set()
+    for i, (path, image_format) in enumerate(iter_images(folder_path, with_format=True), start=1):
+        filename = os.path.basename(path)
+        caption = f"{os.path.splitext(filename)[0]}.txt"
+        moves.append((filename, f"{i:03d}{FORMAT_EXTENSIONS[image_format]}"))
+        if caption in existing and caption not in captions:
+            captions.add(caption)
+            moves.append((caption, f"{i:03d}.txt"))
+
+    moves = [(old, new) for old, new in moves if old != new]
+    sources = {old for old, _ in moves}
+    for _, new in moves:
+        if new in existing and new not in sources:
+            raise FileExistsError(f"{new} already exists and is not part of the rename")
+    return moves
+
+def order_renames(moves, existing):
+    """
+    Order renames so that no file is overwritten. Chains are run from their free
+    end; each cycle is broken by moving one file to a temporary name, so a cycle
+    of length n costs n + 1 renames and everything else costs one.
+
+    Args:
+        moves (list): (old_name, new_name) pairs, a permutation without conflicts
+        existing (set): Names currently in the folder, to pick unused temporary names
+
+    Returns:
+        list: (old_name, new_name) renames to run in order
+    """
+    pending = dict(moves)
+    assert len(pending) == len(moves), "a file is moved to more than one name"
+    source_of = {new: old for old, new in moves}
+    ordered = []
+    ready = [old for old, new in moves if new not in pending]
+    temp_index = 0
+    while pending:
+        while ready:
+            old = ready.pop()
+            ordered.append((old, pending.pop(old)))
+            # The file that wanted this name can move now
+            waiting = source_of.get(old)
+            if waiting in pending:
+                ready.append(waiting)
+        if pending:
+            # Only cycles are left: park one file under a temporary name
+            old = next(iter(pending))
+            while f".rename-{temp_index}.tmp" in existing:
+                temp_index += 1
+            temp = f".rename-{temp_index}.tmp"
+            temp_index += 1
+            ordered.append((old, temp))
+            new = pending.pop(old)
+            pending[temp] = new
+            source_of[new] = temp
+            ready.append(source_of[old])
+    return ordered
+
+def _run_journal(folder_path, ops, done, journal):
+    for index in range(done, len(ops)):
+        old, new = ops[index]
+        old_path = os.path.join(folder_path, old)
+        new_path = os.path.join(folder_path, new)
+        with profile_item(old), stage('write'):
+            # After a crash between the rename and its journal entry, the move is already done
+            if not (index == done and not os.path.exists(old_path) and os.path.exists(new_path)):
+                os.rename(old_path, new_path)
+            journal.write(f"{index}\n")
+            journal.flush()
+
+def _read_journal(journal_path):
+    with open(journal_path) as f:
+        ops = [tuple(op) for op in json.loads(f.readline())['ops']]
+        done = sum(1 for line in f if line.strip())
+    return ops, done
 
 def rename_images(folder_path):
     """
-    Rename all images in the folder to be sequentially numbered from 001.jpg
-    
+    Rename all images in the folder to be sequentially numbered from 001,
+    moving their .txt caption files along with them. Every rename is recorded in
+    a journal so an interrupted run can be resumed or rolled back.
+
     Args:
         folder_path (str): Path to the folder containing images
     """
-    # Get list of image files and sort them
-    image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.heic', '.heif')
-    image_files = [f for f in os.listdir(folder_path) 
-                  if f.lower().endswith(image_extensions)]
-    image_files.sort()
-    
-    # Create a temporary directory for the renaming process
-    temp_dir = os.path.join(folder_path, '.temp')
-    os.makedirs(temp_dir, exist_ok=True)
-    
+    journal_path = os.path.join(folder_path, JOURNAL_FILENAME)
+    if os.path.exists(journal_path):
+        print("Error: a previous rename was interrupted; run again with --resume or --rollback")
+        return
+
     try:
-        # First, move all files to temp directory with their original names
-        for filename in image_files:
-            src = os.path.join(folder_path, filename)
-            dst = os.path.join(temp_dir, filename)
-            shutil.move(src, dst)
-        
-        # Then move them back with new sequential names
-        for i, filename in enumerate(image_files, start=1):
-            old_path = os.path.join(temp_dir, filename)
-            new_name = f"{i:03d}.jpg"
-            new_path = os.path.join(folder_path, new_name)
-            shutil.move(old_path, new_path)
-            print(f"Renamed: {filename} -> {new_name}")
-            
-    except Exception as e:
+        moves = plan_renames(folder_path)
+    except FileExistsError as e:
         print(f"Error during renaming: {str(e)}")
-        # Try to recover files from temp directory if something went wrong
-        for filename in os.listdir(temp_dir):
-            src = os.path.join(temp_dir, filename)
-            dst = os.path.join(folder_path, filename)
-            if os.path.exists(src):
-                shutil.move(src, dst)
-    
-    finally:
-        # Clean up temp directory
-        if os.path.exists(temp_dir):
-            try:
-                os.rmdir(temp_dir)
-            except:
-                pass
+        return
+    if not moves:
+        print("Nothing to rename.")
+        return
+    ops = order_renames(moves, set(os.listdir(folder_path)))
+
+    with open(journal_path, 'w') as journal:
+        journal.write(json.dumps({'ops': ops}) + '\n')
+        journal.flush()
+        os.fsync(journal.fileno())
+        try:
+            _run_journal(folder_path, ops, 0, journal)
+        except OSError as e:
+            print(f"Error during renaming: {str(e)}")
+            print("The journal was kept; run again with --resume or --rollback")
+            return
+    os.remove(journal_path)
+
+    for old, new in moves:
+        print(f"Renamed: {old} -> {new}")
+
+def resume_renames(folder_path):
+    """
+    Finish a rename that was interrupted, using its journal.
+
+    Args:
+        folder_path (str): Path to the folder containing images
+    """
+    journal_path = os.path.join(folder_path, JOURNAL_FILENAME)
+    ops, done = _read_journal(journal_path)
+    with open(journal_path, 'a') as journal:
+        _run_journal(folder_path, ops, done, journal)
+    os.remove(journal_path)
+    print(f"Resumed: {len(ops) - done} of {len(ops)} renames were left")
+
+def rollback_renames(folder_path):
+    """
+    Undo the completed part of an interrupted rename, using its journal.
+
+    Args:
+        folder_path (str): Path to the folder containing images
+    """
+    journal_path = os.path.join(folder_path, JOURNAL_FILENAME)
+    ops, done = _read_journal(journal_path)
+    # The rename following the last journal entry may have happened before the crash
+    if done < len(ops):
+        old, new = ops[done]
+        if not os.path.exists(os.path.join(folder_path, old)) and os.path.exists(os.path.join(folder_path, new)):
+            done += 1
+    for old, new in reversed(ops[:done]):
+        os.rename(os.path.join(folder_path, new), os.path.join(folder_path, old))
+    os.remove(journal_path)
+    print(f"Rolled back {done} renames")
 
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description='Rename images in a folder to sequential numbers.')
     parser.add_argument('folder', type=str, help='Path to the folder containing images')
-    
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--resume', action='store_true',
+                       help='Finish a rename that was interrupted')
+    group.add_argument('--rollback', action='store_true',
+                       help='Undo the completed part of a rename that was interrupted')
+    add_profile_arguments(parser)
+
     args = parser.parse_args()
-    
+    start_profile(args, 'rename_images')
+
     # Check if folder exists
     if not os.path.isdir(args.folder):
         print(f"Error: {args.folder} is not a valid directory")
         return
-    
+
+    if (args.resume or args.rollback) and not os.path.exists(os.path.join(args.folder, JOURNAL_FILENAME)):
+        print(f"Error: no interrupted rename found in {args.folder}")
+        return
+
     # Rename the images
-    rename_images(args.folder)
+    if args.resume:
+        resume_renames(args.folder)
+    elif args.rollback:
+        rollback_renames(args.folder)
+    else:
+        rename_images(args.folder)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The scripts live at the top level; the stub server and fake detectors in benchmarks/
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
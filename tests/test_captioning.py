@@ -0,0 +1,103 @@
+import os
+import time
+import numpy as np
+import pytest
+from PIL import Image
+from generate_descriptions import CaptionClient, describe_images
+from stub_openai import StubChatCompletions
+
+TOKEN = 'TOK'
+CAPTION = f"{TOKEN}, a photo of a person"
+
+@pytest.fixture
+def stub():
+    # Failure ratios and Retry-After are set per test on the running server
+    with StubChatCompletions(0.01) as server:
+        yield server
+
+def make_images(folder, count):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"{i + 1:03d}.jpg")
+        Image.fromarray(rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)).save(path)
+        paths.append(path)
+    return paths
+
+def captions(paths):
+    result = []
+    for path in paths:
+        with open(f"{os.path.splitext(path)[0]}.txt") as f:
+            result.append(f.read())
+    return result
+
+def run(paths, stub, concurrency=4, **client_args):
+    client = CaptionClient('stub-key', stub.url, concurrency=concurrency, backoff=0.01, **client_args)
+    try:
+        return list(describe_images(paths, TOKEN, client, concurrency))
+    finally:
+        client.close()
+
+def test_rate_limits_retried(tmp_path, stub):
+    stub.rate_limit_ratio = 0.25
+    stub.retry_after = 0.01
+    paths = make_images(tmp_path, 12)
+    run(paths, stub)
+    assert stub.rate_limited > 0
+    assert stub.requests == len(paths) + stub.rate_limited
+    assert all(caption.startswith(CAPTION) for caption in captions(paths))
+
+@pytest.mark.parametrize('status', [500, 503])
+def test_server_errors_retried(tmp_path, stub, status):
+    stub.server_error_ratio = 0.25
+    stub.server_error_status = status
+    paths = make_images(tmp_path, 8)
+    run(paths, stub)
+    assert stub.server_errors > 0
+    assert stub.requests == len(paths) + stub.server_errors
+    assert all(caption.startswith(CAPTION) for caption in captions(paths))
+
+def test_retries_exhausted(tmp_path, stub, capsys):
+    # Every request fails: given up after max_retries retries, not an endless loop, and no caption written
+    stub.server_error_ratio = 1.0
+    paths = make_images(tmp_path, 2)
+    assert run(paths, stub, max_retries=2) == []
+    assert stub.requests == len(paths) * 3
+    assert not any(os.path.exists(f"{os.path.splitext(path)[0]}.txt") for path in paths)
+    output = capsys.readouterr().out
+    assert "Generated description" not in output
+    assert all(f"Failed to describe {os.path.basename(path)}" in output for path in paths)
+
+def test_retry_after_honored(tmp_path, stub):
+    # One 429 with Retry-After 0.5 s: the client must wait that long, not its 0.01 s backoff
+    stub.rate_limit_ratio = 0.5
+    stub.retry_after = 0.5
+    paths = make_images(tmp_path, 2)
+    start = time.perf_counter()
+    run(paths, stub, concurrency=1)
+    assert stub.rate_limited == 1
+    assert time.perf_counter() - start >= 0.5
+
+def test_retry_after_capped(tmp_path, stub):
+    # A Retry-After of an hour waits max_retry_after instead
+    stub.rate_limit_ratio = 0.5
+    stub.retry_after = 3600
+    paths = make_images(tmp_path, 2)
+    start = time.perf_counter()
+    run(paths, stub, concurrency=1, max_retry_after=0.2)
+    assert stub.rate_limited == 1
+    assert 0.2 <= time.perf_counter() - start < 5
+
+def test_written_as_completed(tmp_path, stub):
+    # With 2 requests in flight for 8 images, the first caption is on disk while most are still pending
+    stub.latency = 0.1
+    paths = make_images(tmp_path, 8)
+    client = CaptionClient('stub-key', stub.url, concurrency=2, backoff=0.01)
+    try:
+        for i, path in enumerate(describe_images(paths, TOKEN, client, 2)):
+            assert os.path.exists(f"{os.path.splitext(path)[0]}.txt")
+            if i == 0:
+                assert sum(os.path.exists(f"{os.path.splitext(p)[0]}.txt") for p in paths) < len(paths)
+                assert stub.requests < len(paths)
+    finally:
+        client.close()
@@ -0,0 +1,90 @@
+import multiprocessing
+import numpy as np
+import pytest
+from PIL import Image
+from fake_detector import FakeFaceDetector
+from imagekit import detection
+from imagekit.strategies import (CropOptions, SerialCrops, PipelinedCrops, SharedFrameCrops, PoolCrops,
+                                 create_crop_strategy)
+
+forked = pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                            reason='worker processes only inherit the fake detector when forked')
+
+def fake_face_detector(*_):
+    return FakeFaceDetector(2, 0)
+
+@pytest.fixture(autouse=True)
+def fake_detector(monkeypatch):
+    # Strategies look the factory up when they start, and forked workers inherit the patch
+    monkeypatch.setattr(detection, 'create_face_detector', fake_face_detector)
+
+@pytest.fixture
+def corpus(tmp_path):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i, (width, height, extension) in enumerate([(160, 120, 'jpg'), (96, 200, 'png'), (640, 480, 'jpg'),
+                                                    (300, 300, 'png'), (1200, 800, 'jpg'), (80, 60, 'jpg')]):
+        path = tmp_path / f"{i:02d}.{extension}"
+        Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8)).save(path)
+        paths.append(str(path))
+    (tmp_path / '03.jpg').write_bytes(b'\xff\xd8\xff\xe0 not a jpeg')
+    return sorted(paths + [str(tmp_path / '03.jpg')])
+
+def crops(strategy, paths):
+    # Raw crops are arrays, compared by their pixels
+    return [([(i, side, np.asarray(crop).tobytes()) for i, side, crop in faces], messages)
+            for faces, messages in strategy.run(paths)]
+
+OPTIONS = {
+    'default': {},
+    'proxy': {'proxy_size': 256},
+    'raw': {'raw': True, 'resize': 'exact'},
+    'tiled': {'tiling': {'tile_size': 300, 'overlap': 32, 'max_scales': 2, 'workers': 0}},
+}
+
+STRATEGIES = {
+    'pipelined': lambda options: PipelinedCrops(options, 2, 2, queue_size=2),
+    'shared frames': lambda options: SharedFrameCrops(options, 2, queue_size=3),
+    # Zero-sized slots: every frame is pickled through the pipe
+    'pickled frames': lambda options: SharedFrameCrops(options, 2, frame_megapixels=0),
+    'pool': lambda options: PoolCrops(options, 2),
+}
+
+@forked
+@pytest.mark.parametrize('option_set', OPTIONS)
+@pytest.mark.parametrize('name', STRATEGIES)
+def test_parallel_crops_match_serial(corpus, option_set, name):
+    options = CropOptions(size=64, **OPTIONS[option_set])
+    expected = crops(SerialCrops(options), corpus)
+    # Faces in every image but the corrupt one, which only logs its error
+    assert all(faces for faces, _ in expected[:3] + expected[4:])
+    assert expected[3] == ([], ['Error processing image 03.jpg: Truncated File Read'])
+
+    assert crops(STRATEGIES[name](options), corpus) == expected
+
+@forked
+@pytest.mark.parametrize('name', STRATEGIES)
+def test_parallel_crops_share_the_detection_cache(corpus, tmp_path, name):
+    options = CropOptions(size=64, proxy_size=256, cache_path=str(tmp_path / 'detections.db'))
+    expected = crops(SerialCrops(CropOptions(size=64, proxy_size=256)), corpus)
+    # A cold cache, then one filled by the serial run
+    assert crops(STRATEGIES[name](options), corpus) == expected
+    assert crops(SerialCrops(options), corpus) == expected
+    assert crops(STRATEGIES[name](options), corpus) == expected
+
+def test_batches_match_serial(corpus):
+    options = CropOptions(size=64)
+    expected = crops(SerialCrops(options), corpus)
+    for strategy in (SerialCrops(options), PipelinedCrops(options, 1, 1, queue_size=2)):
+        results = list(strategy.run_batches([corpus[:2], [], corpus[2:]]))
+        assert [input_path for input_path, _ in results] == corpus
+        assert [result for _, result in results] == expected
+
+def test_strategy_selection():
+    options = CropOptions()
+    assert type(create_crop_strategy(options)) is SerialCrops
+    assert type(create_crop_strategy(options, read_threads=2)) is PipelinedCrops
+    assert type(create_crop_strategy(options, write_threads=1, decoders=2)) is SharedFrameCrops
+    assert type(create_crop_strategy(options, workers=2, decoders=2)) is PoolCrops
+    assert create_crop_strategy(options).describe() is None
+    assert create_crop_strategy(options, decoders=2, queue_size=4).ring_bytes == 4 * 24 * 10 ** 6 * 3
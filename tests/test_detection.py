@@ -0,0 +1,66 @@
+import os
+import socket
+import tempfile
+import pytest
+from imagekit import detection
+
+@pytest.fixture
+def private_tmp(tmp_path, monkeypatch):
+    monkeypatch.delenv(detection.SOCKET_ENV, raising=False)
+    monkeypatch.delenv('XDG_RUNTIME_DIR', raising=False)
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    return tmp_path
+
+def listen(path):
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    return server
+
+def test_default_socket_path_prefers_runtime_dir(tmp_path, monkeypatch):
+    monkeypatch.delenv(detection.SOCKET_ENV, raising=False)
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    assert detection.default_socket_path() == os.path.join(tmp_path, 'imagekit-detector.sock')
+    monkeypatch.setenv(detection.SOCKET_ENV, '/run/custom.sock')
+    assert detection.default_socket_path() == '/run/custom.sock'
+
+def test_make_socket_dir_creates_owner_only_dir(private_tmp):
+    socket_path = detection.default_socket_path()
+    assert os.path.dirname(socket_path) == os.path.join(private_tmp, f"imagekit-{os.getuid()}")
+    detection.make_socket_dir(socket_path)
+    assert os.stat(os.path.dirname(socket_path)).st_mode & 0o777 == 0o700
+    # Again, now that it exists
+    detection.make_socket_dir(socket_path)
+
+def test_make_socket_dir_refuses_dir_open_to_others(private_tmp):
+    socket_path = detection.default_socket_path()
+    os.mkdir(os.path.dirname(socket_path))
+    os.chmod(os.path.dirname(socket_path), 0o777)
+    with pytest.raises(PermissionError):
+        detection.make_socket_dir(socket_path)
+
+def test_connects_to_own_socket(tmp_path):
+    socket_path = str(tmp_path / 'detector.sock')
+    assert detection.connect_detection_service(socket_path=socket_path) is None
+    server = listen(socket_path)
+    try:
+        client = detection.connect_detection_service(socket_path=socket_path)
+        assert isinstance(client, detection.ServiceFaceDetector)
+        client.close()
+    finally:
+        server.close()
+
+def test_refuses_path_that_is_not_a_socket(tmp_path):
+    socket_path = tmp_path / 'detector.sock'
+    socket_path.write_text('')
+    assert detection.connect_detection_service(socket_path=str(socket_path)) is None
+
+@pytest.mark.skipif(os.getuid() != 0, reason='handing a socket to another user needs root')
+def test_refuses_socket_of_another_user(tmp_path):
+    socket_path = str(tmp_path / 'detector.sock')
+    server = listen(socket_path)
+    try:
+        os.chown(socket_path, 12345, 12345)
+        assert detection.connect_detection_service(socket_path=socket_path) is None
+    finally:
+        server.close()
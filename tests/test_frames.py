@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+from imagekit import frames
+from imagekit.frames import FrameRing
+
+def test_frames_round_trip():
+    ring = FrameRing(2, 64 * 48 * 3)
+    try:
+        slot = ring.acquire()
+        pixels = np.arange(64 * 48 * 3, dtype=np.uint64).astype(np.uint8).reshape(48, 64, 3)
+        shape = ring.write(slot, pixels)
+        assert np.array_equal(ring.frame(slot, shape), pixels)
+        with pytest.raises(ValueError):
+            ring.write(slot, np.zeros((49, 64, 3), np.uint8))
+    finally:
+        ring.close()
+
+def test_ring_larger_than_shared_memory_is_refused(monkeypatch):
+    # Instead of a SIGBUS once a frame is written past the free space
+    monkeypatch.setattr(frames, 'shared_memory_free', lambda: 64 * 1024 * 1024)
+    with pytest.raises(MemoryError, match='frame slots'):
+        FrameRing(8, 24 * 10 ** 6 * 3)
+    FrameRing(8, 1024 * 1024 * 3).close()
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from imagekit.geometry import square_crop_boxes
+from scalar_geometry import random_boxes, scalar_boxes
+
+TRIALS = 500
+
+@pytest.mark.parametrize('policy', ['center', 'anchor'])
+def test_matches_scalar_code(policy):
+    # Random image sizes and boxes, including faces over the edges, zero-sized faces and rounding ties
+    rng = np.random.default_rng(0)
+    for _ in range(TRIALS):
+        w, h = (int(v) for v in rng.integers(1, 4000, 2))
+        rel_boxes = random_boxes(rng, 20)
+        vectorized = square_crop_boxes(rel_boxes, w, h, policy)
+        assert len(vectorized) == len(rel_boxes)
+        for expected, actual in zip(scalar_boxes(rel_boxes, w, h, policy), vectorized):
+            if expected is None:
+                # Faces the scalar code skips come back as empty boxes
+                assert actual[2] <= actual[0], (w, h, actual)
+            else:
+                assert tuple(int(v) for v in actual) == expected, (w, h, expected, actual)
+
+@pytest.mark.parametrize('policy', ['center', 'anchor'])
+def test_boxes_are_squares_inside_the_image(policy):
+    rng = np.random.default_rng(1)
+    for _ in range(TRIALS):
+        w, h = (int(v) for v in rng.integers(1, 4000, 2))
+        boxes = square_crop_boxes(random_boxes(rng, 20), w, h, policy)
+        kept = boxes[boxes[:, 2] > boxes[:, 0]]
+        assert (kept[:, 2] - kept[:, 0] == kept[:, 3] - kept[:, 1]).all()
+        assert (kept[:, :2] >= 0).all() and (kept[:, 2] <= w).all() and (kept[:, 3] <= h).all()
+
+@pytest.mark.parametrize('policy', ['center', 'anchor'])
+def test_no_boxes(policy):
+    # An image without detections gives an empty (0, 4) array, not an error
+    assert square_crop_boxes(np.empty((0, 4)), 640, 480, policy).shape == (0, 4)
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from imagekit.phash import HashIndex, near_pairs
+
+def clustered_hashes(count, seed=0):
+    # A few random centres with copies a handful of bits away, so matches occur at every distance
+    rng = np.random.default_rng(seed)
+    centres = rng.integers(0, 1 << 63, count // 8, dtype=np.uint64) << np.uint64(1)
+    hashes = set()
+    while len(hashes) < count:
+        flips = rng.choice(64, rng.integers(0, 12), replace=False)
+        hashes.add(int(rng.choice(centres)) ^ sum(1 << int(bit) for bit in flips))
+    return np.array(sorted(hashes), dtype=np.uint64)
+
+def distance(a, b):
+    return bin(int(a) ^ int(b)).count('1')
+
+@pytest.mark.parametrize('threshold', [0, 3, 6, 10])
+def test_index_matches_brute_force(threshold):
+    hashes = clustered_hashes(200)
+    index = HashIndex(threshold)
+    for i, value in enumerate(hashes):
+        expected = sorted(((j, distance(value, hashes[j])) for j in range(i)
+                           if distance(value, hashes[j]) <= threshold), key=lambda pair: (pair[1], pair[0]))
+        assert index.query(value) == expected
+        index.add(value)
+
+@pytest.mark.parametrize('threshold', [0, 3, 6, 10])
+def test_near_pairs_matches_brute_force(threshold):
+    hashes = clustered_hashes(200, seed=1)
+    expected = sorted((i, j, distance(hashes[i], hashes[j])) for i in range(len(hashes)) for j in range(i)
+                      if distance(hashes[i], hashes[j]) <= threshold)
+    i, j, distances = near_pairs(hashes, threshold)
+    assert sorted(zip(i.tolist(), j.tolist(), distances.tolist())) == expected
@@ -0,0 +1,54 @@
+import os
+import numpy as np
+from PIL import Image
+from generate_descriptions import CaptionClient
+from pipeline import build_pipeline
+from stub_openai import StubChatCompletions
+
+def make_jpeg(path, seed):
+    rng = np.random.default_rng(seed)
+    Image.fromarray(rng.integers(0, 256, (96, 128, 3), dtype=np.uint8)).save(path, quality=90)
+
+def test_corrupt_inputs_are_skipped(tmp_path, capsys):
+    inputs = tmp_path / 'input'
+    inputs.mkdir()
+    for name in ('001', '002', '003'):
+        make_jpeg(inputs / f"{name}.jpg", int(name))
+    # Truncated half-way: PIL raises a plain OSError when the pixels are loaded
+    data = (inputs / '002.jpg').read_bytes()
+    (inputs / '002.jpg').write_bytes(data[:len(data) // 2])
+    (inputs / '003.jpg').write_bytes(b'\xff\xd8\xff\xe0 not a jpeg')
+    paths = sorted(str(path) for path in inputs.iterdir())
+    (tmp_path / 'output').mkdir()
+
+    written = list(build_pipeline(paths, ['center_crop', 'grayscale'], str(tmp_path / 'output'), size=64))
+
+    assert [os.path.basename(sample.source) for sample in written] == ['001.jpg']
+    assert os.listdir(tmp_path / 'output') == ['001.jpg']
+    output = capsys.readouterr().out
+    assert f"Error reading {paths[1]}" in output and f"Error reading {paths[2]}" in output
+
+def test_failed_captions_are_not_written(tmp_path):
+    inputs = tmp_path / 'input'
+    inputs.mkdir()
+    for name in ('001', '002', '003', '004'):
+        make_jpeg(inputs / f"{name}.jpg", int(name))
+    (tmp_path / 'output').mkdir()
+    paths = sorted(str(path) for path in inputs.iterdir())
+
+    # Every other request fails for good
+    with StubChatCompletions(0.01, server_error_ratio=0.5) as stub:
+        client = CaptionClient('stub-key', stub.url, concurrency=2, max_retries=0)
+        try:
+            written = list(build_pipeline(paths, ['rename', 'caption'], str(tmp_path / 'output'),
+                                          client=client, reference_token='TOK', concurrency=2))
+        finally:
+            client.close()
+
+    assert len(written) == 4
+    captioned = [sample.name for sample in written if sample.caption is not None]
+    assert len(captioned) == 4 - stub.server_errors == 2
+    assert sorted(os.listdir(tmp_path / 'output')) == sorted(
+        [f"{sample.name}.jpg" for sample in written] + [f"{name}.txt" for name in captioned])
+    for name in captioned:
+        assert (tmp_path / 'output' / f"{name}.txt").read_text().startswith('TOK, a photo of a person')
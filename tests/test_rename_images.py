@@ -0,0 +1,31 @@
+import os
+import pytest
+from PIL import Image
+from rename_images import plan_renames, order_renames, rename_images
+
+def make_image(folder, name, image_format):
+    Image.new('RGB', (8, 8), (200, 100, 50)).save(os.path.join(folder, name), image_format)
+
+def test_caption_follows_first_image_of_a_shared_stem(tmp_path):
+    make_image(tmp_path, 'IMG_1.jpg', 'JPEG')
+    make_image(tmp_path, 'IMG_1.png', 'PNG')
+    (tmp_path / 'IMG_1.txt').write_text('caption')
+    moves = plan_renames(str(tmp_path))
+    assert [old for old, _ in moves].count('IMG_1.txt') == 1
+    rename_images(str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == ['001.jpg', '001.txt', '002.png']
+    assert (tmp_path / '001.txt').read_text() == 'caption'
+
+def test_extension_follows_actual_format(tmp_path):
+    make_image(tmp_path, '001.png', 'JPEG')
+    make_image(tmp_path, '002.jpg', 'PNG')
+    (tmp_path / '001.txt').write_text('first')
+    (tmp_path / '002.txt').write_text('second')
+    rename_images(str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == ['001.jpg', '001.txt', '002.png', '002.txt']
+    assert (tmp_path / '001.txt').read_text() == 'first'
+    assert Image.open(tmp_path / '001.jpg').format == 'JPEG'
+
+def test_order_renames_rejects_duplicate_sources():
+    with pytest.raises(AssertionError):
+        order_renames([('a.txt', '001.txt'), ('a.txt', '002.txt')], {'a.txt'})
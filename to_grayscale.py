@@ -1,57 +1,107 @@
 #!/usr/bin/env python3
 
 import os
+import shutil
 import argparse
-from PIL import Image
-from pillow_heif import register_heif_opener
+import tempfile
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from imagekit.io import iter_images, decode_image, sniff_image_format
+from imagekit.profiling import stage, item as profile_item, add_profile_arguments, start_profile
 
-# Register HEIF opener with Pillow
-register_heif_opener()
+def to_grayscale_image(img):
+    """
+    Convert an in-memory image to grayscale.
+    
+    Args:
+        img (PIL.Image.Image): Image to convert
+    """
+    with stage('color'):
+        return img.convert('L')
+
+def save_atomic(img, output_path, format, **save_args):
+    """
+    Save an image via a temporary file in the same folder and rename it into place,
+    so an interrupted run never leaves a truncated file behind.
+    
+    Args:
+        img (PIL.Image.Image): Image to save
+        output_path (str): Final path of the image
+        format (str): Pillow format name, e.g. 'JPEG'
+        **save_args: Extra arguments for Image.save
+    """
+    buffer = BytesIO()
+    with stage('encode'):
+        img.save(buffer, format=format, **save_args)
+    folder, filename = os.path.split(os.path.abspath(output_path))
+    with stage('write'):
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=f".{filename}.", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(buffer.getbuffer())
+            # mkstemp creates the file owner-only: keep the permissions of the file it replaces
+            try:
+                shutil.copymode(output_path, tmp_path)
+            except FileNotFoundError:
+                umask = os.umask(0)
+                os.umask(umask)
+                os.chmod(tmp_path, 0o666 & ~umask)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
 
 def convert_to_grayscale(input_path, output_path):
     """
-    Convert an image to grayscale.
+    Convert an image to grayscale, keeping its format. JPEGs are decoded straight
+    to the luma channel, skipping chroma upsampling and the RGB conversion.
     
     Args:
         input_path (str): Path to the input image
         output_path (str): Path where the grayscale image will be saved
     """
     try:
-        # Open the image
-        with Image.open(input_path) as img:
-            # Convert to grayscale
-            img_gray = img.convert('L')
-            
-            # Save the grayscale image
-            img_gray.save(output_path, quality=95)
-            print(f"Converted: {os.path.basename(input_path)} -> {os.path.basename(output_path)}")
-            
+        # Open the image upright and in grayscale
+        img_gray = decode_image(input_path, 'L')
+        
+        # Save the grayscale image
+        save_atomic(img_gray, output_path, sniff_image_format(input_path), quality=95)
+        print(f"Converted: {os.path.basename(input_path)} -> {os.path.basename(output_path)}")
+        
     except Exception as e:
         print(f"Error processing {input_path}: {str(e)}")
 
+def _convert_job(paths):
+    with profile_item(paths[0]):
+        convert_to_grayscale(*paths)
+
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description='Convert images to grayscale.')
     parser.add_argument('folder', type=str, help='Path to the folder containing images')
+    parser.add_argument('--recursive', action='store_true',
+                        help='Also convert images in subfolders')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Number of worker processes (default: number of CPUs)')
+    add_profile_arguments(parser)
     
     args = parser.parse_args()
+    start_profile(args, 'to_grayscale')
     
     # Check if folder exists
     if not os.path.isdir(args.folder):
         print(f"Error: {args.folder} is not a valid directory")
         return
     
-    # Get list of image files
-    image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.heic', '.heif')
-    image_files = [f for f in os.listdir(args.folder) 
-                  if f.lower().endswith(image_extensions)]
-    image_files.sort()
-    
-    # Process each image
-    for filename in image_files:
-        input_path = os.path.join(args.folder, filename)
-        output_path = os.path.join(args.folder, filename)
-        convert_to_grayscale(input_path, output_path)
+    # Each image is converted in place
+    jobs = [(input_path, input_path) for input_path in iter_images(args.folder, args.recursive)]
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            # Results are ignored; map is consumed to surface worker crashes
+            list(executor.map(_convert_job, jobs, chunksize=8))
+    else:
+        for job in jobs:
+            _convert_job(job)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()